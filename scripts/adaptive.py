@@ -0,0 +1,218 @@
+import bisect
+import logging
+import math
+import threading
+import time
+
+from constants import ALERT_HYSTERESIS, INTERVAL, POLL_TICK, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_HISTORY, \
+    POLL_MOISTURE_STEP, POLL_LIGHT_STEP, BATTERY_LOW, BATTERY_CRITICAL
+from registry import get_registry
+from summary import get_summary_cache
+from utils.daylight import get_sun_table
+from utils.sweep import get_plant_data
+
+
+def poll_interval(history, min_moisture, daylight, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL):
+    """
+    Function for choosing the time until the next read of a sensor. The interval is the time the recent readings need
+    for a change of `POLL_MOISTURE_STEP` (moisture) or `POLL_LIGHT_STEP` (log of light, daylight only), i.e. sensors
+    of stable plants are read rarely while watering or changing light are picked up quickly. A drying plant is read at
+    least twice before it is expected to cross its threshold (i.e. the thirsty alert is not delayed), a low battery
+    stretches the interval.
+
+    Args:
+        history (list): recent measurements of the sensor (oldest first, requires 'ts', 'moisture', 'light' and
+            'battery')
+        min_moisture (float): moisture threshold of the plant [%]
+        daylight (bool): whether the sun is up (light changes are ignored at night)
+        min_interval (float): lower bound [min]
+        max_interval (float): upper bound [min]
+
+    Returns:
+        interval (float): minutes until the next read
+
+    """
+    if len(history) < 2:
+        return min_interval
+    minutes = (history[-1]['ts'] - history[0]['ts']) / 60
+    if minutes <= 0:
+        return min_interval
+
+    # change rates (total variation per minute, i.e. noise + watering count as change)
+    moisture = sum(abs(b['moisture'] - a['moisture']) for a, b in zip(history, history[1:])) / minutes
+    interval = POLL_MOISTURE_STEP / moisture if moisture > 0 else max_interval
+    if daylight:
+        light = sum(abs(math.log1p(b['light']) - math.log1p(a['light'])) for a, b in zip(history, history[1:]))
+        if light > 0:
+            interval = min(interval, POLL_LIGHT_STEP / (light / minutes))
+
+    # at least two reads before the (linearly) expected threshold crossing
+    margin = history[-1]['moisture'] - min_moisture
+    drying = (history[0]['moisture'] - history[-1]['moisture']) / minutes
+    if margin <= 0:
+        interval = min_interval
+    elif drying > 0:
+        interval = min(interval, margin / drying / 2)
+
+    # save battery (after the alert bound, a nearly empty sensor cannot keep up anyway)
+    battery = history[-1].get('battery')
+    if battery is not None and battery <= BATTERY_CRITICAL:
+        interval *= 4
+    elif battery is not None and battery <= BATTERY_LOW:
+        interval *= 2
+
+    return min(max_interval, max(min_interval, interval))
+
+
+def fixed_interval(history, min_moisture, daylight):
+    """
+    Function for the fixed schedule (every INTERVAL minutes during the day, hourly at night), same signature as
+    `poll_interval` (i.e. for comparing both in a simulation).
+
+    """
+    return INTERVAL if daylight else 60
+
+
+def simulate(readings, min_moisture, daylight, policy=poll_interval, tick=POLL_TICK, history=POLL_HISTORY):
+    """
+    Function for replaying a recorded (or synthetic) series of one sensor through a polling policy. The series is the
+    ground truth: a read at time t returns the latest reading at or before t, reads happen on the scheduler tick.
+
+    Args:
+        readings (list): measurements of the sensor (oldest first, see `poll_interval`)
+        min_moisture (float): moisture threshold of the plant [%]
+        daylight (func): callable returning whether the sun is up for an epoch timestamp
+        policy (func): `poll_interval` or `fixed_interval`
+        tick (int): scheduler tick [min]
+        history (int): time span of the readings passed to the policy [s]
+
+    Returns:
+        polls (int): number of sensor reads
+        latencies (list): delay between every (true) threshold crossing and the first read seeing it [s] (None if
+            missed)
+
+    """
+    if not readings:
+        return 0, []
+    ts = [r['ts'] for r in readings]
+    step = tick * 60
+
+    polled, times = [], []
+    t = ts[0]
+    while t <= ts[-1]:
+        data = readings[bisect.bisect_right(ts, t) - 1]
+        polled.append(data)
+        times.append(t)
+        recent = polled[bisect.bisect_left(times, t - history):]
+        t += max(1, math.ceil(policy(recent, min_moisture, daylight(t)) * 60 / step)) * step
+
+    # first read below the threshold after every crossing of the true series (None if the plant was watered before),
+    # like the alert states a plant only counts as watered again ALERT_HYSTERESIS above the threshold
+    latencies = []
+    ii = 1
+    while ii < len(readings):
+        if readings[ii]['moisture'] < min_moisture <= readings[ii - 1]['moisture']:
+            kk = ii + 1
+            while kk < len(readings) and readings[kk]['moisture'] < min_moisture + ALERT_HYSTERESIS:
+                kk += 1
+            end = ts[kk] if kk < len(readings) else float('inf')
+            jj = bisect.bisect_left(times, ts[ii])
+            while jj < len(times) and times[jj] < end and polled[jj]['moisture'] >= min_moisture:
+                jj += 1
+            latencies.append(times[jj] - ts[ii] if jj < len(times) and times[jj] < end else None)
+            ii = kk
+        ii += 1
+    return len(polled), latencies
+
+
+class AdaptivePoller(object):
+    """
+    Per-sensor polling schedule. The job runs every `POLL_TICK` minutes and only reads the sensors which are due; after
+    a read the next one is planned via `poll_interval` from the sensor's recent readings (summary cache of this
+    process). New or failed sensors are due on every tick.
+
+    Args:
+        policy (func): interval policy (see `poll_interval`)
+
+    """
+
+    def __init__(self, policy=poll_interval):
+        self.policy = policy
+        self.stats = {'ticks': 0, 'polls': 0}
+        self._due = {}
+        self._lock = threading.Lock()
+        self._running = threading.Lock()
+
+    def due(self, now=None):
+        """
+        Names of the registered plants due for a read.
+
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            return [p.name for p in get_registry().plants() if self._due.get(p.name, 0) <= now]
+
+    def tick(self, now=None):
+        """
+        Read the sensors which are due and plan their next read.
+
+        Returns:
+            intervals (dict): plant name -> minutes until its next read (read sensors only)
+
+        """
+        # skip a tick overlapping the previous one (e.g. the first run + the first cron tick)
+        if not self._running.acquire(blocking=False):
+            return {}
+        try:
+            return self._tick(time.time() if now is None else now)
+        finally:
+            self._running.release()
+
+    def _tick(self, now):
+        """
+        Read the due sensors (see `tick`).
+
+        """
+        self.stats['ticks'] += 1
+        due = set(self.due(now))
+        plants = [p for p in get_registry().plants() if p.name in due]
+        if not plants:
+            return {}
+
+        cache = get_summary_cache()
+        cache.warm()
+        readings = get_plant_data(plants)
+        self.stats['polls'] += len(plants)
+
+        daylight = get_sun_table().daylight(now)
+        intervals = {}
+        with self._lock:
+            for p in plants:
+                if p.name in readings:
+                    intervals[p.name] = self.policy(cache.history(p.name, POLL_HISTORY), p.min_moisture, daylight)
+                    # half a tick early (i.e. a job starting a few seconds late does not skip a tick)
+                    self._due[p.name] = now + (intervals[p.name] - POLL_TICK / 2) * 60
+                else:
+                    self._due.pop(p.name, None)
+        logging.info('[AdaptivePoller] -> Read {}/{} sensors, next reads in {}'.format(
+            len(readings), len(plants), ', '.join('{}: {:.0f}min'.format(n, i) for n, i in sorted(intervals.items()))))
+        return intervals
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_poller():
+    """
+    Function for getting the shared adaptive poller of this process.
+
+    Returns:
+        poller (obj): shared `AdaptivePoller` instance
+
+    """
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = AdaptivePoller()
+        return _poller
@@ -0,0 +1,118 @@
+import time
+
+from constants import ALERT_HYSTERESIS, ALERT_COOLDOWN, ALERT_LEAD
+from db import get_db
+
+# alert states per plant
+HEALTHY = 'healthy'
+DRYING = 'drying'
+THIRSTY = 'thirsty'
+WATERED = 'watered'
+
+
+def next_state(state, moisture, min_moisture, soon=False, hysteresis=ALERT_HYSTERESIS):
+    """
+    Function for the alert state transition of a plant. A plant becomes thirsty below `min_moisture`, but only counts
+    as watered once it is back above `min_moisture + hysteresis` (i.e. readings hovering around the threshold do not
+    flip the state back and forth). A watered plant turns healthy (or thirsty again) on its next reading. A plant
+    predicted to cross `min_moisture` soon (see `analytics.py`) is drying.
+
+    Args:
+        state (str): current state (HEALTHY, DRYING, THIRSTY or WATERED)
+        moisture (float): latest moisture reading [%]
+        min_moisture (float): moisture threshold of the plant [%]
+        soon (bool): whether the plant is predicted to cross `min_moisture` within ALERT_LEAD
+        hysteresis (float): margin above the threshold required to leave THIRSTY [%]
+
+    Returns:
+        state (str): new state
+
+    """
+    if state == THIRSTY:
+        return WATERED if moisture >= min_moisture + hysteresis else THIRSTY
+    if moisture < min_moisture:
+        return THIRSTY
+    return DRYING if soon else HEALTHY
+
+
+class AlertStates(object):
+    """
+    Persistent (sqlite) alert state of every plant. Decides whether a new reading is worth a message: entering
+    DRYING (heads-up ahead of the predicted crossing), entering THIRSTY (repeated every `cooldown` seconds while the
+    plant stays thirsty) and entering WATERED.
+
+    Args:
+        cooldown (int): minimum time between two thirsty messages of a plant [s]
+
+    """
+
+    def __init__(self, cooldown=ALERT_COOLDOWN, lead=ALERT_LEAD):
+        self.cooldown = cooldown
+        self.lead = lead
+        self._states = None
+
+    def _load(self):
+        if self._states is None:
+            rows = get_db().query("SELECT plant, state, since, notified FROM alert_state")
+            self._states = {row[0]: {'state': row[1], 'since': row[2], 'notified': row[3]} for row in rows}
+        return self._states
+
+    def _save(self, plant_name):
+        rec = self._states[plant_name]
+        with get_db().transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO alert_state (plant, state, since, notified) VALUES (?, ?, ?, ?)",
+                         (plant_name, rec['state'], rec['since'], rec['notified']))
+
+    def get(self, plant_name):
+        """
+        Current state of a plant (HEALTHY if unknown).
+
+        """
+        return self._load().get(plant_name, {'state': HEALTHY})['state']
+
+    def update(self, plant_name, moisture, min_moisture, now=None, due=None):
+        """
+        Feed the latest reading of a plant into its state machine.
+
+        Args:
+            plant_name (str): name of plant
+            moisture (float): latest moisture reading [%]
+            min_moisture (float): moisture threshold of the plant [%]
+            now (int): epoch timestamp (defaults to now)
+            due (int): predicted epoch timestamp of crossing `min_moisture` (None if unknown)
+
+        Returns:
+            notify (str): DRYING, THIRSTY or WATERED if a message should go out, None otherwise
+
+        """
+        now = int(time.time()) if now is None else int(now)
+        states = self._load()
+        rec = states.get(plant_name, {'state': HEALTHY, 'since': now, 'notified': None})
+
+        soon = due is not None and due - now <= self.lead
+        state = next_state(rec['state'], moisture, min_moisture, soon=soon)
+        changed = state != rec['state']
+        if changed or plant_name not in states:
+            # entering THIRSTY starts a new episode (i.e. notify right away)
+            states[plant_name] = {'state': state, 'since': now,
+                                  'notified': None if state == THIRSTY else rec['notified']}
+            self._save(plant_name)
+
+        rec = states[plant_name]
+        cooled_down = rec['notified'] is None or now - rec['notified'] >= self.cooldown
+        if state == THIRSTY and cooled_down:
+            return THIRSTY
+        if state == DRYING and changed and cooled_down:
+            # predictions hovering around the lead time do not repeat the heads-up within the cooldown
+            return DRYING
+        if state == WATERED and changed:
+            return WATERED
+        return None
+
+    def notified(self, plant_name, now=None):
+        """
+        Record that a message for the current state of a plant went out (starts the cooldown).
+
+        """
+        self._load()[plant_name]['notified'] = int(time.time()) if now is None else int(now)
+        self._save(plant_name)
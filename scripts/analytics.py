@@ -0,0 +1,192 @@
+import itertools
+import threading
+import time
+
+import numpy as np
+
+from constants import ANALYTICS_MIN_POINTS, ANALYTICS_WINDOW, WATERING_STEP
+from db import get_db
+
+DAY = 24 * 60 * 60
+
+SELECT_MOISTURE_SINCE = """
+    SELECT p.name, m.ts, m.moisture
+    FROM plants p CROSS JOIN measurements m ON m.plant_id = p.id
+    WHERE m.ts > ?
+    ORDER BY p.id, m.ts"""
+
+
+def load_series(start):
+    """
+    Function for loading the moisture series of every plant newer than a timestamp (single query).
+
+    Args:
+        start (int): epoch timestamp (exclusive)
+
+    Returns:
+        series (dict): plant name -> (ts, moisture) numpy arrays (oldest first)
+
+    """
+    rows = get_db().query(SELECT_MOISTURE_SINCE, (int(start),))
+    series = {}
+    for name, group in itertools.groupby(rows, key=lambda row: row[0]):
+        values = np.array([row[1:] for row in group], dtype=np.float64)
+        series[name] = (values[:, 0], values[:, 1])
+    return series
+
+
+def _ranges(starts, ends):
+    """
+    Utility for concatenating the (non-empty) index ranges [start, end) of every plant.
+
+    Returns:
+        idx (array): concatenated indices
+        group (array): plant index of every entry
+        offsets (array): position of every range within `idx`
+
+    """
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    group = np.repeat(np.arange(len(starts)), lengths)
+    return np.arange(lengths.sum()) - offsets[group] + starts[group], group, offsets
+
+
+def predict(series, min_moisture, now=None, step=WATERING_STEP, min_points=ANALYTICS_MIN_POINTS):
+    """
+    Function for estimating the drying rate of every plant and predicting when it crosses its moisture threshold. All
+    plants are processed in one batch: the series are concatenated and every per-plant reduction is a `bincount` over
+    the plant index (i.e. no Python loop over readings).
+
+    Watering events are step increases of at least `step` between consecutive readings. The drying rate is a linear
+    least squares fit over the current drying phase, i.e. from the moisture peak after the last watering onwards.
+
+    Args:
+        series (dict): plant name -> (ts, moisture) arrays (oldest first, see `load_series`)
+        min_moisture (dict): plant name -> moisture threshold [%]
+        now (int): epoch timestamp the prediction refers to (defaults to now)
+        step (float): minimum moisture increase between two readings counting as watering [%]
+        min_points (int): minimum number of readings in the drying phase for a fit
+
+    Returns:
+        out (dict): plant name -> dictionary with the fitted `moisture` at `now` [%], the drying `rate` [%/day], `due`
+            (epoch timestamp of crossing `min_moisture`, None if not drying or not enough readings), `last_watered`
+            (epoch timestamp, None if no watering in the series) and the number of `waterings`
+
+    """
+    now = int(time.time()) if now is None else int(now)
+    names = [name for name in series if name in min_moisture and len(series[name][0])]
+    if not names:
+        return {}
+
+    k = len(names)
+    lengths = np.array([len(series[name][0]) for name in names])
+    offsets = np.cumsum(lengths) - lengths
+    ends = offsets + lengths
+    ts = np.asarray(np.concatenate([series[name][0] for name in names]), dtype=np.float64)
+    y = np.asarray(np.concatenate([series[name][1] for name in names]), dtype=np.float64)
+
+    # watering events (index of the first reading after watering, steps across two plants do not count)
+    events = np.flatnonzero(np.diff(y) >= step) + 1
+    events = events[~np.isin(events, offsets)]
+    event_group = np.searchsorted(offsets, events, side='right') - 1
+    waterings = np.bincount(event_group, minlength=k)
+    start = offsets.copy()
+    np.maximum.at(start, event_group, events)
+    last_watered = np.where(waterings > 0, ts[start], np.nan)
+
+    # drying phase = from the first moisture peak of the last segment onwards (soil keeps soaking up after watering),
+    # only these readings are touched from here on
+    idx, group, seg_offsets = _ranges(start, ends)
+    peak = np.maximum.reduceat(y[idx], seg_offsets)
+    at_peak = np.flatnonzero(y[idx] == peak[group])
+    first_peak = ends.copy()
+    np.minimum.at(first_peak, group[at_peak], idx[at_peak])
+    idx, g, _ = _ranges(first_peak, ends)
+
+    # least squares y = a + b * x per plant, x in days relative to now (i.e. a is the fitted moisture at now)
+    x = (ts[idx] - now) / DAY
+    yd = y[idx]
+    n = np.bincount(g, minlength=k).astype(np.float64)
+    sx = np.bincount(g, weights=x, minlength=k)
+    sy = np.bincount(g, weights=yd, minlength=k)
+    sxx = np.bincount(g, weights=x * x, minlength=k)
+    sxy = np.bincount(g, weights=x * yd, minlength=k)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = n * sxx - sx * sx
+        rate = np.where((n >= min_points) & (denom > 0), (n * sxy - sx * sy) / denom, np.nan)
+        fitted = (sy - rate * sx) / n
+        threshold = np.array([min_moisture[name] for name in names], dtype=np.float64)
+        due = np.where(rate < 0, now + (threshold - fitted) / rate * DAY, np.nan)
+        due = np.where(fitted <= threshold, float(now), due)
+
+    out = {}
+    for ii, name in enumerate(names):
+        out[name] = {'moisture': None if np.isnan(fitted[ii]) else float(fitted[ii]),
+                     'rate': None if np.isnan(rate[ii]) else float(rate[ii]),
+                     'due': None if np.isnan(rate[ii]) or np.isnan(due[ii]) else int(due[ii]),
+                     'last_watered': None if np.isnan(last_watered[ii]) else int(last_watered[ii]),
+                     'waterings': int(waterings[ii])}
+    return out
+
+
+class Predictor(object):
+    """
+    Cached watering predictions of all plants. Predictions are recomputed (one query + one batch fit) only once a plant
+    has a new reading, i.e. repeated alert/display jobs between two sensor sweeps cost nothing.
+
+    Args:
+        window (int): time span of the loaded moisture series [s]
+
+    """
+
+    def __init__(self, window=ANALYTICS_WINDOW):
+        self.window = window
+        self.stats = {'hits': 0, 'misses': 0}
+        self._key = None
+        self._predictions = {}
+        self._lock = threading.Lock()
+
+    def predict(self, plants, latest, now=None):
+        """
+        Predictions for the registered plants.
+
+        Args:
+            plants (list): plant definitions (with `name` and `min_moisture`)
+            latest (dict): plant name -> list of latest measurements (newest first, see `latest_data_all`)
+            now (int): epoch timestamp (defaults to now)
+
+        Returns:
+            out (dict): plant name -> prediction (see `predict`)
+
+        """
+        key = tuple(sorted((p.name, p.min_moisture, latest[p.name][0]['ts'])
+                           for p in plants if latest.get(p.name)))
+        with self._lock:
+            if key != self._key:
+                self.stats['misses'] += 1
+                now = int(time.time()) if now is None else int(now)
+                self._predictions = predict(load_series(now - self.window), {p.name: p.min_moisture
+                                                                             for p in plants}, now=now)
+                self._key = key
+            else:
+                self.stats['hits'] += 1
+            return self._predictions
+
+
+_predictor = None
+_predictor_lock = threading.Lock()
+
+
+def get_predictor():
+    """
+    Function for getting the shared predictor of this process.
+
+    Returns:
+        predictor (obj): shared `Predictor` instance
+
+    """
+    global _predictor
+    with _predictor_lock:
+        if _predictor is None:
+            _predictor = Predictor()
+        return _predictor
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import threading
+
+from PIL import Image
+
+from constants import ASSET_CACHE_PATH
+
+# inkyWHAT palette (white, black, red)
+INKY_PALETTE = (255, 255, 255, 0, 0, 0, 255, 0, 0)
+
+
+def _palette_image(palette):
+    """
+    Utility for building the "P" image used to quantize assets onto a palette.
+
+    """
+    pal_img = Image.new("P", (1, 1))
+    pal_img.putpalette(palette + (0, 0, 0) * (256 - len(palette) // 3))
+    return pal_img
+
+
+def snap_size(size, lo, hi, steps):
+    """
+    Utility for snapping a continuous size onto `steps` evenly spaced sizes between `lo` and `hi` (i.e. a small set of
+    sizes which can be cached).
+
+    Args:
+        size (int): requested size [px]
+        lo (int): smallest size [px]
+        hi (int): largest size [px]
+        steps (int): number of allowed sizes
+
+    Returns:
+        size (int): nearest allowed size [px]
+
+    """
+    if hi <= lo or steps < 2:
+        return hi
+    size = min(max(size, lo), hi)
+    step = (hi - lo) / (steps - 1)
+    return int(round(lo + round((size - lo) / step) * step))
+
+
+class AssetCache(object):
+    """
+    Cache of resized + quantized images keyed by (path, target height, palette). Images are kept in memory for the
+    lifetime of the process (i.e. across scheduled runs) and, optionally, persisted as PNG files so that a restarted
+    process does not need to resize them again.
+
+    Args:
+        persist_path (str): directory for persisting rendered assets (None for memory only)
+
+    """
+
+    def __init__(self, persist_path=None):
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        self._images = {}
+        self._palettes = {}
+        self._lock = threading.Lock()
+
+    def _disk_path(self, path, dy, palette):
+        """
+        Location of a persisted asset (including the source mtime, i.e. changed assets are rendered again).
+
+        """
+        key = '{}:{}:{}:{}'.format(os.path.abspath(path), os.path.getmtime(path), dy, palette)
+        return os.path.join(self.persist_path, hashlib.sha1(key.encode()).hexdigest() + '.png')
+
+    def _render(self, path, dy, palette):
+        """
+        Resize (keeping the aspect ratio) and quantize an image onto the palette.
+
+        """
+        im = Image.open(path)
+        ratio = im.size[0] / im.size[1]
+        im = im.resize((int(ratio * dy), dy), resample=Image.LANCZOS)
+
+        if palette not in self._palettes:
+            self._palettes[palette] = _palette_image(palette)
+        return im.convert("RGB").quantize(palette=self._palettes[palette])
+
+    def get(self, path, dy, palette=INKY_PALETTE):
+        """
+        Get an image resized to a height of `dy` and quantized onto `palette`.
+
+        Args:
+            path (str): path of the source image
+            dy (int): target height [px]
+            palette (tuple): flat RGB palette
+
+        Returns:
+            im (obj): PIL image ("P" mode)
+
+        """
+        key = (path, dy, palette)
+        with self._lock:
+            if key in self._images:
+                self.hits += 1
+                return self._images[key]
+            self.misses += 1
+
+            disk_path = self._disk_path(path, dy, palette) if self.persist_path is not None else None
+            if disk_path is not None and os.path.exists(disk_path):
+                im = Image.open(disk_path)
+                im.load()
+            else:
+                im = self._render(path, dy, palette)
+                if disk_path is not None:
+                    try:
+                        os.makedirs(self.persist_path, exist_ok=True)
+                        im.save(disk_path)
+                    except OSError:
+                        logging.exception('[AssetCache] -> Unable to persist {}'.format(disk_path))
+
+            self._images[key] = im
+            return im
+
+
+_cache = AssetCache(persist_path=ASSET_CACHE_PATH)
+
+
+def load_image(path, dy, palette=INKY_PALETTE):
+    """
+    Function for loading an image (resized to a height of `dy`) from the shared asset cache.
+
+    """
+    return _cache.get(path, dy, palette)
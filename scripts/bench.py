@@ -0,0 +1,887 @@
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from constants import COMPONENTS, POLL_WORKERS, POLL_TIMEOUT, DB_PATH, PLANT_ICON_PATH, SLACK_CONCURRENCY, \
+    LISTEN_WORKERS, EXPORT_CHUNK
+
+# import time budget per script entry point [ms] (see `bench_imports`, scaled via --scale for slower machines)
+IMPORT_BUDGETS = {
+    'plantbot': 250,
+    'slackbot_alert': 350,
+    'slackbot_listen': 400,
+    'inky_alert': 300,
+    'migrate_db': 60,
+}
+
+
+def _percentile(values, pct):
+    """
+    Utility for a nearest-rank percentile of a list of values.
+
+    """
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def bench_sweep(args):
+    """
+    Benchmark for a full sensor sweep against the fake backend (i.e. no Bluetooth hardware needed).
+
+    """
+    from polling import FakeReader, poll_sensors
+    from registry import Plant
+
+    plants = [Plant('plant_{}'.format(ii), 'FA:CE:00:00:00:{:02X}'.format(ii), 20) for ii in range(args.plants)]
+    reader = FakeReader(latency=(args.min_latency, args.max_latency), failure_rate=args.failure_rate,
+                        hang=[p.mac_address for p in plants[:args.hang]], seed=args.seed)
+
+    start = time.monotonic()
+    readings, timings, _ = poll_sensors(plants, reader=reader, workers=args.workers, timeout=args.timeout,
+                                        processes=not args.threads)
+    total = time.monotonic() - start
+
+    durations = [t for t in timings.values() if t is not None]
+    print('sensors     : {} ({} ok, {} failed)'.format(len(plants), len(readings), len(plants) - len(readings)))
+    print('sweep       : {:.2f}s'.format(total))
+    print('throughput  : {:.2f} sensors/s'.format(len(readings) / total))
+    print('latency p50 : {:.2f}s'.format(_percentile(durations, 50)))
+    print('latency p95 : {:.2f}s'.format(_percentile(durations, 95)))
+    print('latency max : {:.2f}s'.format(max(durations) if durations else float('nan')))
+
+
+def bench_ble(args):
+    """
+    Benchmark for the BLE connections per sweep against a simulated Mi Flora backend: miflora's MiFloraPoller (a new
+    poller per read, as before) vs. `MiFloraReader` (single connection per read, cached battery + firmware).
+
+    """
+    from polling import FakeBackend, MiFloraReader, Reading, poll_sensors
+    from registry import Plant
+
+    def poller_read(mac_address):
+        from miflora.miflora_poller import MiFloraPoller, MI_CONDUCTIVITY, MI_MOISTURE, MI_LIGHT, MI_TEMPERATURE, \
+            MI_BATTERY
+
+        poller = MiFloraPoller(mac_address, FakeBackend)
+        return Reading(poller.parameter_value(MI_TEMPERATURE), poller.parameter_value(MI_MOISTURE),
+                       poller.parameter_value(MI_LIGHT), poller.parameter_value(MI_CONDUCTIVITY),
+                       poller.parameter_value(MI_BATTERY))
+
+    FakeBackend.latency = args.latency
+    plants = [Plant('plant_{}'.format(ii), 'FA:CE:00:00:00:{:02X}'.format(ii), 20) for ii in range(args.plants)]
+    print('sensors     : {}, {} sweeps, {:.0f}ms per connection'.format(args.plants, args.sweeps, args.latency * 1000))
+    print('{:<14} {:>12} {:>12} {:>12} {:>12}'.format('reader', 'conn/sweep', 'reads/sweep', 'writes/sweep',
+                                                      'sweep [s]'))
+    for label, reader in [('MiFloraPoller', poller_read), ('MiFloraReader', MiFloraReader(backend=FakeBackend))]:
+        FakeBackend.reset()
+        start = time.monotonic()
+        for _ in range(args.sweeps):
+            poll_sensors(plants, reader=reader, processes=False)
+        total = time.monotonic() - start
+        print('{:<14} {:>12.1f} {:>12.1f} {:>12.1f} {:>12.2f}'.format(
+            label, FakeBackend.connections / args.sweeps, FakeBackend.reads / args.sweeps,
+            FakeBackend.writes / args.sweeps, total / args.sweeps))
+
+
+def bench_health(args):
+    """
+    Benchmark for a day of sensor sweeps (simulated clock, fake backend) with dead, hanging and malformed sensors: time
+    spent per sweep and reads wasted on failing sensors with vs. without the backoff + circuit breaker.
+
+    """
+    from db import close_db
+    from health import SensorHealth
+    from polling import FakeReader, poll_sensors
+    from registry import Plant
+
+    close_db()
+    os.chdir(tempfile.mkdtemp(prefix='plantbot_bench_'))
+    os.makedirs(os.path.dirname(DB_PATH))
+
+    plants = [Plant('plant_{}'.format(ii), 'FA:CE:00:00:00:{:02X}'.format(ii), 20) for ii in range(args.plants)]
+    macs = [p.mac_address for p in plants]
+    reader = FakeReader(latency=(args.min_latency, args.max_latency), dead=macs[:args.dead],
+                        hang=macs[args.dead:args.dead + args.hang],
+                        malformed=macs[args.dead + args.hang:args.dead + args.hang + args.malformed], seed=args.seed)
+    failing = set(p.name for p in plants[:args.dead + args.hang + args.malformed])
+
+    print('sensors     : {} ({} dead, {} hanging, {} malformed), {} sweeps every {} min'.format(
+        args.plants, args.dead, args.hang, args.malformed, args.sweeps, args.interval))
+    print('{:<8} {:>10} {:>10} {:>10} {:>14}'.format('health', 'total [s]', 'p50 [s]', 'max [s]', 'failing reads'))
+    for label, health in [('off', None), ('on', SensorHealth())]:
+        now, durations, wasted = int(time.time()), [], 0
+        for _ in range(args.sweeps):
+            todo = [p for p in plants if health is None or health.allow(p.name, now=now)]
+            start = time.monotonic()
+            readings, _, errors = poll_sensors(todo, reader=reader, workers=args.workers, timeout=args.timeout,
+                                               processes=False)
+            durations.append(time.monotonic() - start)
+            wasted += sum(p.name in failing for p in todo)
+            if health is not None:
+                for p in todo:
+                    if p.name in readings:
+                        health.success(p.name, now=now)
+                    else:
+                        health.failure(p.name, errors.get(p.name), now=now)
+            now += args.interval * 60
+        print('{:<8} {:>10.1f} {:>10.2f} {:>10.2f} {:>14}'.format(label, sum(durations), _percentile(durations, 50),
+                                                                  max(durations), wasted))
+
+
+def _synthetic_db(plants, rows, seed=None):
+    """
+    Utility for filling a fresh DB (in a temporary working directory) with synthetic measurements.
+
+    Returns:
+        names (list): plant names
+
+    """
+    from db import FIELDS, close_db, connect, plant_id
+
+    rnd = random.Random(seed)
+    close_db()
+    os.chdir(tempfile.mkdtemp(prefix='plantbot_bench_'))
+    os.makedirs(os.path.dirname(DB_PATH))
+
+    names = ['plant_{}'.format(ii) for ii in range(plants)]
+    now = int(time.time())
+    conn = connect()
+    with conn:
+        for name in names:
+            pid = plant_id(conn, name)
+            conn.executemany("INSERT INTO measurements (plant_id, ts, {}) VALUES (?, ?, ?, ?, ?, ?, ?)".format(
+                ", ".join(FIELDS)), [(pid, now - 600 * ii) + tuple(rnd.randint(0, 100) for _ in FIELDS)
+                                     for ii in range(rows)])
+    conn.close()
+    return names
+
+
+def bench_latest(args):
+    """
+    Benchmark for one display/alert refresh: per-plant `latest_data` calls vs. a single `latest_data_all` call.
+
+    """
+    from db import latest_data, latest_data_all
+
+    print('{:>6} {:>14} {:>14}'.format('plants', 'per-plant [ms]', 'batched [ms]'))
+    for n in args.plants:
+        names = _synthetic_db(n, args.rows, seed=args.seed)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for name in names:
+                latest_data(name, num=args.num)
+        single = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            latest_data_all(names, num=args.num)
+        batched = (time.perf_counter() - start) / args.repeat
+
+        print('{:>6} {:>14.2f} {:>14.2f}'.format(n, single * 1000, batched * 1000))
+
+
+def bench_history(args):
+    """
+    Benchmark for long-horizon history queries: all raw rows of the window (`range_data`) vs. the resolution picked
+    by `history_data` for a point budget.
+
+    """
+    from db import get_db, history_data, range_data, rebuild_rollups
+
+    name = _synthetic_db(1, args.days * 24 * 6, seed=args.seed)[0]
+    with get_db().transaction() as conn:
+        rebuild_rollups(conn)
+
+    print('{:>6} {:>10} {:>10} {:>8} {:>10} {:>10}'.format('days', 'raw rows', 'raw [ms]', 'res', 'points',
+                                                           'picked [ms]'))
+    for days in args.windows:
+        start = int(time.time()) - days * 24 * 60 * 60
+
+        t = time.perf_counter()
+        for _ in range(args.repeat):
+            raw = range_data(name, start)
+        raw_time = (time.perf_counter() - t) / args.repeat
+
+        t = time.perf_counter()
+        for _ in range(args.repeat):
+            resolution, out = history_data(name, start, points=args.points)
+        picked_time = (time.perf_counter() - t) / args.repeat
+
+        print('{:>6} {:>10} {:>10.2f} {:>8} {:>10} {:>10.2f}'.format(days, len(raw), raw_time * 1000, resolution,
+                                                                     len(out), picked_time * 1000))
+
+
+def bench_export(args):
+    """
+    Benchmark for exporting the full raw history of a synthetic DB as CSV: streamed in chunks (`export.export`) vs.
+    materialized per plant (`db.range_data`). Reports the time and the peak of the Python heap (tracemalloc), i.e.
+    the streamed export should stay flat with a growing history.
+
+    """
+    import csv
+    import tracemalloc
+
+    from db import FIELDS, range_data
+    from export import export
+
+    def materialized(path, names):
+        with open(path, 'w', newline='') as dst:
+            writer = csv.writer(dst)
+            writer.writerow(['plant', 'ts'] + FIELDS)
+            data = {name: range_data(name, 0) for name in names}
+            for name, rows in data.items():
+                writer.writerows([name, r['ts']] + [r[f] for f in FIELDS] for r in rows)
+
+    print('{:>10} {:>22} {:>22}'.format('readings', 'streamed [s / MB]', 'materialized [s / MB]'))
+    for rows in args.rows:
+        names = _synthetic_db(args.plants, rows // args.plants, seed=args.seed)
+        out = []
+        for func in [lambda: export(os.devnull, fmt='csv', chunk=args.chunk), lambda: materialized(os.devnull, names)]:
+            tracemalloc.start()
+            start = time.monotonic()
+            func()
+            total = time.monotonic() - start
+            out.append((total, tracemalloc.get_traced_memory()[1] / 2 ** 20))
+            tracemalloc.stop()
+        print('{:>10} {:>22} {:>22}'.format(rows, '{:.2f} / {:.1f}'.format(*out[0]), '{:.2f} / {:.1f}'.format(*out[1])))
+
+
+def _synthetic_moisture(plants, years, seed=None):
+    """
+    Utility for synthetic moisture series (every 10 min): linear drying at a random rate per plant with noise, watered
+    back up whenever a plant drops below 15 %.
+
+    Returns:
+        series (dict): plant name -> (ts, moisture) numpy arrays
+        rates (dict): plant name -> true drying rate [%/day]
+
+    """
+    import numpy as np
+
+    rnd = np.random.RandomState(seed)
+    now = int(time.time())
+    n = years * 365 * 24 * 6
+    ts = (now - 600 * np.arange(n)[::-1]).astype(np.float64)
+
+    series, rates = {}, {}
+    for ii in range(plants):
+        name = 'plant_{}'.format(ii)
+        rate = rnd.uniform(2, 10)
+        period = int(45 / rate * 24 * 6)  # from 60 % down to 15 %
+        phase = (np.arange(n) + rnd.randint(period)) % period
+        series[name] = (ts, 60 - phase * rate / (24 * 6) + rnd.normal(0, 0.5, n))
+        rates[name] = rate
+    return series, rates
+
+
+def bench_analytics(args):
+    """
+    Benchmark for the watering prediction on a synthetic multi-year dataset: one batch fit of all plants vs. fitting
+    plant by plant, plus the error of the estimated drying rates.
+
+    """
+    from analytics import predict
+
+    series, rates = _synthetic_moisture(args.plants, args.years, seed=args.seed)
+    thresholds = {name: 15 for name in series}
+    now = int(max(s[0][-1] for s in series.values()))
+    print('readings    : {} ({} plants x {} years)'.format(sum(len(s[0]) for s in series.values()), args.plants,
+                                                           args.years))
+
+    for label, start in [('full', 0), ('{}d'.format(args.window), now - args.window * 24 * 60 * 60)]:
+        windowed = {name: (ts[ts > start], moisture[ts > start]) for name, (ts, moisture) in series.items()}
+
+        t = time.perf_counter()
+        for _ in range(args.repeat):
+            out = predict(windowed, thresholds, now=now)
+        batch = (time.perf_counter() - t) / args.repeat
+
+        t = time.perf_counter()
+        for _ in range(args.repeat):
+            for name in windowed:
+                predict({name: windowed[name]}, thresholds, now=now)
+        single = (time.perf_counter() - t) / args.repeat
+
+        errors = [abs(-out[name]['rate'] - rates[name]) / rates[name] for name in out if out[name]['rate'] is not None]
+        waterings = sum(o['waterings'] for o in out.values()) / len(out)
+        print('{:<5} batch {:.1f}ms, per plant {:.1f}ms, {:.1f} waterings/plant, rate error {:.1%} p50 / {:.1%} p95 '
+              '({} fits)'.format(label, batch * 1000, single * 1000, waterings, _percentile(errors, 50),
+                                 _percentile(errors, 95), len(errors)))
+
+
+def _synthetic_readings(plants, days, seed=None, noise=0.1):
+    """
+    Utility for a synthetic ground truth (every minute): moisture drying at a random rate per plant (watered back up a
+    few hours after crossing 20 %) plus Gaussian noise, light following the sun (7-19h) with passing clouds, slowly
+    draining batteries.
+
+    Returns:
+        series (dict): plant name -> list of dictionaries containing plant measurements (oldest first)
+
+    """
+    import math
+
+    rnd = random.Random(seed)
+    start = int(time.time()) // 86400 * 86400 - days * 86400
+    series = {}
+    for ii in range(plants):
+        rate = rnd.uniform(2, 10) / 1440
+        peak = rnd.uniform(1000, 20000)
+        battery = rnd.uniform(15, 100)
+        moisture, watering, cloud = rnd.uniform(30, 60), None, 1.0
+        readings = []
+        for minute in range(days * 1440):
+            ts = start + minute * 60
+            moisture -= rate
+            if watering is None and moisture < 20:
+                watering = ts + rnd.randint(1, 12) * 3600
+            elif watering is not None and ts >= watering:
+                moisture, watering = rnd.uniform(50, 60), None
+            hour = time.localtime(ts).tm_hour + time.localtime(ts).tm_min / 60
+            if minute % 30 == 0:
+                cloud = rnd.uniform(0.3, 1.0)
+            light = peak * cloud * math.sin(math.pi * (hour - 7) / 12) if 7 <= hour < 19 else 0
+            readings.append({'ts': ts, 'moisture': round(moisture + rnd.gauss(0, noise), 1), 'light': int(light),
+                             'battery': int(battery - 5 * minute / 1440 / 30)})
+        series['plant_{}'.format(ii)] = readings
+    return series
+
+
+def bench_polling(args):
+    """
+    Simulation of the adaptive polling schedule vs. the fixed one: replays a synthetic ground truth (or the raw
+    measurements of a DB) and compares the number of sensor reads and the delay of the thirsty alerts.
+
+    """
+    from adaptive import fixed_interval, poll_interval, simulate
+    from utils.daylight import LAT, LON, get_sun_table
+
+    if args.db:
+        from db import since_data
+        from registry import get_registry
+
+        os.chdir(args.db)
+        series = since_data(0)
+        thresholds = {name: (get_registry().get(name).min_moisture if get_registry().get(name) else args.threshold)
+                      for name in series}
+    else:
+        series = _synthetic_readings(args.plants, args.days, seed=args.seed, noise=args.noise)
+        thresholds = {name: 20 for name in series}
+
+    # sunrise/sunset of the configured location (else 7-19h, as the synthetic light)
+    if LAT and LON:
+        daylight = get_sun_table().daylight
+    else:
+        def daylight(ts):
+            return 7 <= time.localtime(ts).tm_hour < 19
+
+    days = sum((r[-1]['ts'] - r[0]['ts']) / 86400 for r in series.values() if r)
+    print('sensors     : {} ({:.0f} sensor days)'.format(len(series), days))
+    print('{:<9} {:>8} {:>14} {:>10} {:>10} {:>10} {:>8}'.format('schedule', 'reads', 'reads/sensor/d', 'alerts',
+                                                                  'p50 [min]', 'max [min]', 'missed'))
+    for label, policy in [('fixed', fixed_interval), ('adaptive', poll_interval)]:
+        polls, latencies = 0, []
+        for name, readings in series.items():
+            n, lat = simulate(readings, thresholds[name], daylight, policy=policy)
+            polls += n
+            latencies += lat
+        seen = [l / 60 for l in latencies if l is not None]
+        print('{:<9} {:>8} {:>14.1f} {:>10} {:>10.0f} {:>10.0f} {:>8}'.format(
+            label, polls, polls / max(days, 1e-9), len(latencies), _percentile(seen, 50),
+            max(seen) if seen else float('nan'), len(latencies) - len(seen)))
+
+
+def bench_render(args):
+    """
+    Benchmark for drawing a frame (in memory, no display) for different numbers of plants. The first frame includes
+    the layout + asset setup, following frames only fill in the values.
+
+    """
+    from layout import OfflineDisplay, get_layout
+    from registry import Plant
+
+    rnd = random.Random(args.seed)
+    inky = OfflineDisplay()
+    icons = sorted(os.listdir(PLANT_ICON_PATH))
+
+    print('{:>6} {:>14} {:>14}'.format('plants', 'first [ms]', 'frame [ms]'))
+    for n in args.plants:
+        plants = [Plant('plant_{}'.format(ii), 'FA:CE:00:00:00:{:02X}'.format(ii), 20, icon=icons[ii % len(icons)])
+                  for ii in range(n)]
+        latest = {p.name: [{'ts': int(time.time()), 'moisture': rnd.randint(5, 60),
+                               'temperature': rnd.randint(15, 30), 'light': rnd.randint(0, 20000)}]
+                  for p in plants}
+
+        start = time.perf_counter()
+        get_layout(inky.WIDTH, inky.HEIGHT, n).render(inky, plants, latest)
+        first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            get_layout(inky.WIDTH, inky.HEIGHT, n).render(inky, plants, latest)
+        frame = (time.perf_counter() - start) / args.repeat
+
+        print('{:>6} {:>14.2f} {:>14.2f}'.format(n, first * 1000, frame * 1000))
+
+
+def _slack_stub(port, latency, rate_limit):
+    """
+    Utility for running a local stub of the Slack Web API (in a background thread). Every `rate_limit`-th call is
+    answered with HTTP 429 + Retry-After.
+
+    """
+    from aiohttp import web
+
+    calls = {'n': 0}
+
+    async def handler(request):
+        calls['n'] += 1
+        await asyncio.sleep(latency)
+        if rate_limit and calls['n'] % rate_limit == 0:
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        data = await request.post()
+        return web.json_response({'ok': True, 'ts': str(time.time()), 'channel': data.get('channel', 'C0')})
+
+    app = web.Application()
+    app.router.add_post('/api/{method}', handler)
+    runner = web.AppRunner(app, access_log=None)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port).start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return calls
+
+
+def bench_slack(args):
+    """
+    Benchmark for dispatching alerts (message + reactions) against a local Slack stub server.
+
+    """
+    from constants import EMOJI_LIST
+    from slack_dispatch import SlackDispatcher
+
+    calls = _slack_stub(args.port, args.latency, args.rate_limit)
+    dispatcher = SlackDispatcher('xoxb-stub', base_url='http://127.0.0.1:{}/api'.format(args.port),
+                                 concurrency=args.concurrency)
+    messages = [('general', 'plant_{} needs water!'.format(ii), EMOJI_LIST) for ii in range(args.messages)]
+
+    start = time.monotonic()
+    resps = dispatcher.dispatch(messages)
+    total = time.monotonic() - start
+
+    print('messages     : {} ({} posted)'.format(len(messages), sum(r is not None for r in resps)))
+    print('http calls   : {}'.format(calls['n']))
+    print('rate limited : {}'.format(dispatcher.stats['rate_limited']))
+    print('dispatch     : {:.2f}s'.format(total))
+    print('sequential   : {:.2f}s (estimate, {} calls x {}s)'.format(
+        len(messages) * (1 + len(EMOJI_LIST)) * args.latency, len(messages) * (1 + len(EMOJI_LIST)), args.latency))
+
+
+def bench_listen(args):
+    """
+    Benchmark replaying (recorded or synthetic) RTM event batches through the listener, with responses posted to a
+    local Slack stub server. Reports the latency per batch, the command throughput and the DB queries spent on top of
+    the (one-off) summary cache warm-up.
+
+    """
+    import json
+    import logging
+
+    import aiohttp
+
+    import slackbot_listen
+    from slack_dispatch import SlackDispatcher
+    from summary import get_summary_cache
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    calls = _slack_stub(args.port, args.latency, 0)
+    names = _synthetic_db(args.plants, 100, seed=args.seed)
+    with open('./data/plant_def.json', 'w') as dst:
+        json.dump({'plants': [{'name': name, 'mac_address': 'FA:CE:00:00:00:{:02X}'.format(ii), 'min_moisture': 20}
+                              for ii, name in enumerate(names)]}, dst)
+
+    if args.events is not None:
+        with open(args.events, 'r') as src:
+            batches = json.load(src)
+    else:
+        commands = ['info', 'info {}'.format(names[0]), 'history {} 1d'.format(names[0]), 'help']
+        batches = [[{'type': 'message', 'channel': 'C0', 'text': '<@UPLANTBOT> {}'.format(
+            commands[(ii + jj) % len(commands)])} for jj in range(args.batch)] for ii in range(args.batches)]
+    slackbot_listen.plantbot_id = 'UPLANTBOT'
+
+    cache = get_summary_cache()
+    start = time.monotonic()
+    cache.warm()
+    warm = time.monotonic() - start
+    queries = cache.stats['queries']
+
+    listener = slackbot_listen.Listener(SlackDispatcher('xoxb-stub', base_url='http://127.0.0.1:{}/api'.format(
+        args.port)), workers=args.workers)
+
+    async def replay():
+        latencies = []
+        semaphore = asyncio.Semaphore(listener.dispatcher.concurrency)
+        async with aiohttp.ClientSession() as session:
+            async def timed(batch):
+                start = time.monotonic()
+                await listener.handle_events(session, semaphore, batch)
+                latencies.append(time.monotonic() - start)
+            await asyncio.gather(*[timed(batch) for batch in batches])
+        return latencies
+
+    start = time.monotonic()
+    latencies = asyncio.new_event_loop().run_until_complete(replay())
+    total = time.monotonic() - start
+
+    commands = sum(len(slackbot_listen.parse_bot_commands(batch)) for batch in batches)
+    print('batches     : {} ({} commands, {} http calls)'.format(len(batches), commands, calls['n']))
+    print('warm-up     : {:.1f}ms ({} readings cached)'.format(warm * 1000, cache.stats['readings']))
+    print('db queries  : {} (during replay)'.format(cache.stats['queries'] - queries))
+    print('replay      : {:.2f}s'.format(total))
+    print('throughput  : {:.1f} commands/s'.format(commands / total))
+    print('latency p50 : {:.3f}s'.format(_percentile(latencies, 50)))
+    print('latency p95 : {:.3f}s'.format(_percentile(latencies, 95)))
+
+
+def _start_collector(port):
+    """
+    Utility for starting `plantbot.py run --components collector` in a fresh interpreter (DB in the current directory),
+    returns once the collector accepts connections.
+
+    Returns:
+        proc (obj): running subprocess
+
+    """
+    import socket
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plantbot.py')
+    env = dict(os.environ, PLANTBOT_COLLECTOR_PORT=str(port))
+    proc = subprocess.Popen([sys.executable, script, 'run', '--components', 'collector'], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('collector exited with status {}'.format(proc.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError('collector did not start')
+
+
+def bench_collector(args):
+    """
+    Benchmark for the multi-node setup with two local processes: a central collector (`plantbot.py run --components
+    collector`) and an edge node sweeping fake sensors in this process (`collector.Forwarder`). The collector is
+    stopped for `--outage` sweeps and the edge node restarted during the outage (i.e. its readings are recovered from
+    the journal), every batch is finally sent once more. Reports the wire size, the readings stored centrally vs. read
+    and the duplicates ignored.
+
+    """
+    import json
+    import logging
+    import sqlite3
+
+    from collector import Forwarder, encode_batch
+    from polling import FakeReader, poll_sensors
+    from registry import Plant
+
+    # failed requests are expected during the outage
+    logging.disable(logging.CRITICAL)
+
+    root = tempfile.mkdtemp(prefix='plantbot_bench_')
+    central, edge = os.path.join(root, 'central'), os.path.join(root, 'edge')
+    for path in [central, edge]:
+        os.makedirs(os.path.join(path, os.path.dirname(DB_PATH)))
+
+    plants = [Plant('plant_{}'.format(ii), 'FA:CE:00:00:00:{:02X}'.format(ii), 20) for ii in range(args.plants)]
+    reader = FakeReader(latency=(0, 0.01), seed=args.seed)
+    url = 'http://127.0.0.1:{}'.format(args.port)
+    outage = range(args.sweeps // 3, args.sweeps // 3 + args.outage)
+
+    os.chdir(central)
+    proc = _start_collector(args.port)
+    os.chdir(edge)
+    forwarder = Forwarder(url, node='bench', backoff=0)
+    start_ts = int(time.time()) - args.sweeps * args.interval * 60
+    sent, json_bytes, pending, failures, duplicates = [], 0, 0, 0, 0
+    try:
+        for sweep in range(args.sweeps):
+            if sweep == outage.start:
+                proc.terminate()
+                proc.wait()
+            elif sweep == outage.start + args.outage // 2:
+                # edge node restart (buffered readings are recovered from the journal)
+                pending = max(pending, forwarder.pending)
+                forwarder.close()
+                failures += forwarder.stats['failures']
+                forwarder = Forwarder(url, node='bench', backoff=0)
+            elif sweep == outage.stop:
+                pending = max(pending, forwarder.pending)
+                os.chdir(central)
+                proc = _start_collector(args.port)
+                os.chdir(edge)
+
+            readings, _, _ = poll_sensors(plants, reader=reader, processes=False)
+            ts = start_ts + sweep * args.interval * 60
+            for name, reading in readings.items():
+                forwarder.add(name, reading.measurements(), ts=ts)
+                sent.append((name, ts, reading.measurements()))
+                json_bytes += len(json.dumps([name, ts, reading.measurements()])) + 1
+            forwarder.flush()
+
+        # a lost response (i.e. the edge node sends everything again)
+        for ii in range(0, len(sent), forwarder.batch):
+            resp = forwarder._post(sent[ii:ii + forwarder.batch])
+            duplicates += resp['rows'] - resp['inserted']
+        left = forwarder.pending
+        forwarder.close()
+        failures += forwarder.stats['failures']
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    with sqlite3.connect(os.path.join(central, DB_PATH)) as conn:
+        stored = conn.execute('SELECT COUNT(*) FROM measurements').fetchone()[0]
+
+    print('readings     : {} ({} sensors x {} sweeps, collector down for {} sweeps)'.format(
+        len(sent), args.plants, args.sweeps, args.outage))
+    print('buffered     : {} readings at most during the outage, {} left'.format(pending, left))
+    print('wire         : {:.1f} bytes/reading ({:.1f} as JSON lines)'.format(
+        len(encode_batch('bench', sent[:forwarder.batch])) / len(sent[:forwarder.batch]), json_bytes / len(sent)))
+    print('requests     : {} failed during the outage'.format(failures))
+    print('stored       : {} readings in the central DB'.format(stored))
+    print('duplicates   : {} ignored (everything sent again)'.format(duplicates))
+    if stored != len(sent) or left:
+        sys.exit(1)
+
+
+def _startup(components):
+    """
+    Utility for starting `plantbot.py run --dry-run` with a set of components in a fresh interpreter.
+
+    Returns:
+        wall (float): time until the process exited [s]
+        rss (float): peak resident set size [MB]
+
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plantbot.py')
+    start = time.monotonic()
+    proc = subprocess.Popen([sys.executable, script, 'run', '--dry-run', '--components', ','.join(components)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.monotonic() - start
+    if status != 0:
+        raise RuntimeError('plantbot.py run failed for {}'.format(components))
+    return wall, usage.ru_maxrss / 1024
+
+
+def _import_time(module):
+    """
+    Utility for importing a module in a fresh interpreter with `-X importtime`.
+
+    Returns:
+        total (float): cumulative import time of the module [ms]
+        children (list): (cumulative time [ms], name) of the modules imported directly by it, slowest first
+
+    """
+    scripts = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], cwd=scripts,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    # lines are "import time: <self us> | <cumulative us> | <indented name>", children are listed before their parent
+    total, children = None, []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                total = int(cumulative) / 1000
+                break
+            # children of another top level import (e.g. site)
+            children = []
+    return total, sorted(children, reverse=True)
+
+
+def bench_imports(args):
+    """
+    Benchmark for the import time of the script entry points (fresh interpreter, `-X importtime`) against the budgets
+    in IMPORT_BUDGETS. Exits with status 1 if an entry point exceeds its budget (i.e. usable as a regression check).
+
+    """
+    failed = []
+    print('{:<16} {:>10} {:>10}  {}'.format('entry point', 'import [ms]', 'budget', 'slowest imports'))
+    for module in args.modules:
+        runs = [_import_time(module) for _ in range(args.repeat)]
+        total, children = sorted(runs)[len(runs) // 2]
+        budget = IMPORT_BUDGETS[module] * args.scale
+        if total > budget:
+            failed.append(module)
+        print('{:<16} {:>10.1f} {:>10.0f}  {}{}'.format(module, total, budget, ', '.join(
+            '{} {:.0f}'.format(name, t) for t, name in children[:args.top]), '  OVER BUDGET' if total > budget else ''))
+
+    if failed:
+        sys.exit(1)
+
+
+def bench_startup(args):
+    """
+    Benchmark for the startup time and memory of the components: one process per component (i.e. the supervisor
+    setup) vs. all components in a single `plantbot.py run` process.
+
+    """
+    print('{:<24} {:>10} {:>10}'.format('setup', 'start [s]', 'RSS [MB]'))
+    for _ in range(args.repeat):
+        separate = [_startup([c]) for c in args.components]
+        single = _startup(args.components)
+
+    for c, (wall, rss) in zip(args.components, separate):
+        print('{:<24} {:>10.2f} {:>10.1f}'.format('process: ' + c, wall, rss))
+    print('{:<24} {:>10.2f} {:>10.1f}'.format('{} processes (total)'.format(len(separate)),
+                                              sum(w for w, _ in separate), sum(r for _, r in separate)))
+    print('{:<24} {:>10.2f} {:>10.1f}'.format('single process', single[0], single[1]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='PlantBot benchmarks')
+    subparsers = parser.add_subparsers(dest='bench')
+    subparsers.required = True
+
+    sweep = subparsers.add_parser('sweep', help='sensor sweep throughput and tail latency (fake backend)')
+    sweep.add_argument('--plants', type=int, default=30)
+    sweep.add_argument('--workers', type=int, default=POLL_WORKERS)
+    sweep.add_argument('--timeout', type=float, default=POLL_TIMEOUT)
+    sweep.add_argument('--min-latency', type=float, default=0.5)
+    sweep.add_argument('--max-latency', type=float, default=2.0)
+    sweep.add_argument('--failure-rate', type=float, default=0.0)
+    sweep.add_argument('--hang', type=int, default=0, help='number of sensors which never answer')
+    sweep.add_argument('--seed', type=int, default=None)
+    sweep.add_argument('--threads', action='store_true', help='run reads in threads instead of processes')
+    sweep.set_defaults(func=bench_sweep)
+
+    ble = subparsers.add_parser('ble', help='BLE connections per sweep: MiFloraPoller vs. MiFloraReader (fake backend)')
+    ble.add_argument('--plants', type=int, default=10)
+    ble.add_argument('--sweeps', type=int, default=6)
+    ble.add_argument('--latency', type=float, default=0.05, help='simulated time per BLE connection [s]')
+    ble.set_defaults(func=bench_ble)
+
+    health = subparsers.add_parser('health', help='sweeps with failing sensors: backoff + circuit breaker on/off')
+    health.add_argument('--plants', type=int, default=10)
+    health.add_argument('--dead', type=int, default=2, help='number of sensors which always fail')
+    health.add_argument('--hang', type=int, default=1, help='number of sensors which never answer')
+    health.add_argument('--malformed', type=int, default=1, help='number of sensors with implausible readings')
+    health.add_argument('--sweeps', type=int, default=36)
+    health.add_argument('--interval', type=int, default=10, help='simulated time between sweeps [min]')
+    health.add_argument('--workers', type=int, default=POLL_WORKERS)
+    health.add_argument('--timeout', type=float, default=2.0, help='time budget per sensor read [s]')
+    health.add_argument('--min-latency', type=float, default=0.05)
+    health.add_argument('--max-latency', type=float, default=0.2)
+    health.add_argument('--seed', type=int, default=None)
+    health.set_defaults(func=bench_health)
+
+    latest = subparsers.add_parser('latest', help='cost per refresh of the latest readings vs. number of plants')
+    latest.add_argument('--plants', type=int, nargs='+', default=[1, 5, 20, 50])
+    latest.add_argument('--rows', type=int, default=1000, help='measurements per plant')
+    latest.add_argument('--num', type=int, default=1)
+    latest.add_argument('--repeat', type=int, default=20)
+    latest.add_argument('--seed', type=int, default=None)
+    latest.set_defaults(func=bench_latest)
+
+    history = subparsers.add_parser('history', help='history queries on raw rows vs. rollups (synthetic DB)')
+    history.add_argument('--days', type=int, default=90, help='days of raw measurements (every 10 min)')
+    history.add_argument('--windows', type=int, nargs='+', default=[1, 7, 30, 90], help='query windows [days]')
+    history.add_argument('--points', type=int, default=500, help='point budget')
+    history.add_argument('--repeat', type=int, default=10)
+    history.add_argument('--seed', type=int, default=None)
+    history.set_defaults(func=bench_history)
+
+    export = subparsers.add_parser('export', help='peak memory of a full CSV export: streamed vs. materialized')
+    export.add_argument('--plants', type=int, default=10)
+    export.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 300000], help='readings in the DB')
+    export.add_argument('--chunk', type=int, default=EXPORT_CHUNK, help='readings per chunk')
+    export.add_argument('--seed', type=int, default=None)
+    export.set_defaults(func=bench_export)
+
+    analytics = subparsers.add_parser('analytics', help='watering prediction on a synthetic multi-year dataset')
+    analytics.add_argument('--plants', type=int, default=20)
+    analytics.add_argument('--years', type=int, default=3)
+    analytics.add_argument('--window', type=int, default=30, help='window of the predictor [days]')
+    analytics.add_argument('--repeat', type=int, default=5)
+    analytics.add_argument('--seed', type=int, default=None)
+    analytics.set_defaults(func=bench_analytics)
+
+    polling = subparsers.add_parser('polling', help='simulated sensor reads + alert delay: adaptive vs. fixed schedule')
+    polling.add_argument('--db', metavar='DIR', default=None, help='replay the raw measurements of DIR/{}'.format(
+        DB_PATH))
+    polling.add_argument('--plants', type=int, default=10)
+    polling.add_argument('--days', type=int, default=30, help='days of synthetic readings (every minute)')
+    polling.add_argument('--noise', type=float, default=0.1, help='moisture noise of the synthetic readings [%%]')
+    polling.add_argument('--threshold', type=float, default=20, help='min_moisture of unregistered plants (--db)')
+    polling.add_argument('--seed', type=int, default=None)
+    polling.set_defaults(func=bench_polling)
+
+    render = subparsers.add_parser('render', help='inky frame render time vs. number of plants (in memory)')
+    render.add_argument('--plants', type=int, nargs='+', default=[1, 5, 20, 50])
+    render.add_argument('--repeat', type=int, default=20)
+    render.add_argument('--seed', type=int, default=None)
+    render.set_defaults(func=bench_render)
+
+    slack = subparsers.add_parser('slack', help='alert dispatch against a local Slack stub server')
+    slack.add_argument('--messages', type=int, default=10)
+    slack.add_argument('--concurrency', type=int, default=SLACK_CONCURRENCY)
+    slack.add_argument('--latency', type=float, default=0.2, help='stub response time [s]')
+    slack.add_argument('--rate-limit', type=int, default=0, help='answer every Nth call with HTTP 429 (0 = never)')
+    slack.add_argument('--port', type=int, default=8765)
+    slack.set_defaults(func=bench_slack)
+
+    listen = subparsers.add_parser('listen', help='replay RTM events through the listener (local Slack stub)')
+    listen.add_argument('--events', default=None, help='JSON file with recorded event batches (list of lists)')
+    listen.add_argument('--batches', type=int, default=20)
+    listen.add_argument('--batch', type=int, default=3, help='events per synthetic batch')
+    listen.add_argument('--plants', type=int, default=20)
+    listen.add_argument('--workers', type=int, default=LISTEN_WORKERS)
+    listen.add_argument('--latency', type=float, default=0.05, help='stub response time [s]')
+    listen.add_argument('--port', type=int, default=8766)
+    listen.add_argument('--seed', type=int, default=None)
+    listen.set_defaults(func=bench_listen)
+
+    collector = subparsers.add_parser('collector', help='edge node -> central collector with an outage (2 processes)')
+    collector.add_argument('--plants', type=int, default=10)
+    collector.add_argument('--sweeps', type=int, default=30)
+    collector.add_argument('--outage', type=int, default=10, help='sweeps while the collector is down')
+    collector.add_argument('--interval', type=int, default=10, help='simulated time between sweeps [min]')
+    collector.add_argument('--port', type=int, default=8767)
+    collector.add_argument('--seed', type=int, default=None)
+    collector.set_defaults(func=bench_collector)
+
+    startup = subparsers.add_parser('startup', help='startup time + RSS: one process per component vs. plantbot run')
+    startup.add_argument('--components', nargs='+', default=COMPONENTS, choices=COMPONENTS)
+    startup.add_argument('--repeat', type=int, default=3, help='runs (the last one is reported, i.e. warm caches)')
+    startup.set_defaults(func=bench_startup)
+
+    imports = subparsers.add_parser('imports', help='import time of the entry points vs. budget (-X importtime)')
+    imports.add_argument('--modules', nargs='+', default=sorted(IMPORT_BUDGETS), choices=sorted(IMPORT_BUDGETS))
+    imports.add_argument('--repeat', type=int, default=3, help='runs per entry point (the median is reported)')
+    imports.add_argument('--scale', type=float, default=1.0, help='budget factor (e.g. ~10 for a Pi Zero)')
+    imports.add_argument('--top', type=int, default=3, help='number of slowest direct imports to list')
+    imports.set_defaults(func=bench_imports)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,432 @@
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from constants import COLLECTOR_HOST, COLLECTOR_PORT, COLLECTOR_MAX_BODY, FORWARD_JOURNAL_PATH, \
+    FORWARD_REJECTED_PATH, FORWARD_BATCH, FORWARD_TIMEOUT, FORWARD_BACKOFF, FORWARD_MAX_BACKOFF, FLUSH_INTERVAL
+from db import attach_retention, insert_many
+from ingest import Ingestor
+from metrics import get_metrics
+from summary import get_summary_cache
+
+# wire format of a batch: magic + node name, plant name table, readings (16 bytes each, little endian)
+MAGIC = b'PBW1'
+COUNT = struct.Struct('<H')
+ROW = struct.Struct('<HIhBIHB')  # plant index, ts, temperature [0.1 C], moisture, light, conductivity, battery
+CONTENT_TYPE = 'application/x-plantbot-batch'
+
+
+class WireError(ValueError):
+    """
+    Raised for a malformed batch.
+
+    """
+
+
+def _pack_str(value):
+    raw = value.encode('utf-8')
+    if len(raw) > 0xFFFF:
+        raise WireError('name too long: {!r}'.format(value[:32]))
+    return COUNT.pack(len(raw)) + raw
+
+
+def encode_batch(node, rows):
+    """
+    Function for encoding readings in the compact wire format of the collector (plant names are sent once per batch,
+    a reading takes 16 bytes). Measurements are rounded to the sensor resolution (temperature 0.1 C, else integers).
+
+    Args:
+        node (str): name of the sending node
+        rows (list): (plant name, epoch timestamp, measurements) tuples
+
+    Returns:
+        payload (bytes): encoded batch
+
+    Raises:
+        WireError: for a measurement outside of the wire range (see READING_RANGES)
+
+    """
+    names = {}
+    body = []
+    for name, ts, data in rows:
+        idx = names.setdefault(name, len(names))
+        try:
+            body.append(ROW.pack(idx, int(ts), int(round(data['temperature'] * 10)), int(round(data['moisture'])),
+                                 int(round(data['light'])), int(round(data['conductivity'])),
+                                 int(round(data['battery']))))
+        except (struct.error, TypeError) as e:
+            raise WireError('{} @ {}: {}'.format(name, ts, e))
+    if len(names) > 0xFFFF:
+        raise WireError('too many plants in one batch')
+
+    head = [MAGIC, _pack_str(node), COUNT.pack(len(names))]
+    head.extend(_pack_str(name) for name in names)
+    head.append(struct.pack('<I', len(body)))
+    return b''.join(head + body)
+
+
+def decode_batch(payload):
+    """
+    Function for decoding a batch of the wire format (see `encode_batch`).
+
+    Args:
+        payload (bytes): encoded batch
+
+    Returns:
+        node (str): name of the sending node
+        rows (list): (plant name, epoch timestamp, measurements) tuples
+
+    Raises:
+        WireError: for a malformed batch
+
+    """
+    view = memoryview(payload)
+    pos = [len(MAGIC)]
+
+    def take(n):
+        if pos[0] + n > len(view):
+            raise WireError('truncated batch')
+        out = view[pos[0]:pos[0] + n]
+        pos[0] += n
+        return out
+
+    def take_str():
+        try:
+            return bytes(take(COUNT.unpack(take(COUNT.size))[0])).decode('utf-8')
+        except UnicodeDecodeError:
+            raise WireError('invalid name')
+
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise WireError('unknown format')
+    node = take_str()
+    names = [take_str() for _ in range(COUNT.unpack(take(COUNT.size))[0])]
+    n = struct.unpack('<I', take(4))[0]
+    if len(view) - pos[0] != n * ROW.size:
+        raise WireError('expected {} readings, got {} bytes'.format(n, len(view) - pos[0]))
+
+    rows = []
+    for idx, ts, temperature, moisture, light, conductivity, battery in ROW.iter_unpack(view[pos[0]:]):
+        if idx >= len(names):
+            raise WireError('unknown plant index {}'.format(idx))
+        rows.append((names[idx], ts, {'temperature': temperature / 10, 'moisture': moisture, 'light': light,
+                                      'conductivity': conductivity, 'battery': battery}))
+    return node, rows
+
+
+class Forwarder(Ingestor):
+    """
+    Ingestion stage of an edge node: instead of the local DB, buffered readings are sent to the central collector
+    (HTTP POST of `encode_batch` payloads, at most `batch` readings per request). Buffering is store-and-forward: the
+    readings stay in the journal (i.e. survive a restart) until the collector accepted all of them, after a failed
+    request the next attempt waits `backoff` seconds (doubling up to `max_backoff`). A batch accepted before a later one
+    failed is simply sent again (the collector ignores duplicates). A batch rejected by the collector (4xx, e.g. invalid
+    readings) or not encodable would fail forever, it is moved to `rejected_path` instead (journal format, i.e. it can
+    be re-sent by appending it to the journal once the cause is fixed).
+
+    Args:
+        url (str): base URL of the collector (e.g. http://central.local:8086)
+        node (str): name of this node (defaults to ENV PLANTBOT_NODE or the hostname)
+        token (str): shared secret of the collector (defaults to ENV PLANTBOT_COLLECTOR_TOKEN)
+        journal_path (str): path of the append-only journal (None for an in-memory buffer only)
+        rejected_path (str): path for rejected readings (None to drop them)
+        max_delay (float): maximum age of a buffered reading before it is sent [s]
+        batch (int): maximum readings per request
+        timeout (float): time budget per request [s]
+        backoff (float): wait after a failed request [s]
+        max_backoff (float): maximum wait between two attempts [s]
+
+    """
+
+    def __init__(self, url, node=None, token=None, journal_path=FORWARD_JOURNAL_PATH,
+                 rejected_path=FORWARD_REJECTED_PATH, max_delay=FLUSH_INTERVAL, batch=FORWARD_BATCH,
+                 timeout=FORWARD_TIMEOUT, backoff=FORWARD_BACKOFF, max_backoff=FORWARD_MAX_BACKOFF):
+        self.url = url.rstrip('/') + '/readings'
+        self.node = node or os.environ.get('PLANTBOT_NODE') or socket.gethostname()
+        self.token = token if token is not None else os.environ.get('PLANTBOT_COLLECTOR_TOKEN')
+        self.rejected_path = rejected_path
+        self.batch = batch
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._failures = 0
+        self._retry_at = 0
+        super(Forwarder, self).__init__(journal_path=journal_path, max_delay=max_delay)
+        self.stats.update({'requests': 0, 'bytes': 0, 'duplicates': 0, 'rejected': 0})
+
+    def _post(self, rows):
+        """
+        Send one batch.
+
+        Returns:
+            resp (dict): `rows` received + `inserted` by the collector
+
+        """
+        payload = encode_batch(self.node, rows)
+        headers = {'Content-Type': CONTENT_TYPE}
+        if self.token:
+            headers['X-PlantBot-Token'] = self.token
+        req = urllib.request.Request(self.url, data=payload, headers=headers, method='POST')
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            out = json.loads(resp.read().decode('utf-8'))
+        self.stats['requests'] += 1
+        self.stats['bytes'] += len(payload)
+        return out
+
+    def _reject(self, rows, reason):
+        """
+        Move readings the collector will never accept out of the buffer.
+
+        """
+        if self.rejected_path is not None:
+            with open(self.rejected_path, 'a') as dst:
+                for row in rows:
+                    dst.write(json.dumps(row) + '\n')
+        self.stats['rejected'] += len(rows)
+        get_metrics().inc('plantbot_forward_rejected_total', len(rows))
+        logging.error('[Forwarder] -> Collector {} rejected {} readings, moved to {} ({})'.format(
+            self.url, len(rows), self.rejected_path, reason))
+
+    def _commit(self, rows):
+        """
+        Send all buffered readings to the collector (raises if any request failed, i.e. the buffer is kept).
+
+        """
+        rejected = 0
+        try:
+            for ii in range(0, len(rows), self.batch):
+                batch = rows[ii:ii + self.batch]
+                try:
+                    resp = self._post(batch)
+                except urllib.error.HTTPError as e:
+                    if not 400 <= e.code < 500:
+                        raise
+                    self._reject(batch, '{} {}'.format(e.code, e.read().decode('utf-8', 'replace')))
+                    rejected += len(batch)
+                    continue
+                except WireError as e:
+                    self._reject(batch, repr(e))
+                    rejected += len(batch)
+                    continue
+                self.stats['duplicates'] += resp['rows'] - resp['inserted']
+        except (OSError, ValueError, KeyError) as e:
+            self._failures += 1
+            delay = min(self.max_backoff, self.backoff * 2 ** (self._failures - 1))
+            self._retry_at = time.monotonic() + delay
+            get_metrics().inc('plantbot_forward_failures_total')
+            logging.error('[Forwarder] -> Collector {} unreachable, keeping {} readings, next attempt in {:.0f}s '
+                          '({})'.format(self.url, len(rows), delay, repr(e)))
+            raise
+
+        if self._failures:
+            logging.info('[Forwarder] -> Collector {} reachable again after {} failed attempts'.format(
+                self.url, self._failures))
+        self._failures = 0
+        self._retry_at = 0
+        get_metrics().inc('plantbot_forward_rows_total', len(rows) - rejected)
+
+    def flush(self):
+        """
+        Send all buffered readings to the collector (no-op while backing off after a failed request).
+
+        Returns:
+            n (int): number of accepted readings
+
+        """
+        with self._lock:
+            if time.monotonic() < self._retry_at:
+                return 0
+            return super(Forwarder, self).flush()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Request handler of the collector (POST /readings).
+
+    """
+
+    collector = None
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/readings':
+            return self._reply(404, {'error': 'not found'})
+        if self.collector.token and not hmac.compare_digest(self.headers.get('X-PlantBot-Token', '').encode('utf-8'),
+                                                            self.collector.token.encode('utf-8')):
+            return self._reply(401, {'error': 'invalid token'})
+
+        length = self.headers.get('Content-Length')
+        if length is None:
+            return self._reply(411, {'error': 'length required'})
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self._reply(400, {'error': 'invalid length'})
+        if length > self.collector.max_body:
+            # the body is not read, i.e. the connection can't be reused
+            self.close_connection = True
+            return self._reply(413, {'error': 'batch exceeds {} bytes'.format(self.collector.max_body)})
+
+        payload = self.rfile.read(length)
+        try:
+            node, rows, inserted = self.collector.ingest(payload)
+        except WireError as e:
+            logging.error('[Collector] -> Rejected batch from {}: {}'.format(self.client_address[0], e))
+            return self._reply(400, {'error': str(e)})
+        except Exception as e:
+            # e.g. locked DB (the edge node keeps the batch and retries)
+            logging.exception('[Collector] -> Unable to store batch from {}'.format(self.client_address[0]))
+            return self._reply(503, {'error': repr(e)})
+        self._reply(200, {'node': node, 'rows': len(rows), 'inserted': inserted})
+
+    def _reply(self, status, body):
+        raw = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, fmt, *args):
+        logging.debug('[Collector] -> {} {}'.format(self.client_address[0], fmt % args))
+
+
+def _is_loopback(host):
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == 'localhost'
+
+
+class Collector(object):
+    """
+    Central ingestion endpoint of a multi-node setup: edge nodes (see `Forwarder`) POST batches of readings which are
+    stored in the DB of this node in a single transaction each. Readings are deduplicated on (plant, timestamp), i.e.
+    a batch re-sent after a lost response is harmless. Accepted readings also refresh the summary cache of this process.
+
+    Args:
+        host (str): listen address (defaults to ENV PLANTBOT_COLLECTOR_HOST or COLLECTOR_HOST)
+        port (int): listen port (0 for any free port)
+        token (str): shared secret expected in the X-PlantBot-Token header (defaults to ENV PLANTBOT_COLLECTOR_TOKEN,
+            only optional on a loopback address)
+        max_body (int): maximum size of a batch [bytes]
+
+    Raises:
+        ValueError: for a non-loopback listen address without a token (i.e. unauthenticated writes to the DB)
+
+    """
+
+    def __init__(self, host=None, port=COLLECTOR_PORT, token=None, max_body=COLLECTOR_MAX_BODY):
+        host = host or os.environ.get('PLANTBOT_COLLECTOR_HOST') or COLLECTOR_HOST
+        self.token = token if token is not None else os.environ.get('PLANTBOT_COLLECTOR_TOKEN')
+        if not self.token and not _is_loopback(host):
+            raise ValueError('Collector on {} requires a token (ENV PLANTBOT_COLLECTOR_TOKEN)'.format(host))
+        self.max_body = max_body
+        self.stats = {'batches': 0, 'rows': 0, 'inserted': 0}
+        handler = type('Handler', (_Handler,), {'collector': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def ingest(self, payload):
+        """
+        Decode and store a batch.
+
+        Returns:
+            node (str): name of the sending node
+            rows (list): (plant name, epoch timestamp, measurements) tuples of the batch
+            inserted (int): number of new readings (i.e. without duplicates)
+
+        """
+        node, rows = decode_batch(payload)
+        metrics = get_metrics()
+        with metrics.timer('plantbot_collector_batch_seconds', node=node):
+            inserted = insert_many(rows) if rows else 0
+
+        cache = get_summary_cache()
+        for row in rows:
+            cache.add(*row)
+
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['rows'] += len(rows)
+            self.stats['inserted'] += inserted
+        metrics.inc('plantbot_collector_rows_total', inserted, node=node, result='inserted')
+        metrics.inc('plantbot_collector_rows_total', len(rows) - inserted, node=node, result='duplicate')
+        logging.info('[Collector] -> Stored {}/{} readings from {} ({} bytes)'.format(inserted, len(rows), node,
+                                                                                     len(payload)))
+        return node, rows, inserted
+
+    def start(self):
+        """
+        Serve requests in a background thread.
+
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever, name='collector', daemon=True)
+        self._thread.start()
+        logging.info('[Collector] -> Listening on {}:{}'.format(*self.server.server_address))
+
+    def stop(self):
+        """
+        Stop serving requests.
+
+        """
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+
+
+def register(scheduler, port=None):
+    """
+    Start the collector of this node (served next to the scheduler, stopped when it shuts down) and run the retention
+    of the DB storing the collected readings (see `db.attach_retention`).
+
+    Args:
+        scheduler (obj): APScheduler scheduler
+        port (int): listen port (defaults to ENV PLANTBOT_COLLECTOR_PORT or COLLECTOR_PORT)
+
+    Returns:
+        collector (obj): running `Collector` instance
+
+    """
+    from apscheduler.events import EVENT_SCHEDULER_SHUTDOWN
+
+    port = int(port or os.environ.get('PLANTBOT_COLLECTOR_PORT') or COLLECTOR_PORT)
+    collector = Collector(port=port)
+    collector.start()
+    attach_retention(scheduler)
+    scheduler.add_listener(lambda event: collector.stop(), EVENT_SCHEDULER_SHUTDOWN)
+    return collector
+
+
+if __name__ == "__main__":
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    from dotenv import load_dotenv
+
+    from db import attach_scheduler
+    from metrics import attach_scheduler as attach_metrics
+
+    load_dotenv(dotenv_path='.envrc')
+    logging.basicConfig(format='%(asctime)s:%(levelname)s:%(message)s', level=logging.DEBUG)
+
+    scheduler = BlockingScheduler()
+    attach_scheduler(scheduler)
+    attach_metrics(scheduler)
+    register(scheduler)
+    scheduler.start()
@@ -3,18 +3,92 @@ import os
 # define fixed rate for running plantbot.py
 INTERVAL = 10
 
+# components of `plantbot.py run` (enabled by default, can be overwritten via ENV PLANTBOT_COMPONENTS or --components)
+COMPONENTS = ['polling', 'alert', 'display', 'listen']
+OPTIONAL_COMPONENTS = ['collector']  # only enabled via PLANTBOT_COMPONENTS or --components
+
 # define slack channel + emojis
 CHANNEL = "general"
 EMOJI_LIST = ["herb", "seedling", "leaves", "fallen_leaf"]
 
+# sensor polling
+POLL_WORKERS = 4  # maximum number of sensors read concurrently
+POLL_TIMEOUT = 30  # time budget per sensor read [s]
+DEVICE_INFO_TTL = 24 * 60 * 60  # age of cached battery level + firmware version of a sensor before re-reading [s]
+
+# sensor health (backoff + circuit breaker for failing sensors, see health.py)
+HEALTH_BACKOFF = 5 * 60  # wait after the second consecutive failure, doubling with every further one [s]
+HEALTH_MAX_BACKOFF = 2 * 60 * 60  # [s]
+HEALTH_BREAKER_FAILURES = 5  # consecutive failures opening the circuit (i.e. the sensor is skipped)
+HEALTH_BREAKER_COOLDOWN = 6 * 60 * 60  # time between two probes of a sensor with an open circuit [s]
+
+# plausible range per measurement (anything outside counts as a failed read)
+READING_RANGES = {'temperature': (-40, 80), 'moisture': (0, 100), 'light': (0, 200000), 'conductivity': (0, 20000),
+                  'battery': (0, 100)}
+
+# adaptive polling (per-sensor intervals from the recent change rate, see adaptive.py)
+ADAPTIVE_POLLING = True  # False for the fixed schedule (every INTERVAL minutes between sunrise and sunset, else hourly)
+POLL_TICK = 5  # scheduler tick, i.e. granularity of the per-sensor intervals [min]
+POLL_MIN_INTERVAL = 10  # [min]
+POLL_MAX_INTERVAL = 120  # [min]
+POLL_HISTORY = 6 * 60 * 60  # time span of the readings the change rate is estimated from [s]
+POLL_MOISTURE_STEP = 1  # moisture change expected between two reads [%]
+POLL_LIGHT_STEP = 0.5  # light change expected between two reads (daylight only) [log(lux)]
+BATTERY_LOW = 20  # battery level doubling the interval [%]
+BATTERY_CRITICAL = 10  # battery level quadrupling the interval [%]
+
+# alert deduplication (see alerts.py)
+ALERT_HYSTERESIS = 5  # moisture above min_moisture required before a thirsty plant counts as watered [%]
+ALERT_COOLDOWN = 6 * 60 * 60  # minimum time between repeated alerts of a thirsty plant [s]
+ALERT_LEAD = 12 * 60 * 60  # heads-up before a plant is predicted to cross its min_moisture [s]
+
+# watering prediction (see analytics.py)
+ANALYTICS_WINDOW = 30 * 24 * 60 * 60  # time span of the moisture series used for fitting [s]
+ANALYTICS_MIN_POINTS = 6  # minimum number of readings since the last watering for a drying rate fit
+WATERING_STEP = 10  # moisture increase between two readings counting as watering [%]
+
+# metrics (Prometheus text file per process, e.g. for node_exporter's textfile collector, see metrics.py)
+METRICS_PATH = './data/metrics/{process}.prom'
+METRICS_INTERVAL = 60  # export interval [s]
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)  # histogram buckets [s]
+
+# sunrise/sunset table (see utils/daylight.py)
+SUN_TABLE_PATH = './data/sun_table.json'
+SUN_TABLE_DAYS = 400  # local dates covered by the table (rebuilt when outside of it)
+
 # plant definition file
 PLANT_DEF = './data/plant_def.json'
 DB_PATH = './data/plantbot.sqlite'
 
+# history (hourly + daily rollups of the raw readings, see db.py)
+RAW_RETENTION = 90 * 24 * 60 * 60  # age of raw readings before they are pruned (rollups are kept) [s]
+ROLLUP_POINTS = 500  # default point budget of a history query
+EXPORT_CHUNK = 10000  # measurements per chunk of a streamed export (see `db.iter_data` + export.py)
+
+# ingestion (buffered writes, see ingest.py)
+JOURNAL_PATH = './data/ingest.journal'
+FLUSH_INTERVAL = 300  # maximum age of a buffered reading before it is committed [s]
+
+# multi-node (edge nodes forward their readings to a central collector, see collector.py)
+COLLECTOR_HOST = '127.0.0.1'  # listen address of the collector component (any other requires a token)
+COLLECTOR_PORT = 8086
+COLLECTOR_MAX_BODY = 1024 * 1024  # maximum size of a batch [bytes]
+FORWARD_JOURNAL_PATH = './data/forward.journal'  # readings of an edge node not accepted by the collector yet
+FORWARD_REJECTED_PATH = './data/forward.rejected'  # readings rejected by the collector (journal format)
+FORWARD_BATCH = 1000  # maximum readings per request
+FORWARD_TIMEOUT = 10  # time budget per request [s]
+FORWARD_BACKOFF = 30  # wait after a failed request, doubling with every further one [s]
+FORWARD_MAX_BACKOFF = 15 * 60  # [s]
+
+# summary cache (recent readings in memory for the Slack commands, see summary.py)
+SUMMARY_WINDOW = 7 * 24 * 60 * 60  # time span of cached readings per plant [s]
+SUMMARY_SYNC = 60  # interval for picking up readings committed by another process [s]
+
 # general images
 ASSET_PATH = './assets'
 PLANT_ICON_PATH = os.path.join(ASSET_PATH, 'plant_icons')
 LOGO_PATH = os.path.join(ASSET_PATH, 'logo.png')
+ASSET_CACHE_PATH = './data/asset_cache'  # rendered (resized + quantized) assets, None to keep them in memory only
 
 # moisture icons
 MOISTURE_ICON_PATH = os.path.join(ASSET_PATH, 'moisture_icons')
@@ -26,7 +100,24 @@ MAX_LUX = 107527  # as per -> https://www.engineeringtoolbox.com/light-level-roo
 LIGHT_ICON_PATH = os.path.join(ASSET_PATH, 'light_icons')
 SUN_PATH = os.path.join(LIGHT_ICON_PATH, 'sun.png')
 MOON_PATH = os.path.join(LIGHT_ICON_PATH, 'moon.jpg')
+SUN_STEPS = 5  # number of sun icon sizes (between min and max light)
+
+# inky refresh (skip e-ink refresh unless the frame changed meaningfully)
+REFRESH_MOISTURE_DELTA = 2  # [%]
+REFRESH_TEMPERATURE_DELTA = 1  # [°C]
+REFRESH_MAX_AGE = 60  # maximum age of the frame on display [min]
+
+# giphy (see giphy_cache.py)
+GIPHY_CACHE_PATH = './data/giphy_cache.json'
+GIPHY_LIMIT = 100  # number of gif urls cached per search term
+GIPHY_TTL = 24 * 60 * 60  # age of cached gif urls before they are refreshed [s]
 
 # slackbot
-RTM_READ_DELAY = 1  # 1 second delay between reading from RTM
+SLACK_API_URL = "https://slack.com/api"  # can be overwritten via ENV (e.g. local stub server)
+SLACK_CONCURRENCY = 4  # maximum number of concurrent Web API calls
+SLACK_MAX_RETRIES = 3  # retries per call after being rate limited (HTTP 429)
+LISTEN_WORKERS = 2  # worker threads for (DB-bound) command handlers
 MENTION_REGEX = "^<@(|[WU].+?)>(.*)"
+WINDOW_REGEX = "^([0-9]+)([mhdw])$"  # history window, e.g. 30m, 6h, 2d, 1w
+HISTORY_WINDOW = 24 * 60 * 60  # default window of the history command [s]
+SPARK_WIDTH = 24  # maximum number of bars of a history sparkline
@@ -0,0 +1,711 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime as dt
+from datetime import timedelta
+
+from constants import DB_PATH, EXPORT_CHUNK, RAW_RETENTION, ROLLUP_POINTS
+from metrics import timed
+
+FIELDS = ['temperature', 'moisture', 'light', 'conductivity', 'battery']
+
+# rollup resolutions (finest first): table name + bucket size [s] (daily buckets are local days, see `_bucket`)
+HOUR = 60 * 60
+DAY = 24 * HOUR
+ROLLUPS = [('hourly', HOUR), ('daily', DAY)]
+
+# per field aggregates of a rollup bucket (the mean is derived as <field>_sum / n)
+ROLLUP_STATS = ['min', 'max', 'sum', 'last']
+ROLLUP_COLUMNS = ['{}_{}'.format(f, stat) for f in FIELDS for stat in ROLLUP_STATS]
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS plants (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE)""",
+    """
+    CREATE TABLE IF NOT EXISTS measurements (
+        plant_id INTEGER NOT NULL REFERENCES plants (id),
+        ts INTEGER NOT NULL,
+        temperature real NOT NULL,
+        moisture real NOT NULL,
+        light real NOT NULL,
+        conductivity real NOT NULL,
+        battery real NOT NULL,
+        PRIMARY KEY (plant_id, ts)) WITHOUT ROWID""",
+    """
+    CREATE TABLE IF NOT EXISTS alert_state (
+        plant TEXT PRIMARY KEY,
+        state TEXT NOT NULL,
+        since INTEGER NOT NULL,
+        notified INTEGER)""",
+    """
+    CREATE TABLE IF NOT EXISTS sensor_health (
+        plant TEXT PRIMARY KEY,
+        failures INTEGER NOT NULL,
+        since INTEGER NOT NULL,
+        retry_at INTEGER NOT NULL,
+        error TEXT)""",
+    # time range of the new measurements per plant of every insert in commit order (i.e. another process picks up
+    # late readings no matter how old their timestamps are, see `changed_data`)
+    """
+    CREATE TABLE IF NOT EXISTS commit_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        plant_id INTEGER NOT NULL REFERENCES plants (id),
+        first_ts INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        committed INTEGER NOT NULL)"""
+]
+
+# one rollup table per resolution: (plant_id, bucket start) + number of readings, ts of the last reading and the
+# aggregates of every field
+ROLLUP_TABLE = """
+    CREATE TABLE IF NOT EXISTS rollup_{name} (
+        plant_id INTEGER NOT NULL REFERENCES plants (id),
+        bucket INTEGER NOT NULL,
+        n INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        {columns},
+        PRIMARY KEY (plant_id, bucket)) WITHOUT ROWID"""
+
+SCHEMA += [ROLLUP_TABLE.format(name=name, columns=",\n        ".join(c + " real NOT NULL" for c in ROLLUP_COLUMNS))
+           for name, _ in ROLLUPS]
+
+# DB paths with an initialized schema (i.e. skip DDL on every following connection)
+_initialized = set()
+
+
+def connect(path=DB_PATH):
+    """
+    Function for opening the sqlite DB with the single-table layout (i.e. one `measurements` table indexed on
+    (plant_id, ts) for all plants). The schema is created if missing and the DB is switched to WAL mode (once per
+    process).
+
+    Args:
+        path (str): path of the sqlite DB
+
+    Returns:
+        conn (obj): database connection (sqlite, usable from any thread as long as access is serialized)
+
+    """
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if os.path.abspath(path) not in _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        for command in SCHEMA:
+            conn.execute(command)
+        conn.commit()
+        _initialized.add(os.path.abspath(path))
+    return conn
+
+
+def plant_id(conn, plant_name):
+    """
+    Utility for resolving (and registering on first use) the id of a plant.
+
+    Args:
+        conn (obj): database connection (sqlite)
+        plant_name (str): name of plant
+
+    Returns:
+        id (int): plant id used in the `measurements` table
+
+    """
+    conn.execute("INSERT OR IGNORE INTO plants (name) VALUES (?)", (plant_name,))
+    return conn.execute("SELECT id FROM plants WHERE name = ?", (plant_name,)).fetchone()[0]
+
+
+class Database(object):
+    """
+    Long-lived sqlite session shared by all jobs of a process. The connection is opened lazily, every access is
+    serialized with a lock (i.e. safe for the APScheduler thread pool) and statements are kept as constant strings so
+    that sqlite's per-connection statement cache re-uses the prepared statements. Plant ids are cached after their
+    first lookup.
+
+    Args:
+        path (str): path of the sqlite DB
+
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.RLock()
+        self._plant_ids = {}
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager yielding the connection inside a transaction (committed on success, rolled back on error).
+
+        """
+        with self._lock:
+            if self._conn is None:
+                self._conn = connect(self.path)
+            with self._conn:
+                yield self._conn
+
+    def query(self, command, params=()):
+        """
+        Utility for running a read query.
+
+        Returns:
+            out (list): all rows of the result
+
+        """
+        with self.transaction() as conn:
+            return conn.execute(command, params).fetchall()
+
+    def plant_id(self, conn, plant_name):
+        """
+        Utility for resolving the id of a plant (cached, see `plant_id`).
+
+        """
+        if plant_name not in self._plant_ids:
+            self._plant_ids[plant_name] = plant_id(conn, plant_name)
+        return self._plant_ids[plant_name]
+
+    def close(self):
+        """
+        Close the connection (it is re-opened on the next access).
+
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._plant_ids.clear()
+
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def get_db():
+    """
+    Function for getting the shared DB session of this process.
+
+    Returns:
+        db (obj): shared `Database` instance
+
+    """
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = Database()
+        return _db
+
+
+def close_db():
+    """
+    Function for closing the shared DB session (lifecycle hook for shutdown).
+
+    """
+    with _db_lock:
+        if _db is not None:
+            _db.close()
+
+
+def attach_scheduler(scheduler):
+    """
+    Function for tying the shared DB session to the lifecycle of an APScheduler scheduler (i.e. the connection is
+    closed when the scheduler shuts down).
+
+    Args:
+        scheduler (obj): APScheduler scheduler
+
+    """
+    from apscheduler.events import EVENT_SCHEDULER_SHUTDOWN
+
+    scheduler.add_listener(lambda event: close_db(), EVENT_SCHEDULER_SHUTDOWN)
+
+
+atexit.register(close_db)
+
+INSERT_MEASUREMENT = """
+    INSERT OR IGNORE INTO measurements (
+        plant_id,
+        ts,
+        temperature,
+        moisture,
+        light,
+        conductivity,
+        battery)
+    VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+SELECT_LATEST = """
+    SELECT m.ts, m.temperature, m.moisture, m.light, m.conductivity, m.battery
+    FROM measurements m JOIN plants p ON p.id = m.plant_id
+    WHERE p.name = ?
+    ORDER BY m.ts DESC LIMIT ?"""
+
+SELECT_RANGE = """
+    SELECT m.ts, m.temperature, m.moisture, m.light, m.conductivity, m.battery
+    FROM measurements m JOIN plants p ON p.id = m.plant_id
+    WHERE p.name = ? AND m.ts >= ? AND m.ts < ?
+    ORDER BY m.ts"""
+
+SELECT_LATEST_ALL = """
+    SELECT p.name, m.ts, m.temperature, m.moisture, m.light, m.conductivity, m.battery
+    FROM plants p JOIN measurements m ON m.plant_id = p.id
+    WHERE m.ts IN (SELECT ts FROM measurements WHERE plant_id = p.id ORDER BY ts DESC LIMIT ?)"""
+
+SELECT_SINCE = """
+    SELECT p.name, m.ts, m.temperature, m.moisture, m.light, m.conductivity, m.battery
+    FROM plants p CROSS JOIN measurements m ON m.plant_id = p.id
+    WHERE m.ts > ?
+    ORDER BY p.id, m.ts"""
+
+INSERT_COMMIT = "INSERT INTO commit_log (plant_id, first_ts, last_ts, committed) VALUES (?, ?, ?, ?)"
+
+SELECT_COMMITS = """
+    SELECT c.seq, p.name, c.plant_id, c.first_ts, c.last_ts
+    FROM commit_log c JOIN plants p ON p.id = c.plant_id
+    WHERE c.seq > ? AND c.last_ts >= ?
+    ORDER BY c.seq"""
+
+SELECT_RANGE_ID = """
+    SELECT ts, temperature, moisture, light, conductivity, battery
+    FROM measurements
+    WHERE plant_id = ? AND ts >= ? AND ts <= ?
+    ORDER BY ts"""
+
+# one chunk of a streamed export (keyset pagination on the (plant_id, ts) primary key)
+SELECT_CHUNK = """
+    SELECT ts, temperature, moisture, light, conductivity, battery
+    FROM measurements
+    WHERE plant_id = ? AND ts >= ? AND ts < ?
+    ORDER BY ts LIMIT ?"""
+
+# same for the range beyond the raw retention (hourly means, see `iter_data`)
+SELECT_ROLLUP_CHUNK = """
+    SELECT bucket, {means}
+    FROM rollup_hourly
+    WHERE plant_id = ? AND bucket >= ? AND bucket < ?
+    ORDER BY bucket LIMIT ?""".format(means=", ".join("{}_sum / n".format(f) for f in FIELDS))
+
+SELECT_OLDEST = "SELECT min(ts) FROM measurements WHERE plant_id = ?"
+
+# recompute one hourly bucket (plant_id, bucket, start, end) from the raw measurements (i.e. idempotent, duplicate
+# inserts are not counted twice)
+REFRESH_HOURLY = """
+    INSERT OR REPLACE INTO rollup_hourly (plant_id, bucket, n, last_ts, {columns})
+    SELECT a.plant_id, a.bucket, a.n, a.last_ts, {values}
+    FROM (
+        SELECT plant_id, ? AS bucket, count(*) AS n, max(ts) AS last_ts, {aggregates}
+        FROM measurements WHERE plant_id = ? AND ts >= ? AND ts < ?) a
+    JOIN measurements r ON r.plant_id = a.plant_id AND r.ts = a.last_ts""".format(
+    columns=", ".join(ROLLUP_COLUMNS),
+    values=", ".join("r.{}".format(c[:-len('_last')]) if c.endswith('_last') else "a." + c for c in ROLLUP_COLUMNS),
+    aggregates=", ".join("{0}({1}) AS {1}_{2}".format('total' if stat == 'sum' else stat, f, stat)
+                         for f in FIELDS for stat in ROLLUP_STATS if stat != 'last'))
+
+# recompute one daily bucket (plant_id, bucket, start, end, start, end) from its hourly buckets
+REFRESH_DAILY = """
+    INSERT OR REPLACE INTO rollup_daily (plant_id, bucket, n, last_ts, {columns})
+    SELECT a.plant_id, a.bucket, a.n, a.last_ts, {values}
+    FROM (
+        SELECT plant_id, ? AS bucket, total(n) AS n, max(last_ts) AS last_ts, {aggregates}
+        FROM rollup_hourly WHERE plant_id = ? AND bucket >= ? AND bucket < ?) a
+    JOIN rollup_hourly r
+        ON r.plant_id = a.plant_id AND r.bucket >= ? AND r.bucket < ? AND r.last_ts = a.last_ts""".format(
+    columns=", ".join(ROLLUP_COLUMNS),
+    values=", ".join("r." + c if c.endswith('_last') else "a." + c for c in ROLLUP_COLUMNS),
+    aggregates=", ".join("{0}({1}_{2}) AS {1}_{2}".format('total' if stat == 'sum' else stat, f, stat)
+                         for f in FIELDS for stat in ROLLUP_STATS if stat != 'last'))
+
+SELECT_ROLLUP = """
+    SELECT r.bucket, r.n, r.last_ts, {columns}
+    FROM rollup_{{name}} r JOIN plants p ON p.id = r.plant_id
+    WHERE p.name = ? AND r.bucket >= ? AND r.bucket < ?
+    ORDER BY r.bucket""".format(columns=", ".join("r." + c for c in ROLLUP_COLUMNS))
+
+# number of raw measurements within a time range (counted on the hourly rollup, i.e. without touching raw rows)
+COUNT_RAW = """
+    SELECT total(r.n)
+    FROM rollup_hourly r JOIN plants p ON p.id = r.plant_id
+    WHERE p.name = ? AND r.bucket >= ? AND r.bucket < ?"""
+
+DELETE_RAW = """
+    DELETE FROM measurements
+    WHERE plant_id IN (SELECT id FROM plants) AND ts < ?"""
+
+DELETE_COMMITS = "DELETE FROM commit_log WHERE committed < ?"
+
+
+def insert_data(plant_name, data, ts=None):
+    """
+    Function for storing plant measurements to the local sqlite DB.
+
+    Args:
+        plant_name (str): name of plant
+        data (dict): measurements (see `polling.Reading.measurements`)
+        ts (int): epoch timestamp of the measurement (defaults to now)
+
+    """
+    insert_many([(plant_name, int(time.time()) if ts is None else ts, data)])
+
+
+@timed('plantbot_db_seconds', op='insert')
+def insert_many(rows):
+    """
+    Function for storing a batch of plant measurements in a single transaction (i.e. a single commit). A measurement
+    of a plant at an already stored timestamp is ignored (i.e. re-sending a batch is harmless).
+
+    Args:
+        rows (list): (plant name, epoch timestamp, measurements) tuples
+
+    Returns:
+        n (int): number of inserted (i.e. new) measurements
+
+    """
+    db = get_db()
+    with db.transaction() as conn:
+        rows = [(db.plant_id(conn, name), int(ts)) + tuple(data[f] for f in FIELDS) for name, ts, data in rows]
+        before = conn.total_changes
+        conn.executemany(INSERT_MEASUREMENT, rows)
+        n = conn.total_changes - before
+        if n:
+            _log_commit(conn, rows)
+        _refresh_rollups(conn, set((row[0], row[1]) for row in rows))
+    return n
+
+
+def _log_commit(conn, rows):
+    """
+    Utility for appending the time range per plant of a batch of (plant_id, ts, ...) rows to the commit log (inside the
+    transaction of the insert).
+
+    """
+    ranges = {}
+    for row in rows:
+        first, last = ranges.get(row[0], (row[1], row[1]))
+        ranges[row[0]] = (min(first, row[1]), max(last, row[1]))
+    now = int(time.time())
+    conn.executemany(INSERT_COMMIT, [(pid, first, last, now) for pid, (first, last) in ranges.items()])
+
+
+def _bucket(ts, size):
+    """
+    Utility for the start + end of the rollup bucket containing an epoch timestamp. Daily buckets are local days (i.e.
+    match the dates shown for them, 23 or 25 hours on a DST change), all others are aligned to UTC.
+
+    """
+    if size != DAY:
+        start = ts - ts % size
+        return start, start + size
+    day = dt.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(day.timestamp()), int((day + timedelta(days=1)).timestamp())
+
+
+def _raw_cutoff(now=None):
+    """
+    Utility for the start of the raw retention (aligned to a daily bucket, i.e. no bucket is ever partially pruned).
+
+    """
+    return _bucket((int(time.time()) if now is None else int(now)) - RAW_RETENTION, DAY)[0]
+
+
+def _refresh_days(conn, hours):
+    """
+    Utility for recomputing the daily buckets containing a set of (plant_id, hourly bucket) keys.
+
+    """
+    days = set((pid, _bucket(b, DAY)) for pid, b in hours)
+    conn.executemany(REFRESH_DAILY, [(start, pid, start, end, start, end) for pid, (start, end) in days])
+
+
+def _refresh_buckets(conn, hours):
+    """
+    Utility for recomputing a set of (plant_id, hourly bucket) keys and the daily buckets containing them.
+
+    """
+    conn.executemany(REFRESH_HOURLY, [(b, pid, b, b + HOUR) for pid, b in hours])
+    _refresh_days(conn, hours)
+
+
+def _refresh_rollups(conn, keys):
+    """
+    Utility for refreshing the rollup buckets touched by a set of (plant_id, ts) keys (inside the transaction of the
+    insert). Readings older than the raw retention are skipped (i.e. the raw rows of their buckets are gone).
+
+    """
+    cutoff = _raw_cutoff()
+    _refresh_buckets(conn, set((pid, ts - ts % HOUR) for pid, ts in keys if ts >= cutoff))
+
+
+def rebuild_rollups(conn):
+    """
+    Function for (re-)building the rollup buckets of all raw measurements, e.g. after a migration. Daily buckets are
+    rebuilt from all hourly ones (i.e. re-aligned to the local days of the current time zone).
+
+    Args:
+        conn (obj): database connection (sqlite)
+
+    Returns:
+        n (int): number of hourly buckets
+
+    """
+    hours = conn.execute("SELECT DISTINCT plant_id, ts - ts % ? FROM measurements", (HOUR,)).fetchall()
+    conn.executemany(REFRESH_HOURLY, [(b, pid, b, b + HOUR) for pid, b in hours])
+
+    # daily buckets are rebuilt from all hourly buckets, i.e. also beyond the raw retention (e.g. after a change of the
+    # time zone)
+    conn.execute("DELETE FROM rollup_daily")
+    _refresh_days(conn, conn.execute("SELECT plant_id, bucket FROM rollup_hourly").fetchall())
+    return len(hours)
+
+
+def prune_raw(now=None):
+    """
+    Function for the retention policy: raw measurements older than `RAW_RETENTION` are deleted (their hourly + daily
+    rollups are kept), as well as commit log entries older than a day (see `changed_data`).
+
+    Args:
+        now (int): epoch timestamp (defaults to now)
+
+    Returns:
+        n (int): number of deleted measurements
+
+    """
+    with get_db().transaction() as conn:
+        conn.execute(DELETE_COMMITS, ((int(time.time()) if now is None else int(now)) - DAY,))
+        return conn.execute(DELETE_RAW, (_raw_cutoff(now),)).rowcount
+
+
+def _retention_job():
+    logging.info('[retention] -> Pruned {} raw measurements'.format(prune_raw()))
+
+
+def attach_retention(scheduler):
+    """
+    Function for running the retention policy (`prune_raw`) daily at midnight on a scheduler of a process storing
+    readings in the DB (i.e. the polling or the collector component), first run right away. Attaching it again (e.g.
+    both components in one process) replaces the job.
+
+    Args:
+        scheduler (obj): APScheduler scheduler
+
+    """
+    from apscheduler.triggers.cron import CronTrigger
+
+    scheduler.add_job(_retention_job, CronTrigger(minute='0', hour='0', day='*', month='*', day_of_week='*'),
+                      id='retention', replace_existing=True, next_run_time=dt.now())
+
+
+def _to_dict(row):
+    """
+    Utility for converting a (ts, temperature, moisture, light, conductivity, battery) row into a measurement
+    dictionary. The formatted local `date` is kept for backwards compatibility with the per-plant table layout.
+
+    """
+    out = {'ts': row[0], 'date': dt.fromtimestamp(row[0]).strftime("%Y/%m/%d, %H:%M:%S")}
+    out.update(zip(FIELDS, row[1:]))
+    return out
+
+
+@timed('plantbot_db_seconds', op='latest')
+def latest_data(plant_name, num=1):
+    """
+    Function for extracting the latest plant measurements (by time).
+
+    Args:
+        plant_name (str): name of plant
+        num (int): number of latest measurements to extract for analysis
+
+    Returns:
+        out (list): contains a list of dictionaries containing plant measurements (newest first)
+
+    """
+    return [_to_dict(row) for row in get_db().query(SELECT_LATEST, (plant_name, num))]
+
+
+def range_data(plant_name, start, end=None):
+    """
+    Function for extracting all plant measurements within a time range.
+
+    Args:
+        plant_name (str): name of plant
+        start (int): epoch timestamp (inclusive)
+        end (int): epoch timestamp (exclusive, defaults to now)
+
+    Returns:
+        out (list): contains a list of dictionaries containing plant measurements (oldest first)
+
+    """
+    end = int(time.time()) + 1 if end is None else end
+    return [_to_dict(row) for row in get_db().query(SELECT_RANGE, (plant_name, int(start), int(end)))]
+
+
+@timed('plantbot_db_seconds', op='latest_all')
+def latest_data_all(plant_names=None, num=1):
+    """
+    Function for extracting the latest measurements of every plant with a single query over the shared connection.
+    Every plant costs one seek on the (plant_id, ts) primary key.
+
+    Args:
+        plant_names (list): names of plants to include (defaults to all plants in the DB)
+        num (int): number of latest measurements to extract per plant
+
+    Returns:
+        out (dict): plant name -> list of dictionaries containing plant measurements (newest first)
+
+    """
+    command = SELECT_LATEST_ALL
+    params = [num]
+    if plant_names is not None:
+        plant_names = list(plant_names)
+        command += " AND p.name IN ({})".format(", ".join("?" * len(plant_names)))
+        params += plant_names
+    command += " ORDER BY p.name, m.ts DESC"
+
+    out = {}
+    for row in get_db().query(command, params):
+        out.setdefault(row[0], []).append(_to_dict(row[1:]))
+    return out
+
+
+@timed('plantbot_db_seconds', op='since')
+def since_data(start):
+    """
+    Function for extracting the measurements of every plant newer than a timestamp with a single query (one range
+    seek on the (plant_id, ts) primary key per plant).
+
+    Args:
+        start (int): epoch timestamp (exclusive)
+
+    Returns:
+        out (dict): plant name -> list of dictionaries containing plant measurements (oldest first)
+
+    """
+    out = {}
+    for row in get_db().query(SELECT_SINCE, (int(start),)):
+        out.setdefault(row[0], []).append(_to_dict(row[1:]))
+    return out
+
+
+def commit_seq():
+    """
+    Function for the current position of the commit log (see `changed_data`).
+
+    Returns:
+        seq (int): sequence number of the last commit (0 for none)
+
+    """
+    return get_db().query("SELECT coalesce(max(seq), 0) FROM commit_log")[0][0]
+
+
+def changed_data(seq, start=0):
+    """
+    Function for extracting the measurements committed after a position of the commit log, i.e. in commit order
+    instead of by timestamp (e.g. readings of an edge node catching up after an outage or of a retried flush).
+    Every logged commit costs one range seek on the (plant_id, ts) primary key.
+
+    Args:
+        seq (int): position in the commit log (exclusive, see `commit_seq`)
+        start (int): epoch timestamp, older measurements are skipped
+
+    Returns:
+        seq (int): position of the last returned commit (i.e. `seq` of the next call)
+        out (dict): plant name -> list of dictionaries containing plant measurements (oldest first)
+
+    """
+    out = {}
+    with get_db().transaction() as conn:
+        for seq, name, pid, first_ts, last_ts in conn.execute(SELECT_COMMITS, (seq, start)).fetchall():
+            readings = out.setdefault(name, {})
+            for row in conn.execute(SELECT_RANGE_ID, (pid, max(first_ts, start), last_ts)):
+                readings[row[0]] = _to_dict(row)
+    return seq, {name: [readings[ts] for ts in sorted(readings)] for name, readings in out.items()}
+
+
+def iter_data(plant_names=None, start=None, end=None, chunk=EXPORT_CHUNK):
+    """
+    Generator for streaming measurements in chunks (plant by plant, oldest first), e.g. for exporting the full
+    history. Every chunk is a separate seek on the (plant_id, ts) primary key continuing after the last returned
+    timestamp, i.e. memory is bounded by `chunk` no matter how much history is read and the shared connection is only
+    held while a chunk is fetched (not while the caller processes it). Raw measurements older than `RAW_RETENTION` are
+    pruned, i.e. the range before the oldest raw measurement of a plant is read from the hourly rollup instead (mean
+    per field, resolution 'hourly').
+
+    Args:
+        plant_names (list): names of plants to include (defaults to all plants in the DB, unknown names are skipped)
+        start (int): epoch timestamp (inclusive, defaults to the oldest measurement)
+        end (int): epoch timestamp (exclusive, defaults to now)
+        chunk (int): maximum number of measurements per chunk
+
+    Returns:
+        rows (generator): lists of (plant name, ts, resolution, temperature, moisture, light, conductivity, battery)
+            tuples (resolution 'raw' or 'hourly')
+
+    """
+    start = 0 if start is None else int(start)
+    end = int(time.time()) + 1 if end is None else int(end)
+    plants = get_db().query("SELECT id, name FROM plants ORDER BY name")
+    if plant_names is not None:
+        plant_names = set(plant_names)
+        plants = [(pid, name) for pid, name in plants if name in plant_names]
+
+    for pid, name in plants:
+        oldest = get_db().query(SELECT_OLDEST, (pid,))[0][0]
+        split = end if oldest is None else max(start, min(end, oldest - oldest % HOUR))
+        for command, resolution, ts, stop in [(SELECT_ROLLUP_CHUNK, 'hourly', start, split),
+                                              (SELECT_CHUNK, 'raw', split, end)]:
+            while ts < stop:
+                rows = get_db().query(command, (pid, ts, stop, chunk))
+                if not rows:
+                    break
+                yield [(name, row[0], resolution) + row[1:] for row in rows]
+                if len(rows) < chunk:
+                    break
+                ts = rows[-1][0] + 1
+
+
+def _rollup_dict(row):
+    """
+    Utility for converting a rollup row into a dictionary: `ts`/`date` of the bucket start, the number of readings `n`
+    and per field the mean (as <field>) plus <field>_min, <field>_max and <field>_last.
+
+    """
+    out = {'ts': row[0], 'date': dt.fromtimestamp(row[0]).strftime("%Y/%m/%d, %H:%M:%S"), 'n': row[1],
+           'last_ts': row[2]}
+    out.update(zip(ROLLUP_COLUMNS, row[3:]))
+    for f in FIELDS:
+        out[f] = out.pop(f + '_sum') / row[1]
+    return out
+
+
+@timed('plantbot_db_seconds', op='history')
+def history_data(plant_name, start, end=None, points=ROLLUP_POINTS):
+    """
+    Function for extracting the measurements of a plant within a time range at the finest resolution that fits into
+    a point budget: raw readings, hourly or daily rollups. Raw readings are only used for ranges within the raw
+    retention, and their number is counted on the hourly rollup (i.e. without scanning raw rows).
+
+    Args:
+        plant_name (str): name of plant
+        start (int): epoch timestamp (inclusive)
+        end (int): epoch timestamp (exclusive, defaults to now)
+        points (int): maximum number of returned measurements
+
+    Returns:
+        resolution (str): 'raw', 'hourly' or 'daily'
+        out (list): list of dictionaries containing plant measurements (oldest first, see `_rollup_dict` for rollups)
+
+    """
+    start = int(start)
+    end = int(time.time()) + 1 if end is None else int(end)
+
+    if start >= _raw_cutoff():
+        n = get_db().query(COUNT_RAW, (plant_name, start - start % HOUR, end))[0][0]
+        if n <= points:
+            return 'raw', range_data(plant_name, start, end)
+
+    for name, size in ROLLUPS:
+        if (end - start) // size <= points or name == ROLLUPS[-1][0]:
+            rows = get_db().query(SELECT_ROLLUP.format(name=name), (plant_name, _bucket(start, size)[0], end))
+            return name, [_rollup_dict(row) for row in rows]
@@ -0,0 +1,140 @@
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+from datetime import datetime as dt
+
+from constants import EXPORT_CHUNK
+from db import FIELDS, iter_data
+
+COLUMNS = ['plant', 'ts', 'resolution'] + FIELDS
+FORMATS = ['csv', 'parquet', 'arrow']
+
+
+def write_csv(chunks, dst):
+    """
+    Function for writing streamed measurements as CSV (header + one line per measurement, epoch timestamps).
+
+    Args:
+        chunks (iter): lists of (plant name, ts, resolution, <FIELDS>) tuples (see `db.iter_data`)
+        dst (obj): text file object
+
+    Returns:
+        n (int): number of written measurements
+
+    """
+    writer = csv.writer(dst)
+    writer.writerow(COLUMNS)
+    n = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        n += len(rows)
+    return n
+
+
+def write_arrow(chunks, path, fmt='parquet'):
+    """
+    Function for writing streamed measurements as Parquet or Arrow IPC (Feather v2) file, one record batch (row group)
+    per chunk. `ts` is stored as UTC timestamp, pyarrow is only imported here (i.e. optional for everything else).
+
+    Args:
+        chunks (iter): lists of (plant name, ts, resolution, <FIELDS>) tuples (see `db.iter_data`)
+        path (str): output file
+        fmt (str): 'parquet' or 'arrow'
+
+    Returns:
+        n (int): number of written measurements
+
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError('pyarrow is required for {} exports (pip install pyarrow)'.format(fmt))
+
+    schema = pa.schema([('plant', pa.string()), ('ts', pa.timestamp('s', tz='UTC')), ('resolution', pa.string())] +
+                       [(f, pa.float64()) for f in FIELDS])
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(path, schema)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+
+    n = 0
+    with writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays([pa.array(col, type=field.type) for col, field in zip(
+                columns, schema)], schema=schema))
+            n += len(rows)
+    return n
+
+
+def export(path, fmt=None, plant_names=None, start=None, end=None, chunk=EXPORT_CHUNK):
+    """
+    Function for exporting measurements to a file with constant memory (streamed in chunks of `chunk` measurements,
+    see `db.iter_data`). Ranges older than the raw retention are exported as hourly means (column `resolution`).
+
+    Args:
+        path (str): output file ('-' for CSV to stdout)
+        fmt (str): 'csv', 'parquet' or 'arrow' (defaults to the file extension, else CSV)
+        plant_names (list): names of plants to include (defaults to all plants in the DB)
+        start (int): epoch timestamp (inclusive, defaults to the oldest measurement)
+        end (int): epoch timestamp (exclusive, defaults to now)
+        chunk (int): measurements per chunk
+
+    Returns:
+        n (int): number of exported measurements
+
+    """
+    if fmt is None:
+        ext = os.path.splitext(path)[1].lstrip('.').lower()
+        fmt = {'feather': 'arrow', 'pq': 'parquet'}.get(ext, ext) if ext in FORMATS + ['feather', 'pq'] else 'csv'
+    if fmt not in FORMATS:
+        raise ValueError('Unknown format: {}'.format(fmt))
+
+    chunks = iter_data(plant_names, start, end, chunk)
+    if fmt != 'csv':
+        return write_arrow(chunks, path, fmt)
+    if path == '-':
+        return write_csv(chunks, sys.stdout)
+    with open(path, 'w', newline='') as dst:
+        return write_csv(chunks, dst)
+
+
+def _timestamp(text):
+    """
+    Utility for parsing an epoch timestamp or a local ISO date/datetime (e.g. 2020-05-01 or 2020-05-01T12:00).
+
+    """
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return int(dt.fromisoformat(text).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected an epoch timestamp or ISO date, got {!r}'.format(text))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s:%(levelname)s:%(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Export measurements (streamed, constant memory)')
+    parser.add_argument('path', help="output file ('-' for CSV to stdout)")
+    parser.add_argument('--format', choices=FORMATS, default=None, help='defaults to the file extension, else csv')
+    parser.add_argument('--plants', nargs='+', default=None, help='plant names (default: all)')
+    parser.add_argument('--start', type=_timestamp, default=None, help='epoch timestamp or local ISO date (inclusive)')
+    parser.add_argument('--end', type=_timestamp, default=None, help='epoch timestamp or local ISO date (exclusive)')
+    parser.add_argument('--chunk', type=int, default=EXPORT_CHUNK, help='measurements per chunk')
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    try:
+        n = export(args.path, fmt=args.format, plant_names=args.plants, start=args.start, end=args.end,
+                   chunk=args.chunk)
+    except ImportError as e:
+        parser.error(str(e))
+    logging.info('[export] -> Exported {} measurements to {} in {:.1f}s'.format(n, args.path,
+                                                                                time.monotonic() - started))
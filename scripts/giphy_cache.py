@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from constants import GIPHY_CACHE_PATH, GIPHY_LIMIT, GIPHY_TTL
+
+
+class GiphySearch(object):
+    """
+    Giphy API backend returning the gif urls for a search term.
+
+    Args:
+        api_key (str): giphy API key
+
+    """
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def __call__(self, term, limit):
+        # giphypop is only needed on a cache refresh (i.e. imported on first use)
+        import giphypop
+
+        urls = []
+        try:
+            for gif in giphypop.Giphy(api_key=self.api_key).search(term, limit=limit):
+                urls.append(gif.media_url)
+        except RuntimeError:
+            # giphypop ends its generator with StopIteration (i.e. RuntimeError as of PEP 479)
+            pass
+        return urls
+
+
+class FixtureBackend(object):
+    """
+    Recorded backend (e.g. for tests) returning gif urls from a JSON file of {term: [url, ...]}.
+
+    Args:
+        path (str): path of the JSON fixture
+
+    """
+
+    def __init__(self, path):
+        with open(path, 'r') as src:
+            self.fixture = json.load(src)
+        self.calls = 0
+
+    def __call__(self, term, limit):
+        self.calls += 1
+        return self.fixture.get(term, [])[:limit]
+
+
+class GiphyCache(object):
+    """
+    Local cache of gif urls per search term. Picking a gif is a random choice from the cached urls; results older
+    than `ttl` are refreshed in the background (i.e. the stale urls keep being served meanwhile). If the backend is
+    unreachable the stale urls are kept, and without any cached urls no gif is returned.
+
+    Args:
+        backend (func): callable returning the gif urls for (term, limit) (see `GiphySearch` and `FixtureBackend`)
+        ttl (int): time before the urls of a term are refreshed [s]
+        limit (int): number of urls cached per term
+        persist_path (str): JSON file for persisting the cache across restarts (None for memory only)
+
+    """
+
+    def __init__(self, backend, ttl=GIPHY_TTL, limit=GIPHY_LIMIT, persist_path=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.limit = limit
+        self.persist_path = persist_path
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+        if persist_path is not None and os.path.exists(persist_path):
+            try:
+                with open(persist_path, 'r') as src:
+                    self._entries = json.load(src)
+            except ValueError:
+                logging.error('[GiphyCache] -> Ignoring corrupt cache {}'.format(persist_path))
+
+    def _persist(self):
+        if self.persist_path is None:
+            return
+        try:
+            with open(self.persist_path + '.tmp', 'w') as dst:
+                json.dump(self._entries, dst)
+            os.replace(self.persist_path + '.tmp', self.persist_path)
+        except OSError:
+            logging.exception('[GiphyCache] -> Unable to persist {}'.format(self.persist_path))
+
+    def refresh(self, term):
+        """
+        Fetch the urls of a search term from the backend (keeping the cached urls if that fails).
+
+        """
+        try:
+            urls = self.backend(term, self.limit)
+        except Exception as e:
+            logging.error('[GiphyCache] -> Refresh of "{}" failed: {}'.format(term, repr(e)))
+            urls = None
+
+        with self._lock:
+            self._refreshing.discard(term)
+            if urls:
+                self._entries[term] = {'fetched': time.time(), 'urls': urls}
+                self._persist()
+
+    def urls(self, term):
+        """
+        Cached urls of a search term (fetched right away if nothing is cached yet).
+
+        """
+        with self._lock:
+            entry = self._entries.get(term)
+            stale = entry is not None and time.time() - entry['fetched'] >= self.ttl
+            if stale and term not in self._refreshing:
+                self._refreshing.add(term)
+                threading.Thread(target=self.refresh, args=(term,), daemon=True).start()
+
+        if entry is None:
+            self.refresh(term)
+            entry = self._entries.get(term)
+        return entry['urls'] if entry is not None else []
+
+    def pick(self, term):
+        """
+        Random gif url for a search term.
+
+        Returns:
+            url (str): gif url (None if no urls are available, e.g. offline)
+
+        """
+        urls = self.urls(term)
+        return random.choice(urls) if urls else None
+
+
+_cache = None
+
+
+def get_giphy_cache():
+    """
+    Function for getting the shared (persisted) giphy cache of this process.
+
+    """
+    global _cache
+    if _cache is None:
+        _cache = GiphyCache(GiphySearch(os.environ.get("GIPHY_KEY")), persist_path=GIPHY_CACHE_PATH)
+    return _cache
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+
+from constants import HEALTH_BACKOFF, HEALTH_MAX_BACKOFF, HEALTH_BREAKER_FAILURES, HEALTH_BREAKER_COOLDOWN
+from db import get_db
+from metrics import get_metrics
+
+
+class SensorHealth(object):
+    """
+    Persistent (sqlite) read health of every sensor. A failed read is retried on the next sweep, further consecutive
+    failures back off exponentially (`backoff`, doubling up to `max_backoff`) and after `failures` consecutive failures
+    the circuit opens: the sensor is skipped for `cooldown` seconds, then probed with a single read (closing the
+    circuit on success, re-opening it on failure). Sensors without failures cost nothing (no rows, no writes).
+
+    Args:
+        backoff (int): wait after the second consecutive failure [s]
+        max_backoff (int): maximum wait while the circuit is closed [s]
+        failures (int): consecutive failures opening the circuit
+        cooldown (int): time the circuit stays open [s]
+
+    """
+
+    def __init__(self, backoff=HEALTH_BACKOFF, max_backoff=HEALTH_MAX_BACKOFF, failures=HEALTH_BREAKER_FAILURES,
+                 cooldown=HEALTH_BREAKER_COOLDOWN):
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = failures
+        self.cooldown = cooldown
+        self._states = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._states is None:
+            rows = get_db().query("SELECT plant, failures, since, retry_at, error FROM sensor_health")
+            self._states = {row[0]: {'failures': row[1], 'since': row[2], 'retry_at': row[3], 'error': row[4]}
+                            for row in rows}
+        return self._states
+
+    def _save(self, plant_name):
+        rec = self._states.get(plant_name)
+        with get_db().transaction() as conn:
+            if rec is None:
+                conn.execute("DELETE FROM sensor_health WHERE plant = ?", (plant_name,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO sensor_health (plant, failures, since, retry_at, error) "
+                             "VALUES (?, ?, ?, ?, ?)", (plant_name, rec['failures'], rec['since'], rec['retry_at'],
+                                                        rec['error']))
+
+    def get(self, plant_name):
+        """
+        Health record of a sensor (None if its last read succeeded).
+
+        Returns:
+            rec (dict): consecutive `failures`, `since` (epoch timestamp of the first one), `retry_at` (epoch
+                timestamp) and the last `error`
+
+        """
+        with self._lock:
+            rec = self._load().get(plant_name)
+            return None if rec is None else dict(rec)
+
+    def is_open(self, plant_name):
+        """
+        Whether the circuit of a sensor is open (i.e. it is only probed every `cooldown` seconds).
+
+        """
+        rec = self.get(plant_name)
+        return rec is not None and rec['failures'] >= self.failures
+
+    def allow(self, plant_name, now=None):
+        """
+        Whether a sensor should be read now.
+
+        """
+        now = int(time.time()) if now is None else int(now)
+        with self._lock:
+            rec = self._load().get(plant_name)
+            return rec is None or now >= rec['retry_at']
+
+    def success(self, plant_name, now=None):
+        """
+        Record a successful read (closes the circuit).
+
+        """
+        with self._lock:
+            rec = self._load().pop(plant_name, None)
+            if rec is None:
+                return
+            self._save(plant_name)
+        logging.info('[SensorHealth] -> {} recovered after {} failures'.format(plant_name, rec['failures']))
+
+    def failure(self, plant_name, error, now=None):
+        """
+        Record a failed read and plan the next attempt.
+
+        Returns:
+            retry_at (int): epoch timestamp before which the sensor is skipped
+
+        """
+        now = int(time.time()) if now is None else int(now)
+        with self._lock:
+            rec = self._load().setdefault(plant_name, {'failures': 0, 'since': now, 'retry_at': now, 'error': None})
+            rec['failures'] += 1
+            rec['error'] = error
+            if rec['failures'] >= self.failures:
+                delay = self.cooldown
+            elif rec['failures'] > 1:
+                delay = min(self.max_backoff, self.backoff * 2 ** (rec['failures'] - 2))
+            else:
+                delay = 0
+            rec['retry_at'] = now + delay
+            self._save(plant_name)
+
+        if rec['failures'] == self.failures:
+            get_metrics().inc('plantbot_sensor_circuit_opened_total', plant=plant_name)
+            logging.error('[SensorHealth] -> {} failed {} times in a row, skipping it for {}s ({})'.format(
+                plant_name, rec['failures'], delay, error))
+        return rec['retry_at']
+
+
+_health = None
+_health_lock = threading.Lock()
+
+
+def get_sensor_health():
+    """
+    Function for getting the shared sensor health tracker of this process.
+
+    Returns:
+        health (obj): shared `SensorHealth` instance
+
+    """
+    global _health
+    with _health_lock:
+        if _health is None:
+            _health = SensorHealth()
+        return _health
@@ -0,0 +1,200 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from constants import JOURNAL_PATH, FLUSH_INTERVAL
+from db import insert_many
+from metrics import get_metrics
+from summary import get_summary_cache
+
+
+class Ingestor(object):
+    """
+    Buffered ingestion stage between the sensor poller and sqlite. Readings are kept in memory (and appended to a
+    local journal file) and committed to the DB in a single transaction, either explicitly per sweep (`flush`) or once
+    the oldest buffered reading exceeds `max_delay`. On start, readings left in the journal by a crashed process are
+    recovered into the buffer. Every new reading also refreshes the summary cache of this process (see `summary.py`).
+
+    Args:
+        journal_path (str): path of the append-only journal (None for an in-memory buffer only)
+        max_delay (float): maximum age of a buffered reading before it is committed [s]
+        sync (bool): fsync the journal after every reading (survives power loss, at the cost of SD card writes)
+
+    """
+
+    def __init__(self, journal_path=JOURNAL_PATH, max_delay=FLUSH_INTERVAL, sync=False):
+        self.journal_path = journal_path
+        self.max_delay = max_delay
+        self.sync = sync
+        self.stats = {'flushes': 0, 'rows': 0, 'last_rows': 0, 'last_duration': 0.0, 'max_duration': 0.0,
+                      'failures': 0}
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.RLock()
+        self._journal = None
+        self._recover()
+
+    def _recover(self):
+        """
+        Load readings from a journal which was not flushed (e.g. after a crash).
+
+        """
+        if self.journal_path is None or not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, 'r') as src:
+            for line in src:
+                try:
+                    name, ts, data = json.loads(line)
+                except ValueError:
+                    # torn write of the last line
+                    continue
+                self._buffer.append((name, ts, data))
+
+        # rewrite the journal without any torn line (i.e. new readings are appended to a clean file)
+        with open(self.journal_path, 'w') as dst:
+            for row in self._buffer:
+                dst.write(json.dumps(row) + '\n')
+
+        if self._buffer:
+            self._oldest = time.monotonic()
+            logging.info('[Ingestor] -> Recovered {} readings from {}'.format(len(self._buffer), self.journal_path))
+
+    def add(self, plant_name, data, ts=None):
+        """
+        Buffer a reading (flushing the buffer if its oldest reading is due).
+
+        Args:
+            plant_name (str): name of plant
+            data (dict): measurements (see `polling.Reading.measurements`)
+            ts (int): epoch timestamp of the measurement (defaults to now)
+
+        """
+        row = (plant_name, int(time.time()) if ts is None else int(ts), data)
+        with self._lock:
+            if self.journal_path is not None:
+                if self._journal is None:
+                    self._journal = open(self.journal_path, 'a')
+                self._journal.write(json.dumps(row) + '\n')
+                self._journal.flush()
+                if self.sync:
+                    os.fsync(self._journal.fileno())
+
+            self._buffer.append(row)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+            if time.monotonic() - self._oldest >= self.max_delay:
+                self.flush()
+
+        get_summary_cache().add(*row)
+
+    def _commit(self, rows):
+        """
+        Store a batch of readings (i.e. the sink of the buffer, raises on failure).
+
+        """
+        insert_many(rows)
+
+    def flush(self):
+        """
+        Commit all buffered readings in a single transaction and truncate the journal.
+
+        Returns:
+            n (int): number of committed readings
+
+        """
+        with self._lock:
+            if not self._buffer:
+                return 0
+
+            metrics = get_metrics()
+            start = time.monotonic()
+            try:
+                self._commit(self._buffer)
+            except Exception:
+                # keep buffer + journal for the next attempt
+                self.stats['failures'] += 1
+                metrics.inc('plantbot_ingest_flush_failures_total')
+                logging.exception('[Ingestor] -> Flush of {} readings failed'.format(len(self._buffer)))
+                return 0
+            duration = time.monotonic() - start
+
+            n = len(self._buffer)
+            self._buffer = []
+            self._oldest = None
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self.journal_path is not None and os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+
+            self.stats['flushes'] += 1
+            self.stats['rows'] += n
+            self.stats['last_rows'] = n
+            self.stats['last_duration'] = duration
+            self.stats['max_duration'] = max(self.stats['max_duration'], duration)
+            metrics.observe('plantbot_ingest_flush_seconds', duration)
+            metrics.inc('plantbot_ingest_rows_total', n)
+            logging.info('[Ingestor] -> Flushed {} readings in {:.1f}ms'.format(n, duration * 1000))
+            return n
+
+    @property
+    def pending(self):
+        """
+        Number of buffered (i.e. not yet committed) readings.
+
+        """
+        return len(self._buffer)
+
+    def close(self):
+        """
+        Flush remaining readings and release the journal.
+
+        """
+        with self._lock:
+            self.flush()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def get_ingestor():
+    """
+    Function for getting the shared ingestor of this process (a `collector.Forwarder` if ENV PLANTBOT_COLLECTOR is
+    set to the URL of a central collector).
+
+    Returns:
+        ingestor (obj): shared `Ingestor` instance
+
+    """
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is None:
+            if os.environ.get('PLANTBOT_COLLECTOR'):
+                # edge node (readings are forwarded to the central collector instead of the local DB)
+                from collector import Forwarder
+                _ingestor = Forwarder(os.environ['PLANTBOT_COLLECTOR'])
+            else:
+                _ingestor = Ingestor()
+        return _ingestor
+
+
+def close_ingestor():
+    """
+    Function for flushing the shared ingestor (lifecycle hook for shutdown).
+
+    """
+    with _ingestor_lock:
+        if _ingestor is not None:
+            _ingestor.close()
+
+
+atexit.register(close_ingestor)
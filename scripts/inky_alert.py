@@ -1,136 +1,161 @@
-import inspect
-import json
+import argparse
 import logging
-import math
-import os
 from datetime import datetime as dt
+from datetime import timedelta
 
-from PIL import Image, ImageFont, ImageDraw
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
 from dotenv import load_dotenv
-from font_fredoka_one import FredokaOne
-from inky import InkyWHAT
 
-from constants import THIRSTY_PATH, HEALTHY_PATH, PLANT_DEF, INTERVAL, SUN_PATH, MOON_PATH, MAX_LUX, PLANT_ICON_PATH
-from utils import latest_data, _build_header, _calculate_spacing, _load_image
+from constants import INTERVAL, REFRESH_MOISTURE_DELTA, REFRESH_TEMPERATURE_DELTA, REFRESH_MAX_AGE
+from db import attach_scheduler, latest_data_all
+from layout import OfflineDisplay, get_layout
+from metrics import attach_scheduler as attach_metrics, get_metrics, timed
+from registry import get_registry
 
 load_dotenv(dotenv_path='.envrc')
 logging.basicConfig(format='%(asctime)s:%(levelname)s:%(message)s', level=logging.DEBUG)
 
-scheduler = BlockingScheduler()
+# directory for offline frames (i.e. no inkyWHAT attached), set via --offline
+frame_path = None
 
+# state of the frame currently on display (see `_needs_refresh`)
+last_frame = None
 
-@scheduler.scheduled_job(CronTrigger(minute='1/{}'.format(INTERVAL), hour='*', day='*', month='*', day_of_week='*'))
+
+def _frame_state(plants, latest, layout):
+    """
+    Utility for building the content fingerprint of a frame, i.e. the displayed values per plant plus the header
+    minute.
+
+    Returns:
+        state (dict): header time + displayed values per plant
+
+    """
+    state = {'header': dt.now().replace(second=0, microsecond=0), 'plants': {}}
+    for p in plants:
+        if p.name not in latest:
+            continue
+        data = latest[p.name][0]
+        state['plants'][p.name] = {'moisture': int(data['moisture']),
+                                   'thirsty': data['moisture'] < p.min_moisture,
+                                   'temperature': int(data['temperature']),
+                                   'sun': layout.sun_size(data['light'])}
+    return state
+
+
+def _needs_refresh(prev, cur):
+    """
+    Utility for deciding whether a new frame differs enough from the frame on display to be worth an e-ink refresh.
+    New readings alone are not enough: the values have to move by at least the REFRESH_* thresholds, a plant has to
+    change its thirsty state or light icon, or the frame on display has to be older than REFRESH_MAX_AGE minutes.
+
+    Args:
+        prev (dict): state of the frame on display (None if nothing was shown yet)
+        cur (dict): state of the new frame
+
+    Returns:
+        refresh (bool): whether to push the new frame to the display
+
+    """
+    if prev is None or set(prev['plants']) != set(cur['plants']):
+        return True
+    if cur['header'] - prev['header'] >= timedelta(minutes=REFRESH_MAX_AGE):
+        return True
+
+    for name, c in cur['plants'].items():
+        p = prev['plants'][name]
+        if c['thirsty'] != p['thirsty'] or c['sun'] != p['sun']:
+            return True
+        if abs(c['moisture'] - p['moisture']) >= REFRESH_MOISTURE_DELTA:
+            return True
+        if abs(c['temperature'] - p['temperature']) >= REFRESH_TEMPERATURE_DELTA:
+            return True
+    return False
+
+
+@timed('plantbot_job_seconds', job='inky_update')
 def inky_update():
     """
     PlantBot update via inkyWHAT based on which registered plant is below its respective moisture threshold.
 
     """
 
-    func_name = inspect.stack()[0][3]
+    global last_frame
+
+    func_name = 'inky_update'
     logging.info('[{}] -> Starting Job'.format(func_name))
 
     # initialize inky
-    inky = InkyWHAT("black")
-    inky.set_border(inky.BLACK)
-
-    # draw empty image
-    img = Image.new("P", (inky.WIDTH, inky.HEIGHT))
-    draw = ImageDraw.Draw(img)
-
-    # load the plant definition file
-    with open(PLANT_DEF, 'r') as src:
-        plant_def = json.load(src)
-
-    # determine number of plants
-    n = len(plant_def['plants'])
-
-    # build header
-    img = _build_header(inky, draw, img, n)
-
-    # determine spacing
-    dy = _calculate_spacing(inky, n)
-
-    # iterate through plants
-    font = lambda fs: ImageFont.truetype(FredokaOne, fs)
-    name_font = font(25)
-    time_font = font(12)
-    val_font = font(20)
-    for ind, p in enumerate(plant_def['plants']):
-
-        logging.info('[{}] -> Updating {}'.format(func_name, p['name']))
-
-        # query latest plant information
-        data = latest_data(p['name'], num=1)[0]
-
-        # define placement for plant X
-        edge = 5  # edge
-        y = dy * (ind + 1)
-        gap = lambda pct: 2 * math.ceil(dy * pct / 2)
-
-        # add icon
-        icon = _load_image(os.path.join(PLANT_ICON_PATH, p['icon']), dy - gap(0.2))
-        img.paste(icon, box=(edge, y + gap(0.2) // 2))
-
-        # add name
-        message = p['name']
-        w, h = name_font.getsize(message)
-        loc = y + dy // 2 - h // 2
-        draw.text((dy + edge, loc - edge), message, inky.BLACK, name_font)
-
-        # add measurement time
-        message = dt.strptime(data['date'], "%Y/%m/%d, %H:%M:%S").strftime("%d.%m.%Y %H:%M")
-        w, h = time_font.getsize(message)
-        time_edge = 2
-        draw.text((dy + edge, y + dy - h - time_edge), message, inky.BLACK, time_font)
-
-        # add vertical line
-        draw.line((200, y, 200, y + dy), fill=inky.BLACK, width=2)
-
-        # add moisture information
-        message = "{}%".format(int(data['moisture']))
-        w, h = val_font.getsize(message)
-        loc = y + dy // 2 - h // 2
-        draw.text((200 + edge, loc - edge), message, inky.BLACK, val_font)
-
-        # logic based on moisture [different logo]
-        if data['moisture'] < p['min_moisture']:
-            logging.info('[{}] -> Need to water {} [{}%]!!!'.format(func_name, p['name'], data['moisture']))
-            icon = _load_image(THIRSTY_PATH, dy - gap(0.1))
+    if frame_path is not None:
+        inky = OfflineDisplay(frame_path)
+    else:
+        from inky import InkyWHAT
+
+        inky = InkyWHAT("black")
+
+    # registered plants (re-loaded only if the definition file changed)
+    plants = get_registry().plants()
+
+    # query latest plant information (all plants at once)
+    latest = latest_data_all([p.name for p in plants], num=1)
+
+    # geometry, fonts + header for this number of plants (cached)
+    layout = get_layout(inky.WIDTH, inky.HEIGHT, len(plants))
+
+    # skip the (slow) e-ink refresh if nothing meaningful changed
+    state = _frame_state(plants, latest, layout)
+    if not _needs_refresh(last_frame, state):
+        logging.info('[{}] -> No meaningful change, skipping refresh'.format(func_name))
+        get_metrics().inc('plantbot_inky_refreshes_total', result='skipped')
+        return
+
+    for p in plants:
+        logging.info('[{}] -> Updating {}'.format(func_name, p.name))
+        if p.name not in latest:
+            logging.info('[{}] -> No data for {}'.format(func_name, p.name))
+        elif state['plants'][p.name]['thirsty']:
+            logging.info('[{}] -> Need to water {} [{}%]!!!'.format(func_name, p.name,
+                                                                    latest[p.name][0]['moisture']))
         else:
-            logging.info('[{}] -> Healthy moisture ({} %)!'.format(func_name, data['moisture']))
-            icon = _load_image(HEALTHY_PATH, dy - gap(0.1))
+            logging.info('[{}] -> Healthy moisture ({} %)!'.format(func_name, latest[p.name][0]['moisture']))
 
-        # "paste" image
-        img.paste(icon, box=(250 + dy // 2 - icon.size[0] // 2, y + gap(0.1) // 2))
+    # display on inky
+    m = get_metrics()
+    inky.set_border(inky.BLACK)
+    with m.timer('plantbot_inky_seconds', step='render'):
+        img = layout.render(inky, plants, latest, now=state['header'])
+    inky.set_image(img)
+    with m.timer('plantbot_inky_seconds', step='show'):
+        inky.show()
+    m.inc('plantbot_inky_refreshes_total', result='shown')
+    last_frame = state
 
-        # add vertical line
-        draw.line((300, y, 300, y + dy), fill=inky.BLACK, width=2)
 
-        # add temperature/light information
-        message = "{}°C".format(int(data['temperature']))
-        w, h = val_font.getsize(message)
-        loc = y + dy // 2 - h // 2
-        draw.text((300 + edge, loc - edge), message, inky.BLACK, val_font)
+def register(scheduler, offline=None):
+    """
+    Add the display jobs to a scheduler (first run right away, then every INTERVAL minutes).
 
-        # logic based on light [different logo + scaling]
-        dy_sun = 0
-        if data['light'] < 10:
-            icon = _load_image(MOON_PATH, dy - gap(0.1))
-        else:
-            sun_size = max([gap(0.1), dy - int((math.log(MAX_LUX) - math.log(data['light'])) * 6)])
-            icon = _load_image(SUN_PATH, sun_size)
-            dy_sun = dy // 2 - icon.size[1] // 2
+    Args:
+        scheduler (obj): APScheduler scheduler
+        offline (str): directory for writing frames as PNG instead of the inkyWHAT (None for the display)
 
-        # "paste" image
-        img.paste(icon, box=(350 + dy // 2 - icon.size[0] // 2, y + dy_sun + gap(0.1) // 2))
+    """
+    global frame_path
 
-    # display on inky
-    inky.set_image(img)
-    inky.show()
+    frame_path = offline
+    scheduler.add_job(inky_update, CronTrigger(minute='1/{}'.format(INTERVAL), hour='*', day='*', month='*',
+                                               day_of_week='*'))
+    scheduler.add_job(inky_update)
 
 
 if __name__ == "__main__":
-    scheduler.add_job(inky_update)
+    parser = argparse.ArgumentParser(description='PlantBot inkyWHAT display')
+    parser.add_argument('--offline', metavar='DIR', default=None, help='write frames as PNG to DIR (no display)')
+    args = parser.parse_args()
+
+    scheduler = BlockingScheduler()
+    attach_scheduler(scheduler)
+    attach_metrics(scheduler)
+    register(scheduler, offline=args.offline)
     scheduler.start()
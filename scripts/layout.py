@@ -0,0 +1,203 @@
+import logging
+import math
+import os
+from datetime import datetime as dt
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+from font_fredoka_one import FredokaOne
+
+from assets import INKY_PALETTE, load_image, snap_size
+from constants import THIRSTY_PATH, HEALTHY_PATH, SUN_PATH, MOON_PATH, MAX_LUX, PLANT_ICON_PATH, LOGO_PATH, SUN_STEPS
+
+# font sizes
+HEADER_SIZE = 32
+HEADER_TIME_SIZE = 16
+NAME_SIZE = 25
+TIME_SIZE = 12
+VALUE_SIZE = 20
+
+# column positions (i.e. vertical lines) + margins
+EDGE = 5
+TIME_EDGE = 2
+MOISTURE_X = 200
+TEMPERATURE_X = 300
+
+
+@lru_cache(maxsize=None)
+def font(size):
+    """
+    Utility for loading the FredokaOne font once per size.
+
+    """
+    return ImageFont.truetype(FredokaOne, size)
+
+
+@lru_cache(maxsize=1024)
+def text_size(size, message):
+    """
+    Utility for the (cached) width and height of a message in FredokaOne.
+
+    """
+    return font(size).getsize(message)
+
+
+class OfflineDisplay(object):
+    """
+    Stand-in for the inkyWHAT (same size + colours) writing every shown frame to a PNG file instead of the display.
+
+    Args:
+        frame_path (str): directory for the PNG frames (None to keep the last frame in memory only)
+
+    """
+    WIDTH = 400
+    HEIGHT = 300
+    WHITE = 0
+    BLACK = 1
+    RED = 2
+
+    def __init__(self, frame_path=None):
+        self.frame_path = frame_path
+        self.image = None
+
+    def set_border(self, colour):
+        pass
+
+    def set_image(self, img):
+        self.image = img.copy()
+        self.image.putpalette(INKY_PALETTE + (0, 0, 0) * 253)
+
+    def show(self):
+        if self.frame_path is None:
+            return
+        os.makedirs(self.frame_path, exist_ok=True)
+        path = os.path.join(self.frame_path, 'frame_{}.png'.format(dt.now().strftime("%Y%m%d_%H%M%S")))
+        self.image.save(path)
+        logging.info('[OfflineDisplay] -> Frame written to {}'.format(path))
+
+
+class Layout(object):
+    """
+    Frame geometry for `n` plants (one row per plant below the header). Row positions, icon sizes, the header and the
+    fonts are computed once, i.e. drawing a frame only fills in the values.
+
+    Args:
+        width (int): display width [px]
+        height (int): display height [px]
+        n (int): number of plants
+
+    """
+
+    def __init__(self, width, height, n):
+        self.width = width
+        self.height = height
+        self.n = n
+
+        # spacing between rows
+        self.dy = height // (n + 1)
+        self.rows = [self.dy * (ind + 1) for ind in range(n)]
+        self.gap_icon = self._gap(0.2)
+        self.gap_status = self._gap(0.1)
+        self.icon_size = self.dy - self.gap_icon
+        self.status_size = self.dy - self.gap_status
+
+        # header
+        self.logo = load_image(LOGO_PATH, self.dy)
+        w, h = text_size(HEADER_SIZE, "PlantBot")
+        self.header_xy = (self.logo.size[0], self.dy // 2 - h // 2)
+
+    def _gap(self, pct):
+        return 2 * math.ceil(self.dy * pct / 2)
+
+    def sun_size(self, light):
+        """
+        Utility for the (snapped) size of the sun icon based on light [lux]. Returns None at night (i.e. moon icon).
+
+        """
+        if light < 10:
+            return None
+        sun_size = max([self.gap_status, self.dy - int((math.log(MAX_LUX) - math.log(light)) * 6)])
+        return snap_size(sun_size, self.gap_status, self.status_size, SUN_STEPS)
+
+    def _value(self, draw, x, y, message, colour):
+        w, h = text_size(VALUE_SIZE, message)
+        draw.text((x + EDGE, y + self.dy // 2 - h // 2 - EDGE), message, colour, font(VALUE_SIZE))
+
+    def render(self, inky, plants, latest, now=None):
+        """
+        Draw a complete frame.
+
+        Args:
+            inky (obj): inkyWHAT (or `OfflineDisplay`), used for its colours
+            plants (list): plant definitions (one row each, plants without data are left empty)
+            latest (dict): plant name -> list of measurements (see `db.latest_data_all`)
+            now (obj): datetime shown in the header (defaults to now)
+
+        Returns:
+            img (obj): PIL image ("P" mode)
+
+        """
+        img = Image.new("P", (self.width, self.height))
+        draw = ImageDraw.Draw(img)
+
+        # build grid for showing information
+        for y in self.rows:
+            draw.line((0, y, self.width, y), fill=inky.BLACK, width=2)
+
+        # add PlantBot icon + name
+        img.paste(self.logo, box=(0, (self.dy - self.logo.size[1]) // 2))
+        draw.text(self.header_xy, "PlantBot", inky.BLACK, font(HEADER_SIZE))
+
+        # include date/time of last "run"
+        header = (now or dt.now()).strftime("%d.%m.%Y %H:%M")
+        w, h = text_size(HEADER_TIME_SIZE, header)
+        draw.text((self.width - w - TIME_EDGE, 0), header, inky.BLACK, font(HEADER_TIME_SIZE))
+
+        for y, p in zip(self.rows, plants):
+            if p.name not in latest:
+                continue
+            data = latest[p.name][0]
+
+            # add icon (optional in the plant definition)
+            if p.icon is not None:
+                icon = load_image(os.path.join(PLANT_ICON_PATH, p.icon), self.icon_size)
+                img.paste(icon, box=(EDGE, y + self.gap_icon // 2))
+
+            # add name
+            w, h = text_size(NAME_SIZE, p.name)
+            draw.text((self.dy + EDGE, y + self.dy // 2 - h // 2 - EDGE), p.name, inky.BLACK, font(NAME_SIZE))
+
+            # add measurement time
+            message = dt.fromtimestamp(data['ts']).strftime("%d.%m.%Y %H:%M")
+            w, h = text_size(TIME_SIZE, message)
+            draw.text((self.dy + EDGE, y + self.dy - h - TIME_EDGE), message, inky.BLACK, font(TIME_SIZE))
+
+            # add moisture information [different logo based on moisture]
+            draw.line((MOISTURE_X, y, MOISTURE_X, y + self.dy), fill=inky.BLACK, width=2)
+            self._value(draw, MOISTURE_X, y, "{}%".format(int(data['moisture'])), inky.BLACK)
+            icon = load_image(THIRSTY_PATH if data['moisture'] < p.min_moisture else HEALTHY_PATH,
+                              self.status_size)
+            img.paste(icon, box=(250 + self.dy // 2 - icon.size[0] // 2, y + self.gap_status // 2))
+
+            # add temperature/light information [different logo + scaling based on light]
+            draw.line((TEMPERATURE_X, y, TEMPERATURE_X, y + self.dy), fill=inky.BLACK, width=2)
+            self._value(draw, TEMPERATURE_X, y, "{}°C".format(int(data['temperature'])), inky.BLACK)
+            dy_sun = 0
+            sun_size = self.sun_size(data['light'])
+            if sun_size is None:
+                icon = load_image(MOON_PATH, self.status_size)
+            else:
+                icon = load_image(SUN_PATH, sun_size)
+                dy_sun = self.dy // 2 - icon.size[1] // 2
+            img.paste(icon, box=(350 + self.dy // 2 - icon.size[0] // 2, y + dy_sun + self.gap_status // 2))
+
+        return img
+
+
+@lru_cache(maxsize=8)
+def get_layout(width, height, n):
+    """
+    Function for getting the (cached) layout for `n` plants.
+
+    """
+    return Layout(width, height, n)
@@ -0,0 +1,204 @@
+import atexit
+import bisect
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from constants import METRICS_BUCKETS, METRICS_INTERVAL, METRICS_PATH
+
+
+class Histogram(object):
+    """
+    Distribution of observed values over fixed buckets (upper bounds, Prometheus style).
+
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(object):
+    """
+    Counters + histograms of a process (e.g. sensor read, DB, render and Slack call durations), exported as a Prometheus
+    text file (i.e. for node_exporter's textfile collector). Recording a value costs a dictionary lookup under a lock,
+    series are keyed by name + labels.
+
+    Args:
+        process (str): value of the `process` label of every series (defaults to the name of the running script)
+        buckets (tuple): histogram bucket upper bounds [s]
+
+    """
+
+    def __init__(self, process=None, buckets=METRICS_BUCKETS):
+        self.process = process or os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increase a counter.
+
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Add a value to a histogram.
+
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(self.buckets)
+            self._histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Context manager observing the duration of its block (also if it raises).
+
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """
+        Current values.
+
+        Returns:
+            counters (dict): (name, labels) -> value
+            histograms (dict): (name, labels) -> (count, sum)
+
+        """
+        with self._lock:
+            return dict(self._counters), {key: (h.count, h.sum) for key, h in self._histograms.items()}
+
+    def render(self):
+        """
+        Prometheus text exposition format of all series.
+
+        """
+        def fmt(name, labels, value, extra=()):
+            labels = (('process', self.process),) + labels + tuple(extra)
+            return '{}{{{}}} {}'.format(name, ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace(
+                '"', '\\"').replace('\n', '\\n')) for k, v in labels), value)
+
+        lines, typed = [], set()
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append('# TYPE {} counter'.format(name))
+                    typed.add(name)
+                lines.append(fmt(name, labels, value))
+
+            for (name, labels), h in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append('# TYPE {} histogram'.format(name))
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), h.counts):
+                    cumulative += count
+                    lines.append(fmt(name + '_bucket', labels, cumulative, [('le', bound)]))
+                lines.append(fmt(name + '_sum', labels, h.sum))
+                lines.append(fmt(name + '_count', labels, h.count))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path=METRICS_PATH):
+        """
+        Write all series to a Prometheus text file (atomically, i.e. a scraper never sees a partial file). A `{process}`
+        placeholder in the path is replaced by the process label.
+
+        """
+        path = path.format(process=self.process)
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path + '.tmp', 'w') as dst:
+                dst.write(self.render())
+            os.replace(path + '.tmp', path)
+        except OSError:
+            logging.exception('[Metrics] -> Unable to write {}'.format(path))
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """
+    Function for getting the shared metrics of this process.
+
+    Returns:
+        metrics (obj): shared `Metrics` instance
+
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+def timed(name, **labels):
+    """
+    Decorator observing the duration of every call of a function (see `Metrics.timer`).
+
+    Args:
+        name (str): histogram name
+        labels (dict): labels of the series
+
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_metrics().timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_metrics():
+    """
+    Function for writing the metrics of this process to METRICS_PATH (no-op if nothing was recorded).
+
+    """
+    if _metrics is not None:
+        _metrics.write()
+
+
+def attach_scheduler(scheduler):
+    """
+    Function for exporting the metrics of this process every METRICS_INTERVAL seconds (and when the scheduler shuts
+    down or the process exits).
+
+    Args:
+        scheduler (obj): APScheduler scheduler
+
+    """
+    from apscheduler.events import EVENT_SCHEDULER_SHUTDOWN
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    scheduler.add_job(write_metrics, IntervalTrigger(seconds=METRICS_INTERVAL))
+    scheduler.add_listener(lambda event: write_metrics(), EVENT_SCHEDULER_SHUTDOWN)
+    atexit.register(write_metrics)
+
@@ -0,0 +1,85 @@
+import argparse
+import logging
+from contextlib import closing
+
+from constants import DB_PATH
+from db import ROLLUPS, connect, plant_id, rebuild_rollups
+
+logging.basicConfig(format='%(asctime)s:%(levelname)s:%(message)s', level=logging.DEBUG)
+
+# tables belonging to the single-table layout (i.e. everything else is a legacy per-plant table)
+NEW_TABLES = ['plants', 'measurements', 'alert_state', 'sensor_health', 'commit_log'] + \
+    ['rollup_' + name for name, _ in ROLLUPS]
+
+
+def legacy_tables(conn):
+    """
+    Utility for listing the legacy per-plant tables (one table per plant, keyed by a formatted `date` string).
+
+    Args:
+        conn (obj): database connection (sqlite)
+
+    Returns:
+        out (list): names of the legacy tables
+
+    """
+    command = """SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"""
+    return [row[0] for row in conn.execute(command) if row[0] not in NEW_TABLES]
+
+
+def migrate(path=DB_PATH, drop=False):
+    """
+    Function for converting a DB with per-plant tables into the single `measurements` table in bulk. Every table is
+    copied with one INSERT ... SELECT, converting the local "%Y/%m/%d, %H:%M:%S" date into an epoch timestamp inside
+    sqlite. Afterwards the hourly + daily rollups are (re-)built from the raw measurements. Everything runs in a single
+    transaction (i.e. a failed migration leaves the DB untouched).
+
+    Args:
+        path (str): path of the sqlite DB
+        drop (bool): drop the legacy tables after copying
+
+    Returns:
+        out (dict): number of migrated rows per plant
+
+    """
+    out = {}
+    with closing(connect(path)) as conn:
+        with conn:
+            for name in legacy_tables(conn):
+                command = """
+                    INSERT OR IGNORE INTO measurements (
+                        plant_id,
+                        ts,
+                        temperature,
+                        moisture,
+                        light,
+                        conductivity,
+                        battery)
+                    SELECT
+                        ?,
+                        CAST(strftime('%s', replace(substr(date, 1, 10), '/', '-') || substr(date, 12), 'utc')
+                             AS INTEGER),
+                        temperature,
+                        moisture,
+                        light,
+                        conductivity,
+                        battery
+                    FROM "{}" """.format(name.replace('"', '""'))
+                out[name] = conn.execute(command, (plant_id(conn, name),)).rowcount
+                logging.info('[migrate] -> Migrated {} rows [{}]'.format(out[name], name))
+
+                if drop:
+                    conn.execute('DROP TABLE "{}"'.format(name.replace('"', '""')))
+                    logging.info('[migrate] -> Dropped legacy table [{}]'.format(name))
+
+            logging.info('[migrate] -> Rebuilt {} hourly rollups'.format(rebuild_rollups(conn)))
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Migrate per-plant tables into the single-table layout')
+    parser.add_argument('--db', default=DB_PATH, help='path of the sqlite DB')
+    parser.add_argument('--drop', action='store_true', help='drop the legacy tables after migration')
+    args = parser.parse_args()
+
+    migrate(args.db, drop=args.drop)
@@ -1,4 +1,4 @@
-import inspect
+import argparse
 import logging
 import os
 from datetime import datetime as dt
@@ -9,50 +9,168 @@ from apscheduler.triggers.combining import OrTrigger
 from apscheduler.triggers.cron import CronTrigger
 from dotenv import load_dotenv
 
-from constants import INTERVAL
-from utils import get_daylight_hours, get_plant_data
+from adaptive import get_poller
+from constants import ADAPTIVE_POLLING, COMPONENTS, OPTIONAL_COMPONENTS, INTERVAL, POLL_TICK
+from db import attach_retention, attach_scheduler
+from metrics import attach_scheduler as attach_metrics
+from utils.daylight import get_daylight
+from utils.sweep import get_plant_data
 
 load_dotenv(dotenv_path='.envrc')
 
 logging.basicConfig(format='%(asctime)s:%(levelname)s:%(message)s', level=logging.DEBUG)
 
-scheduler = BlockingScheduler()
-
 # get geolocation from ENV
 LAT = os.environ.get("LAT")
 LON = os.environ.get("LON")
 
 
-@scheduler.scheduled_job(CronTrigger(minute='0', hour='0', day='*', month='*', day_of_week='*'))
-def daily_trigger():
+def _cron_window(start, end, step, end_date):
+    """
+    Utility for cron triggers firing every `step` minutes (aligned to the clock) within [start, end) minutes of the
+    day. Note that the start/end of a window is encoded in the cron fields (e.g. minute='50-59/10' for the hour of
+    sunrise): APScheduler ignores `start_date` once a job has fired.
+
+    Returns:
+        triggers (list): CronTrigger objects (one per run of hours with the same minutes)
+
+    """
+    specs = []
+    for hour in range(start // 60, (end - 1) // 60 + 1):
+        lo, hi = max(0, start - hour * 60), min(59, end - 1 - hour * 60)
+        first = -(-lo // step) * step
+        if first > hi:
+            continue
+        minute = str(first) if first + step > hi else '{}-{}/{}'.format(first, hi, step)
+        if specs and specs[-1][1] == minute and specs[-1][0][1] == hour - 1:
+            specs[-1][0][1] = hour
+        else:
+            specs.append(([hour, hour], minute))
+    return [CronTrigger(minute=minute, hour='{}-{}'.format(*hours), day='*', month='*', day_of_week='*',
+                        end_date=end_date) for hours, minute in specs]
+
+
+def daily_trigger(scheduler):
     """
     PlantBot trigger for connecting to all Mi Flora sensors (based on MAC address). Note that data is collected in
     different frequencies between day and night. Night is hourly, while day is based on INTERVAL between sunrise and
-    sunset.
+    sunset (minute resolution, see `SunTable`). With ADAPTIVE_POLLING the sensors are read by the adaptive poller
+    instead (i.e. nothing to plan).
+
+    Args:
+        scheduler (obj): APScheduler scheduler running the sensor sweeps
 
     """
-    func_name = inspect.stack()[0][3]
+    func_name = 'daily_trigger'
 
     logging.info('[{}] -> Starting Job'.format(func_name))
 
+    if ADAPTIVE_POLLING:
+        return
+
     # get daylight times based on location
     today = dt.now().date()
-    sunrise, sunset = get_daylight_hours(LAT, LON, today)
+    sunrise, sunset = get_daylight(LAT, LON, today)
 
-    # build trigger based on time of the day
+    # build trigger based on time of the day (hourly all day if the sun does not rise or set)
     tomorrow = today + timedelta(days=1)
-    morning = CronTrigger(minute='0', hour='0-{}'.format(sunrise), day='*', month='*', day_of_week='*',
-                          end_date=tomorrow)
-    day = CronTrigger(minute='0/{}'.format(INTERVAL), hour='{}-{}'.format(sunrise, sunset), day='*', month='*',
-                      day_of_week='*', end_date=tomorrow)
-    night = CronTrigger(minute='0', hour='{}-23'.format(sunset), day='*', month='*', day_of_week='*', end_date=tomorrow)
-    trigger = OrTrigger([morning, day, night])
+    if sunrise is None or sunset is None:
+        trigger = CronTrigger(minute='0', hour='*', day='*', month='*', day_of_week='*', end_date=tomorrow)
+    else:
+        sunrise = sunrise.hour * 60 + sunrise.minute if sunrise.date() == today else 0
+        sunset = sunset.hour * 60 + sunset.minute if sunset.date() == today else 24 * 60
+        trigger = OrTrigger(_cron_window(0, sunrise, 60, tomorrow) + _cron_window(sunrise, sunset, INTERVAL, tomorrow) +
+                            _cron_window(sunset, 24 * 60, 60, tomorrow))
 
     # add new scheduled jobs
     logging.info("[{}] -> Adding scheduled job".format(func_name))
     scheduler.add_job(get_plant_data, trigger)
 
 
+def register(scheduler):
+    """
+    Add the sensor polling jobs to a scheduler (the daily trigger plans the sweeps of the day, first run right away).
+    With ADAPTIVE_POLLING the adaptive poller checks every POLL_TICK minutes which sensors are due instead. Also runs
+    the retention of the DB (see `db.attach_retention`).
+
+    Args:
+        scheduler (obj): APScheduler scheduler
+
+    """
+    attach_retention(scheduler)
+    scheduler.add_job(daily_trigger, CronTrigger(minute='0', hour='0', day='*', month='*', day_of_week='*'),
+                      args=[scheduler])
+    scheduler.add_job(daily_trigger, args=[scheduler])
+    if ADAPTIVE_POLLING:
+        poller = get_poller()
+        scheduler.add_job(poller.tick, CronTrigger(minute='*/{}'.format(POLL_TICK), hour='*', day='*', month='*',
+                                                   day_of_week='*'))
+        scheduler.add_job(poller.tick)
+
+
+def build(components, offline=None):
+    """
+    Function for building the single-process PlantBot runtime: one scheduler (+ the shared DB session, plant registry
+    and caches of this process) hosting the enabled components. Components are only imported if enabled (e.g. no
+    PIL/inky without the display).
+
+    Args:
+        components (list): enabled components ('polling', 'alert', 'display', 'listen' and/or 'collector')
+        offline (str): directory for writing display frames as PNG instead of the inkyWHAT
+
+    Returns:
+        scheduler (obj): APScheduler scheduler (not started yet)
+
+    """
+    unknown = set(components) - set(COMPONENTS + OPTIONAL_COMPONENTS)
+    if unknown:
+        raise ValueError('Unknown components: {}'.format(', '.join(sorted(unknown))))
+
+    scheduler = BlockingScheduler()
+    attach_scheduler(scheduler)
+    attach_metrics(scheduler)
+
+    if 'polling' in components:
+        register(scheduler)
+    if 'collector' in components:
+        import collector
+        collector.register(scheduler)
+    if 'alert' in components:
+        import slackbot_alert
+        slackbot_alert.register(scheduler)
+    if 'display' in components:
+        import inky_alert
+        inky_alert.register(scheduler, offline=offline)
+    if 'listen' in components:
+        import slackbot_listen
+        # readings polled (or collected) in-process reach the summary cache directly (i.e. no DB sync needed)
+        slackbot_listen.register(scheduler, sync='polling' not in components and 'collector' not in components)
+
+    logging.info('[build] -> Enabled components: {}'.format(', '.join(c for c in COMPONENTS + OPTIONAL_COMPONENTS
+                                                                    if c in components)))
+    return scheduler
+
+
 if __name__ == "__main__":
-    scheduler.add_job(daily_trigger)
-    scheduler.start()
+    parser = argparse.ArgumentParser(description='PlantBot')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run = subparsers.add_parser('run', help='run all enabled components in a single process')
+    run.add_argument('--components', default=os.environ.get("PLANTBOT_COMPONENTS", ",".join(COMPONENTS)),
+                     help='comma separated components to enable (default: {}, optional: {})'.format(
+                         ",".join(COMPONENTS), ",".join(OPTIONAL_COMPONENTS)))
+    run.add_argument('--offline', metavar='DIR', default=None, help='write display frames as PNG to DIR')
+    run.add_argument('--dry-run', action='store_true', help='set up all components and exit (startup benchmark)')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        scheduler = build([c.strip() for c in args.components.split(',') if c.strip()], offline=args.offline)
+        if not args.dry_run:
+            scheduler.start()
+    else:
+        # sensor polling only (i.e. one process per component)
+        scheduler = BlockingScheduler()
+        attach_scheduler(scheduler)
+        attach_metrics(scheduler)
+        register(scheduler)
+        scheduler.start()
@@ -0,0 +1,415 @@
+import logging
+import multiprocessing
+import queue
+import random
+import struct
+import threading
+import time
+
+from constants import DEVICE_INFO_TTL, POLL_WORKERS, POLL_TIMEOUT, READING_RANGES
+from db import FIELDS
+from metrics import get_metrics
+
+
+class SensorError(Exception):
+    """
+    Raised for a failed Bluetooth connection to a sensor (wraps btlewrap's BluetoothBackendException).
+
+    Args:
+        message (str): description of the failure
+        connections (int): number of BLE connections the failed read took
+
+    """
+
+    def __init__(self, message, connections=0):
+        super(SensorError, self).__init__(message)
+        self.connections = connections
+
+
+# Mi Flora GATT handles (as used by miflora's MiFloraPoller)
+HANDLE_VERSION_BATTERY = 0x38
+HANDLE_MODE_CHANGE = 0x33
+HANDLE_SENSOR_DATA = 0x35
+DATA_MODE_CHANGE = bytes([0xA0, 0x1F])
+
+
+class Reading(object):
+    """
+    Typed record of a single sensor read.
+
+    Args:
+        temperature (float): [°C]
+        moisture (int): [%]
+        light (int): [lux]
+        conductivity (int): [uS/cm]
+        battery (int): [%] (cached, see `info_ts`)
+        firmware (str): firmware version of the device (cached, see `info_ts`)
+        info_ts (float): epoch timestamp battery + firmware were read from the device
+        connections (int): number of BLE connections the read took (0 without Bluetooth, e.g. `FakeReader`)
+
+    """
+
+    __slots__ = ('temperature', 'moisture', 'light', 'conductivity', 'battery', 'firmware', 'info_ts', 'connections')
+
+    def __init__(self, temperature, moisture, light, conductivity, battery, firmware=None, info_ts=None,
+                 connections=0):
+        self.temperature = temperature
+        self.moisture = moisture
+        self.light = light
+        self.conductivity = conductivity
+        self.battery = battery
+        self.firmware = firmware
+        self.info_ts = info_ts
+        self.connections = connections
+
+    def __repr__(self):
+        return 'Reading({})'.format(', '.join('{}={!r}'.format(k, getattr(self, k)) for k in self.__slots__))
+
+    def measurements(self):
+        """
+        Stored measurements of the read.
+
+        Returns:
+            out (dict): field -> value (see `db.FIELDS`)
+
+        """
+        return {f: getattr(self, f) for f in FIELDS}
+
+
+def parse_sensor_data(raw):
+    """
+    Function for decoding the sensor data handle of a Mi Flora (16 bytes, little endian): temperature in 0.1 °C
+    (bytes 0-1), light in lux (bytes 3-6), moisture in % (byte 7) and conductivity in uS/cm (bytes 8-9).
+
+    Returns:
+        temperature, moisture, light, conductivity
+
+    Raises:
+        SensorError: for a missing or invalid answer (e.g. all zeros right after a battery change)
+
+    """
+    if raw is None or len(raw) != 16 or not sum(raw):
+        raise SensorError('invalid sensor data {!r}'.format(raw))
+    temperature, light, moisture, conductivity = struct.unpack('<hxIBhxxxxxx', bytes(raw))
+    return temperature / 10.0, moisture, light, conductivity
+
+
+class MiFloraReader(object):
+    """
+    Sensor read layer: all measurements of a Mi Flora are read within a single BLE connection (miflora's
+    MiFloraPoller connects twice, once for battery + firmware and once for the data). Battery + firmware change slowly,
+    they are cached per device for `ttl` seconds and only re-read (within the same connection) once expired. The
+    Bluetooth stack (btlewrap) is imported on the first read, i.e. importing this module stays cheap for processes
+    which never read a sensor.
+
+    Note that reads run in worker processes (see `poll_sensors`): the sweep hands every successful reading back via
+    `update`, i.e. the cache lives in the parent process.
+
+    Args:
+        backend (obj): btlewrap backend class used for the connection (defaults to BluepyBackend, see `FakeBackend`)
+        ttl (int): age of cached battery + firmware before they are read again [s]
+
+    """
+
+    def __init__(self, backend=None, ttl=DEVICE_INFO_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._info = {}
+
+    def __call__(self, mac_address):
+        from btlewrap.base import BluetoothBackendException, BluetoothInterface
+
+        if self.backend is None:
+            from btlewrap import BluepyBackend
+
+            self.backend = BluepyBackend
+
+        now = time.time()
+        battery, firmware, info_ts = self._info.get(mac_address, (None, None, None))
+        connections = 1
+        try:
+            with BluetoothInterface(self.backend).connect(mac_address) as conn:
+                if info_ts is None or now - info_ts >= self.ttl:
+                    res = conn.read_handle(HANDLE_VERSION_BATTERY)
+                    if not res:
+                        raise SensorError('no battery/firmware answer [{}]'.format(mac_address), connections)
+                    battery, firmware, info_ts = res[0], ''.join(map(chr, res[2:])), now
+
+                # newer firmware only answers after a mode change
+                if firmware >= '2.6.6':
+                    conn.write_handle(HANDLE_MODE_CHANGE, DATA_MODE_CHANGE)
+                raw = conn.read_handle(HANDLE_SENSOR_DATA)
+        except BluetoothBackendException as e:
+            raise SensorError(str(e), connections)
+
+        try:
+            temperature, moisture, light, conductivity = parse_sensor_data(raw)
+        except SensorError as e:
+            raise SensorError(str(e), connections)
+        return Reading(temperature, moisture, light, conductivity, battery, firmware=firmware, info_ts=info_ts,
+                       connections=connections)
+
+    def update(self, mac_address, reading):
+        """
+        Cache battery + firmware of a successful read (called by `poll_sensors` in the parent process).
+
+        """
+        if reading.info_ts is not None:
+            self._info[mac_address] = (reading.battery, reading.firmware, reading.info_ts)
+
+
+# shared reader of this process (i.e. battery + firmware cached across sweeps)
+read_sensor = MiFloraReader()
+
+
+def check_reading(data):
+    """
+    Function for validating the measurements of a sensor read (all fields present, numeric and within READING_RANGES).
+
+    Returns:
+        err (str): description of the first problem (None for a valid reading)
+
+    """
+    if isinstance(data, Reading):
+        data = data.measurements()
+    if not isinstance(data, dict):
+        return 'malformed reading {!r}'.format(data)
+    for field, (lo, hi) in READING_RANGES.items():
+        value = data.get(field)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not lo <= value <= hi:
+            return 'implausible {} {!r}'.format(field, value)
+    return None
+
+
+def _read(reader, p, results):
+    """
+    Utility running a single sensor read inside a worker (errors + invalid readings are reported back to the sweep,
+    never raised).
+
+    """
+    start = time.monotonic()
+    try:
+        data = reader(p.mac_address)
+        connections = getattr(data, 'connections', 0)
+        err = check_reading(data)
+    except SensorError as e:
+        data, err, connections = None, 'BlueToothBackendException: {}'.format(e), e.connections
+    except Exception as e:
+        data, err, connections = None, repr(e), 0
+    results.put((p.name, data if err is None else None, err, time.monotonic() - start, connections))
+
+
+def _worker_context():
+    """
+    Utility for the multiprocessing context of the sensor reads. Workers are forked from a fork server (a fresh,
+    single-threaded process started on first use, with this module + the Bluetooth stack preloaded) instead of the
+    calling process: its scheduler, listener and pool threads may hold the logging, metrics or DB locks at the time of
+    a fork, i.e. the worker would deadlock and every read end up as a timeout.
+
+    """
+    ctx = multiprocessing.get_context('forkserver')
+    # the main script is imported once by the fork server (i.e. not again per worker), missing modules are skipped
+    # (e.g. no btlewrap on a machine only running FakeReader)
+    ctx.set_forkserver_preload(['__main__', 'polling', 'btlewrap'])
+    return ctx
+
+
+def poll_sensors(plants, reader=read_sensor, workers=POLL_WORKERS, timeout=POLL_TIMEOUT, processes=True):
+    """
+    Function for reading a set of sensors with bounded concurrency. Every read gets its own time budget (starting when
+    the read is launched) so that a single slow or out-of-range sensor cannot hold up the whole sweep.
+
+    Note that btlewrap serializes all Bluetooth connections of a process behind a single lock, i.e. reads only run
+    concurrently in separate processes (see `_worker_context`), which are terminated once they exceed their budget. With
+    `processes=False` reads run in threads instead and reads exceeding their budget are abandoned (e.g. for
+    `FakeReader`). A reader with an `update` method gets every successful reading back (see `MiFloraReader`).
+
+    Args:
+        plants (list): plant definitions (requires 'name' and 'mac_address')
+        reader (func): callable returning a `Reading` for a MAC address (see `MiFloraReader` and `FakeReader`)
+        workers (int): maximum number of concurrent reads
+        timeout (float): time budget per sensor read [s]
+        processes (bool): run reads in processes (default, the reader has to be picklable) or threads
+
+    Returns:
+        readings (dict): `Reading` per plant name (successful reads only)
+        timings (dict): read duration per plant name in seconds (None for failed or timed out reads)
+        errors (dict): error per plant name (failed or timed out reads only)
+
+    """
+    if processes:
+        ctx = _worker_context()
+        results = ctx.Queue()
+    else:
+        results = queue.Queue()
+    todo = list(plants)
+    macs = {p.name: p.mac_address for p in plants}
+    update = getattr(reader, 'update', None)
+    running = {}
+    readings, timings, errors = {}, {}, {}
+    metrics = get_metrics()
+
+    while todo or running:
+        # launch reads until all workers are busy
+        while todo and len(running) < workers:
+            p = todo.pop(0)
+            if processes:
+                worker = ctx.Process(target=_read, args=(reader, p, results), daemon=True)
+            else:
+                worker = threading.Thread(target=_read, args=(reader, p, results), daemon=True)
+            worker.start()
+            running[p.name] = (time.monotonic(), worker)
+
+        # wait for the next result (at most until the oldest read runs out of budget)
+        deadline = min(start for start, _ in running.values()) + timeout
+        try:
+            name, data, err, elapsed, connections = results.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            now = time.monotonic()
+            for name, (start, worker) in list(running.items()):
+                if now - start >= timeout:
+                    logging.error("[poll_sensors] -> Timeout after {}s [{}]".format(timeout, name))
+                    if processes:
+                        worker.terminate()
+                        worker.join()
+                    del running[name]
+                    timings[name] = None
+                    errors[name] = 'timeout after {}s'.format(timeout)
+                    metrics.inc('plantbot_sensor_reads_total', plant=name, result='timeout')
+            continue
+
+        # ignore late results of abandoned reads
+        if name not in running:
+            continue
+        _, worker = running.pop(name)
+        if processes:
+            worker.join()
+
+        metrics.observe('plantbot_sensor_read_seconds', elapsed, plant=name)
+        metrics.inc('plantbot_ble_connections_total', connections)
+        if err is None:
+            readings[name] = data
+            timings[name] = elapsed
+            metrics.inc('plantbot_sensor_reads_total', plant=name, result='ok')
+            if update is not None:
+                update(macs[name], data)
+        else:
+            logging.error("[poll_sensors] -> {} [{}]".format(err, name))
+            timings[name] = None
+            errors[name] = err
+            metrics.inc('plantbot_sensor_reads_total', plant=name, result='error')
+
+    return readings, timings, errors
+
+
+class FakeReader(object):
+    """
+    Drop-in replacement for `read_sensor` producing synthetic readings without any Bluetooth hardware (see
+    `FakeBackend` for exercising `MiFloraReader` itself).
+
+    Args:
+        latency (tuple): minimum and maximum time spent per read [s]
+        failure_rate (float): probability of a read raising a SensorError
+        hang (list): MAC addresses which never answer (i.e. always exceed the time budget)
+        dead (list): MAC addresses which always raise a SensorError (e.g. out of range or empty battery)
+        malformed (list): MAC addresses returning implausible measurements
+        seed (int): seed for reproducible runs
+
+    """
+
+    def __init__(self, latency=(0.5, 2.0), failure_rate=0.0, hang=(), dead=(), malformed=(), seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.hang = set(hang)
+        self.dead = set(dead)
+        self.malformed = set(malformed)
+        self.seed = seed
+
+    def __call__(self, mac_address):
+        # one generator per read (i.e. no shared state between threads or worker processes)
+        rnd = random.Random('{}:{}'.format(self.seed, mac_address) if self.seed is not None else None)
+        delay = rnd.uniform(*self.latency)
+        fail = rnd.random() < self.failure_rate
+        values = {'temperature': round(rnd.uniform(15, 30), 1),
+                  'moisture': rnd.randint(5, 60),
+                  'light': rnd.randint(0, 20000),
+                  'conductivity': rnd.randint(50, 1500),
+                  'battery': rnd.randint(10, 100)}
+
+        if mac_address in self.hang:
+            time.sleep(3600)
+        time.sleep(delay)
+        if fail or mac_address in self.dead:
+            raise SensorError("Fake read failure [{}]".format(mac_address))
+        if mac_address in self.malformed:
+            values.update(moisture=255, battery=None)
+        return Reading(**values)
+
+
+class FakeBackend(object):
+    """
+    btlewrap backend simulating Mi Flora devices (GATT handles for battery/firmware, mode change and sensor data), e.g.
+    for counting the BLE connections of a sweep without any hardware. Counters are class attributes (i.e. shared by
+    all connections of a process, use threads instead of worker processes for counting).
+
+    Class attributes:
+        latency (float): time per connection [s]
+        firmware (str): firmware version of all devices
+        dead (set): MAC addresses failing to connect
+        connections, reads, writes (int): counters (see `reset`)
+
+    """
+
+    latency = 0.0
+    firmware = '3.2.1'
+    dead = set()
+    connections = 0
+    reads = 0
+    writes = 0
+    _lock = threading.Lock()
+
+    def __init__(self, adapter='hci0', address_type='public', **kwargs):
+        self._mac = None
+        self._mode = False
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.connections = cls.reads = cls.writes = 0
+
+    @staticmethod
+    def check_backend():
+        return True
+
+    def connect(self, mac):
+        from btlewrap.base import BluetoothBackendException
+
+        time.sleep(self.latency)
+        with self._lock:
+            FakeBackend.connections += 1
+        if mac in self.dead:
+            raise BluetoothBackendException('Fake connection failure [{}]'.format(mac))
+        self._mac, self._mode = mac, False
+
+    def disconnect(self):
+        self._mac = None
+
+    def write_handle(self, handle, value):
+        with self._lock:
+            FakeBackend.writes += 1
+        if handle == HANDLE_MODE_CHANGE and value == DATA_MODE_CHANGE:
+            self._mode = True
+        return True
+
+    def read_handle(self, handle):
+        with self._lock:
+            FakeBackend.reads += 1
+        rnd = random.Random(self._mac)
+        if handle == HANDLE_VERSION_BATTERY:
+            return bytes([rnd.randint(10, 100), 0x15]) + self.firmware.encode()
+        if handle == HANDLE_SENSOR_DATA:
+            if self.firmware >= '2.6.6' and not self._mode:
+                return bytes([0xAA, 0xBB, 0xCC, 0xDD, 0xEE, 0xFF, 0x99, 0x88, 0x77, 0x66] + [0] * 6)
+            return struct.pack('<hxIBh6s', rnd.randint(150, 300), rnd.randint(0, 20000), rnd.randint(5, 60),
+                               rnd.randint(50, 1500), bytes([0x02, 0x3C, 0x00, 0xFB, 0x34, 0x9B]))
+        return None
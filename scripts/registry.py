@@ -0,0 +1,188 @@
+import json
+import logging
+import numbers
+import os
+import re
+import threading
+
+from constants import PLANT_DEF
+
+MAC_REGEX = "^([0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}$"
+
+
+class RegistryError(ValueError):
+    """
+    Raised for an invalid plant definition file.
+
+    """
+
+
+class Plant(object):
+    """
+    Plant definition (one entry of the plant definition file).
+
+    Args:
+        name (str): name of plant
+        mac_address (str): MAC address of its Mi Flora sensor
+        min_moisture (float): moisture threshold [%]
+        icon (str): file name of its icon in PLANT_ICON_PATH (optional, Inky display only)
+
+    """
+
+    __slots__ = ('name', 'mac_address', 'min_moisture', 'icon')
+
+    def __init__(self, name, mac_address, min_moisture, icon=None):
+        self.name = name
+        self.mac_address = mac_address
+        self.min_moisture = min_moisture
+        self.icon = icon
+
+    def __repr__(self):
+        return 'Plant({!r}, {!r}, {!r}, icon={!r})'.format(self.name, self.mac_address, self.min_moisture, self.icon)
+
+
+def parse_plants(plant_def):
+    """
+    Function for validating a (decoded) plant definition file.
+
+    Args:
+        plant_def (dict): {"plants": [{"name": ..., "mac_address": ..., "min_moisture": ..., "icon": ...}, ...]}
+
+    Returns:
+        plants (tuple): `Plant` records (in file order)
+
+    Raises:
+        RegistryError: for any invalid entry
+
+    """
+    if not isinstance(plant_def, dict) or not isinstance(plant_def.get('plants'), list):
+        raise RegistryError('expected an object with a "plants" list')
+
+    plants, names, macs = [], set(), set()
+    for ii, entry in enumerate(plant_def['plants']):
+        if not isinstance(entry, dict):
+            raise RegistryError('plant #{}: expected an object'.format(ii))
+
+        name = entry.get('name')
+        if not isinstance(name, str) or not name.strip():
+            raise RegistryError('plant #{}: missing name'.format(ii))
+        if name in names:
+            raise RegistryError('plant #{}: duplicate name "{}"'.format(ii, name))
+
+        mac = entry.get('mac_address')
+        if not isinstance(mac, str) or not re.match(MAC_REGEX, mac):
+            raise RegistryError('plant "{}": invalid mac_address {!r}'.format(name, mac))
+        if mac.upper() in macs:
+            raise RegistryError('plant "{}": duplicate mac_address {}'.format(name, mac))
+
+        min_moisture = entry.get('min_moisture')
+        if isinstance(min_moisture, bool) or not isinstance(min_moisture, numbers.Real) or \
+                not 0 <= min_moisture <= 100:
+            raise RegistryError('plant "{}": min_moisture must be a number in [0, 100]'.format(name))
+
+        icon = entry.get('icon')
+        if icon is not None and not isinstance(icon, str):
+            raise RegistryError('plant "{}": icon must be a file name'.format(name))
+
+        names.add(name)
+        macs.add(mac.upper())
+        plants.append(Plant(name, mac, min_moisture, icon))
+    return tuple(plants)
+
+
+class PlantRegistry(object):
+    """
+    Shared plant definitions of a process. The definition file is parsed + validated once and only re-loaded when its
+    mtime (or size) changes, i.e. a job asking for the plants costs a single `os.stat`. An invalid edit is logged and
+    rejected: the last valid definitions stay active (no definitions at all if the file was never valid).
+
+    Args:
+        path (str): path of the plant definition file
+
+    """
+
+    def __init__(self, path=PLANT_DEF):
+        self.path = path
+        self.version = 0
+        self._plants = ()
+        self._by_name = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        """
+        Re-load the definition file if it changed on disk.
+
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError as e:
+            if self._stamp != 'missing':
+                logging.error('[PlantRegistry] -> Unable to read {}: {}'.format(self.path, repr(e)))
+                self._stamp = 'missing'
+            return
+
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+
+        try:
+            with open(self.path, 'r') as src:
+                plants = parse_plants(json.load(src))
+        except (ValueError, OSError) as e:
+            logging.error('[PlantRegistry] -> Rejected {} (keeping {} plants): {}'.format(self.path, len(self._plants),
+                                                                                      e))
+            return
+
+        self._plants = plants
+        self._by_name = {p.name: p for p in plants}
+        self.version += 1
+        logging.info('[PlantRegistry] -> Loaded {} plants from {}'.format(len(plants), self.path))
+
+    def plants(self):
+        """
+        All registered plants.
+
+        Returns:
+            plants (tuple): `Plant` records (in file order)
+
+        """
+        with self._lock:
+            self._reload()
+            return self._plants
+
+    def get(self, plant_name):
+        """
+        Registered plant by name (None if unknown).
+
+        """
+        with self._lock:
+            self._reload()
+            return self._by_name.get(plant_name)
+
+    def names(self):
+        """
+        Names of all registered plants (in file order).
+
+        """
+        return [p.name for p in self.plants()]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Function for getting the shared plant registry of this process.
+
+    Returns:
+        registry (obj): shared `PlantRegistry` instance
+
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PlantRegistry()
+        return _registry
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+
+from constants import SLACK_API_URL, SLACK_CONCURRENCY, SLACK_MAX_RETRIES
+from metrics import get_metrics
+
+
+class SlackDispatcher(object):
+    """
+    Asynchronous dispatcher for Slack Web API calls. All calls of a dispatch share one HTTP session, run concurrently
+    (bounded by `concurrency`) and back off on rate limiting (HTTP 429) for the time requested in Retry-After.
+
+    Args:
+        token (str): Slack bot token
+        base_url (str): Slack Web API url (i.e. pointed to a local stub server for testing)
+        concurrency (int): maximum number of concurrent calls
+        max_retries (int): maximum number of retries per call after being rate limited
+
+    """
+
+    def __init__(self, token, base_url=SLACK_API_URL, concurrency=SLACK_CONCURRENCY, max_retries=SLACK_MAX_RETRIES):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.stats = {'calls': 0, 'rate_limited': 0, 'errors': 0}
+
+    async def call(self, session, semaphore, method, **params):
+        """
+        Single Web API call (retried after Retry-After seconds while rate limited). Failures (error responses, HTTP or
+        connection errors, timeouts) are logged and counted, never raised, i.e. one failed call does not fail the
+        other calls of a dispatch.
+
+        Returns:
+            out (dict): decoded response (None if the call failed)
+
+        """
+        import aiohttp
+
+        url = '{}/{}'.format(self.base_url, method)
+        headers = {'Authorization': 'Bearer {}'.format(self.token)}
+        metrics = get_metrics()
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                self.stats['calls'] += 1
+                start = time.perf_counter()
+                try:
+                    async with session.post(url, data=params, headers=headers) as resp:
+                        if resp.status == 429:
+                            retry_after = float(resp.headers.get('Retry-After', 1))
+                            status = 'rate_limited'
+                        else:
+                            out = await resp.json(content_type=None)
+                            status = 'ok' if out.get('ok') else 'error'
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    out, status = {'error': repr(e)}, 'error'
+                metrics.observe('plantbot_slack_call_seconds', time.perf_counter() - start, method=method)
+                metrics.inc('plantbot_slack_calls_total', method=method, status=status)
+                if status == 'error':
+                    self.stats['errors'] += 1
+                    logging.error('[SlackDispatcher] -> {} failed: {}'.format(method, out.get('error')))
+                    return None
+                if status == 'ok':
+                    return out
+
+            self.stats['rate_limited'] += 1
+            if attempt == self.max_retries:
+                break
+            # wait outside of the semaphore (i.e. other calls keep going)
+            logging.info('[SlackDispatcher] -> Rate limited on {}, retry in {}s'.format(method, retry_after))
+            await asyncio.sleep(retry_after)
+
+        self.stats['errors'] += 1
+        logging.error('[SlackDispatcher] -> {} failed: still rate limited'.format(method))
+        return None
+
+    async def _post(self, session, semaphore, channel, text, emojis):
+        """
+        Post a message and add all reactions to it (concurrently).
+
+        """
+        resp = await self.call(session, semaphore, 'chat.postMessage', channel=channel, text=text)
+        if resp is None:
+            return None
+        await asyncio.gather(*[self.call(session, semaphore, 'reactions.add', name=e, timestamp=resp['ts'],
+                                         channel=resp['channel']) for e in emojis])
+        return resp
+
+    async def _dispatch(self, messages):
+        # aiohttp is only needed once there is something to send (i.e. imported on first use)
+        import aiohttp
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with aiohttp.ClientSession() as session:
+            return await asyncio.gather(*[self._post(session, semaphore, channel, text, emojis)
+                                          for channel, text, emojis in messages])
+
+    def dispatch(self, messages):
+        """
+        Send a batch of messages (each with its reactions).
+
+        Args:
+            messages (list): (channel, text, emojis) tuples
+
+        Returns:
+            out (list): chat.postMessage response per message (None for failed messages)
+
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self._dispatch(messages))
+        finally:
+            loop.close()
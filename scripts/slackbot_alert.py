@@ -1,71 +1,120 @@
-import inspect
-import json
 import logging
 import os
 
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
 from dotenv import load_dotenv
-from slackclient import SlackClient
 
-from constants import CHANNEL, INTERVAL, EMOJI_LIST, PLANT_DEF
-from utils import latest_data, giphy_grabber
+from alerts import AlertStates, DRYING, THIRSTY, WATERED
+from analytics import get_predictor
+from constants import CHANNEL, INTERVAL, EMOJI_LIST, SLACK_API_URL
+from db import attach_scheduler, latest_data_all
+from metrics import attach_scheduler as attach_metrics, get_metrics, timed
+from registry import get_registry
+from slack_dispatch import SlackDispatcher
+from utils.giphy import giphy_grabber
 
 load_dotenv(dotenv_path='.envrc')
 logging.basicConfig(format='%(asctime)s:%(levelname)s:%(message)s', level=logging.DEBUG)
 
-slack_client = SlackClient(os.environ.get("SLACK_BOT_TOKEN"))
+dispatcher = SlackDispatcher(os.environ.get("SLACK_BOT_TOKEN"),
+                             base_url=os.environ.get("SLACK_API_URL", SLACK_API_URL))
 
-scheduler = BlockingScheduler()
+alert_states = AlertStates()
 
 
-@scheduler.scheduled_job(CronTrigger(minute='5/{}'.format(INTERVAL), hour='*', day='*', month='*', day_of_week='*'))
+@timed('plantbot_job_seconds', job='slackbot_alert')
 def slackbot_alert():
     """
     PlantBot alert via Slack based on which registered plant is below its respective moisture threshold.
 
     """
 
-    func_name = inspect.stack()[0][3]
+    func_name = 'slackbot_alert'
     logging.info('[{}] -> Starting Job'.format(func_name))
-    if slack_client.rtm_connect(with_team_state=False):
 
-        # load the plant definition file
-        with open(PLANT_DEF, 'r') as src:
-            plant_def = json.load(src)
-
-        # iterate through plants
-        for p in plant_def['plants']:
-            logging.info('[{}] -> Checking {}'.format(func_name, p['name']))
-
-            # query latest plant information
-            data = latest_data(p['name'], num=1)[0]
-
-            # logic based on moisture
-            if data['moisture'] < p['min_moisture']:
-                logging.info('[{}] -> Need to water {} [{}%]!!!'.format(func_name, p['name'], data['moisture']))
-
-                # get url for search term for slack
-                url = giphy_grabber('water')
-
-                message = '\n:potable_water: *{}* needs water!:potable_water:'.format(p['name'])
-                message += '\n\n*Moisture* = {} %'.format(data['moisture'])
-                message += '\n*Temperature* = {} °C'.format(data['temperature'])
-                message += '\n*Light* = {} lux'.format(data['light'])
-                message += '\n*Conductivity* = {} uS/cm'.format(data['conductivity'])
+    # registered plants (re-loaded only if the definition file changed)
+    plants = get_registry().plants()
+
+    # query latest plant information (all plants at once)
+    latest = latest_data_all([p.name for p in plants], num=1)
+
+    # predicted watering times (recomputed only after new readings)
+    predictions = get_predictor().predict(plants, latest)
+
+    # iterate through plants
+    messages, notify = [], []
+    for p in plants:
+        logging.info('[{}] -> Checking {}'.format(func_name, p.name))
+        if p.name not in latest:
+            logging.info('[{}] -> No data for {}'.format(func_name, p.name))
+            continue
+        data = latest[p.name][0]
+
+        # logic based on moisture + prediction (only state changes + expired cooldowns are posted)
+        prediction = predictions.get(p.name, {})
+        action = alert_states.update(p.name, data['moisture'], p.min_moisture, due=prediction.get('due'))
+        if action is not None:
+            get_metrics().inc('plantbot_alerts_total', state=action)
+        if action == THIRSTY:
+            logging.info('[{}] -> Need to water {} [{}%]!!!'.format(func_name, p.name, data['moisture']))
+
+            # get url for search term for slack
+            url = giphy_grabber('water')
+
+            message = '\n:potable_water: *{}* needs water!:potable_water:'.format(p.name)
+            message += '\n\n*Moisture* = {} %'.format(data['moisture'])
+            message += '\n*Temperature* = {} °C'.format(data['temperature'])
+            message += '\n*Light* = {} lux'.format(data['light'])
+            message += '\n*Conductivity* = {} uS/cm'.format(data['conductivity'])
+            if url is not None:
                 message += '\n\n{}'.format(url)
+            messages.append((CHANNEL, message, EMOJI_LIST))
+            notify.append(p.name)
+        elif action == DRYING:
+            hours = max(0, (prediction['due'] - data['ts']) / 3600)
+            logging.info('[{}] -> {} will need water in {:.0f}h [{}%]'.format(func_name, p.name, hours,
+                                                                           data['moisture']))
+            message = '\n:hourglass_flowing_sand: *{}* will need water in about {:.0f} hours'.format(p.name, hours)
+            message += '\n\n*Moisture* = {} % (drying {:.1f} %/day)'.format(data['moisture'], -prediction['rate'])
+            messages.append((CHANNEL, message, []))
+            notify.append(p.name)
+        elif action == WATERED:
+            logging.info('[{}] -> {} has been watered [{}%]'.format(func_name, p.name, data['moisture']))
+            message = '\n:droplet: *{}* has been watered, thanks! (*Moisture* = {} %)'.format(p.name,
+                                                                                           data['moisture'])
+            messages.append((CHANNEL, message, []))
+            notify.append(p.name)
+        else:
+            logging.info('[{}] -> No alert for {} [{}, {}%]'.format(func_name, p.name,
+                                                                  alert_states.get(p.name), data['moisture']))
+
+    # post messages + reactions (concurrently)
+    if messages:
+        resps = dispatcher.dispatch(messages)
+        for name, resp in zip(notify, resps):
+            if resp is not None:
+                alert_states.notified(name)
+        posted = sum(r is not None for r in resps)
+        logging.info('[{}] -> Posted {}/{} messages'.format(func_name, posted, len(messages)))
+
+
+def register(scheduler):
+    """
+    Add the Slack alert jobs to a scheduler (first run right away, then every INTERVAL minutes).
 
-                # post message
-                resp = slack_client.api_call("chat.postMessage", text=message, channel=CHANNEL)
+    Args:
+        scheduler (obj): APScheduler scheduler
 
-                for e in EMOJI_LIST:
-                    slack_client.api_call("reactions.add", name=e, timestamp=resp['ts'], channel=resp['channel'])
-            else:
-                logging.info('[{}] -> Healthy moisture ({} %)!'.format(func_name, data['moisture']))
-    else:
-        logging.info('[{}] -> Connection failed :('.format(func_name))
+    """
+    scheduler.add_job(slackbot_alert, CronTrigger(minute='5/{}'.format(INTERVAL), hour='*', day='*', month='*',
+                                                  day_of_week='*'))
+    scheduler.add_job(slackbot_alert)
 
 
 if __name__ == "__main__":
-    scheduler.add_job(slackbot_alert)
+    scheduler = BlockingScheduler()
+    attach_scheduler(scheduler)
+    attach_metrics(scheduler)
+    register(scheduler)
     scheduler.start()
@@ -1,23 +1,37 @@
+import asyncio
 import json
+import logging
 import os
 import re
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from dateutil import tz
+import aiohttp
 from dotenv import load_dotenv
-from slackclient import SlackClient
 
-from constants import RTM_READ_DELAY, MENTION_REGEX, PLANT_DEF
-from utils import latest_data
+from constants import MENTION_REGEX, SLACK_API_URL, SLACK_CONCURRENCY, LISTEN_WORKERS, HISTORY_WINDOW, \
+    SPARK_WIDTH, SUMMARY_SYNC, SUMMARY_WINDOW, WINDOW_REGEX
+from registry import get_registry
+from slack_dispatch import SlackDispatcher
+from summary import get_summary_cache
 
 load_dotenv(dotenv_path='.envrc')
+logging.basicConfig(format='%(asctime)s:%(levelname)s:%(message)s', level=logging.INFO)
 
-# deal with timezones
-from_zone = tz.tzutc()
-to_zone = tz.gettz('Europe/Berlin')
+# Block Kit limits (per message + per section text)
+MAX_BLOCKS = 50
+SECTION_LIMIT = 3000
 
-# instantiate Slack client
-slack_client = SlackClient(os.environ.get("SLACK_BOT_TOKEN"))
+# time in-flight commands get to finish once the connection closes (before they are cancelled) [s]
+DRAIN_TIMEOUT = 10
+
+# break before reconnecting after the connection dropped or the listener failed [s]
+RECONNECT_DELAY = 5
+
+# history command
+WINDOW_UNITS = {'m': 60, 'h': 60 * 60, 'd': 24 * 60 * 60, 'w': 7 * 24 * 60 * 60}
+SPARK_BARS = '▁▂▃▄▅▆▇█'
+HISTORY_FIELDS = [('moisture', '%'), ('temperature', '°C'), ('light', 'lux'), ('conductivity', 'uS/cm')]
 
 # starterbot's user ID in Slack: value is assigned after the bot starts up
 plantbot_id = None
@@ -26,15 +40,15 @@ plantbot_id = None
 def parse_bot_commands(slack_events):
     """
         Parses a list of events coming from the Slack RTM API to find bot commands.
-        If a bot command is found, this function returns a tuple of command and channel.
-        If its not found, then this function returns None, None.
+        Returns a list of (command, channel) tuples for every bot command in the batch (empty if there is none).
     """
+    commands = []
     for event in slack_events:
-        if event["type"] == "message" and "subtype" not in event:
+        if event.get("type") == "message" and "subtype" not in event:
             user_id, message = parse_direct_mention(event["text"])
             if user_id == plantbot_id:
-                return message, event["channel"]
-    return None, None
+                commands.append((message, event["channel"]))
+    return commands
 
 
 def parse_direct_mention(message_text):
@@ -47,60 +61,259 @@ def parse_direct_mention(message_text):
     return (matches.group(1), matches.group(2).strip()) if matches else (None, None)
 
 
+def _parse_window(text):
+    """
+        Parses a time window like "30m", "6h", "2d" or "1w" into seconds (None if it can't be parsed)
+    """
+    matches = re.match(WINDOW_REGEX, text or '')
+    return int(matches.group(1)) * WINDOW_UNITS[matches.group(2)] if matches else None
+
+
+def _sparkline(values):
+    """
+        Renders a list of values as a unicode sparkline (one bar per value)
+    """
+    lo, hi = min(values), max(values)
+    if hi == lo:
+        return SPARK_BARS[0] * len(values)
+    return ''.join(SPARK_BARS[int((v - lo) / (hi - lo) * (len(SPARK_BARS) - 1))] for v in values)
+
+
+def _sections(lines):
+    """
+        Packs mrkdwn lines into as few Block Kit sections as possible (respecting the text limit per section)
+    """
+    blocks, text = [], ''
+    for line in lines:
+        if text and len(text) + len(line) + 1 > SECTION_LIMIT:
+            blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": text}})
+            text = ''
+        text = line if not text else text + '\n' + line
+    if text:
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": text}})
+    return blocks
+
+
 def handle_info_command(command, channel):
-    # load the plant definition file
-    with open(PLANT_DEF, 'r') as src:
-        plant_def = json.load(src)
+    # registered plants (re-loaded only if the definition file changed)
+    names = get_registry().names()
 
-    # iterate through plants
-    for p in plant_def['plants']:
-        # query latest plant information
-        data = latest_data(p['name'], num=1)[0]
+    # restrict to a single plant (i.e. "info <plant>")
+    args = command.split()[1:]
+    if args:
+        if args[0] not in names:
+            return [(channel, "Unknown plant *{}*, try one of: {}".format(args[0], ", ".join(names)), None)]
+        names = args[:1]
 
-        message = '*{}* info [{}]:\n'.format(p['name'], data['date'])
-        message += '===========================\n'
-        message += '*Moisture* = {} %\n'.format(data['moisture'])
-        message += '*Temperature* = {} °C\n'.format(data['temperature'])
-        message += '*Light* = {} lux\n'.format(data['light'])
-        message += '*Conductivity* = {} uS/cm\n\n'.format(data['conductivity'])
+    # latest plant information from the summary cache (i.e. no DB query)
+    latest = get_summary_cache().latest(names)
+    if not latest:
+        return [(channel, "No plant data available (yet)", None)]
 
-        slack_client.api_call("chat.postMessage", channel=channel, text=message)
+    lines = []
+    for name in names:
+        if name not in latest:
+            continue
+        data = latest[name]
+        lines.append('*{}* [{}]\n:droplet: {} %   :thermometer: {} °C   :sunny: {} lux   :seedling: {} uS/cm'.format(
+            name, data['date'], data['moisture'], data['temperature'], data['light'], data['conductivity']))
 
+    text = ', '.join('{} {} %'.format(name, latest[name]['moisture']) for name in names if name in latest)
+    blocks = [{"type": "header", "text": {"type": "plain_text", "text": "PlantBot info"}}] + _sections(lines)
+    return [(channel, text, blocks[:MAX_BLOCKS])]
 
-def handle_help_command(command, channel):
-    response = "Try one of the following commands: {}".format(", ".join(list(COMMAND_HANDLERS.keys())))
-    slack_client.api_call("chat.postMessage", channel=channel, text=response)
 
+def handle_history_command(command, channel):
+    args = command.split()[1:]
+    if not args:
+        return [(channel, "Usage: history <plant> [window, e.g. 6h, 2d, 1w]", None)]
+    window = _parse_window(args[1]) if len(args) > 1 else HISTORY_WINDOW
+    if window is None or window > SUMMARY_WINDOW:
+        return [(channel, "Unknown window *{}*, try e.g. 30m, 6h, 2d (up to {}d)".format(
+            args[1], SUMMARY_WINDOW // WINDOW_UNITS['d']), None)]
+
+    # measurements of the window from the summary cache (i.e. no DB query)
+    history = get_summary_cache().history(args[0], window)
+    if not history:
+        return [(channel, "No data for *{}*".format(args[0]), None)]
+
+    lines = ['*{}* history [{} - {}], {} readings'.format(args[0], history[0]['date'], history[-1]['date'],
+                                                         len(history))]
+    step = -(-len(history) // SPARK_WIDTH)
+    for field, unit in HISTORY_FIELDS:
+        values = [data[field] for data in history]
+        lines.append('*{}* `{}` min {} / mean {:.1f} / max {} {}'.format(
+            field.capitalize(), _sparkline(values[::step]), min(values), sum(values) / len(values), max(values), unit))
+
+    text = '{} moisture {} % -> {} %'.format(args[0], history[0]['moisture'], history[-1]['moisture'])
+    return [(channel, text, _sections(lines))]
 
-def __send_typing_event(channel):
-    typing_event_json = {"id": 1, "type": "typing", "channel": channel}
-    slack_client.server.send_to_websocket(typing_event_json)
+
+def handle_help_command(command, channel):
+    response = "Try one of the following commands: {}".format(", ".join(COMMAND_USAGE))
+    return [(channel, response, None)]
 
 
 COMMAND_HANDLERS = {
     "info": handle_info_command,
+    "history": handle_history_command,
     "help": handle_help_command
 }
 
+COMMAND_USAGE = ["info [plant]", "history <plant> [window]", "help"]
+
 
-def handle_command(command, channel):
+class Listener(object):
     """
-        Executes bot command if the command is known
+    Event-driven PlantBot listener. Every batch of events is parsed for bot commands, all commands are handled
+    concurrently and the (DB-bound) command handlers run in a worker pool, i.e. they never block the event loop.
+
+    Args:
+        dispatcher (obj): `SlackDispatcher` used for posting the responses
+        workers (int): number of worker threads for the command handlers
+        sync (bool): pick up readings committed by another process (not needed if the ingestion runs in-process)
+
     """
-    print('Handling command "{}"'.format(command))
-    handler_func = COMMAND_HANDLERS.get(command, handle_help_command)
-    handler_func(command, channel)
 
+    def __init__(self, dispatcher, workers=LISTEN_WORKERS, sync=True):
+        self.dispatcher = dispatcher
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.sync = sync
+        self._tasks = set()
 
-if __name__ == "__main__":
-    if slack_client.rtm_connect(with_team_state=False):
-        print("PlantBot is alive")
-        # Read bot's user ID by calling Web API method `auth.test`
-        plantbot_id = slack_client.api_call("auth.test")["user_id"]
+    async def handle_command(self, session, semaphore, command, channel):
+        """
+            Executes bot command if the command is known (and posts its responses)
+        """
+        logging.info('Handling command "{}"'.format(command))
+        handler_func = COMMAND_HANDLERS.get(command.split()[0] if command else None, handle_help_command)
+        messages = await asyncio.get_event_loop().run_in_executor(self.executor, handler_func, command, channel)
+        return await asyncio.gather(*[self.post(session, semaphore, c, t, b) for c, t, b in messages])
+
+    async def post(self, session, semaphore, channel, text, blocks=None):
+        """
+            Posts a response (as Block Kit blocks with `text` as notification fallback, if given)
+        """
+        params = {"channel": channel, "text": text}
+        if blocks:
+            params["blocks"] = json.dumps(blocks)
+        return await self.dispatcher.call(session, semaphore, "chat.postMessage", **params)
+
+    async def handle_events(self, session, semaphore, slack_events):
+        """
+            Handles every bot command of a batch of events concurrently
+        """
+        return await asyncio.gather(*[self.handle_command(session, semaphore, command, channel)
+                                      for command, channel in parse_bot_commands(slack_events)])
+
+    def _task_done(self, task):
+        """
+            Forgets a finished event batch task and logs its failure (if any)
+        """
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Handling events failed", exc_info=task.exception())
+
+    async def _drain(self):
+        """
+            Waits for the in-flight event batch tasks (at most DRAIN_TIMEOUT seconds) and cancels the rest
+        """
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=DRAIN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logging.error("Cancelled {} unfinished event batches".format(len(pending)))
+            await asyncio.wait(pending)
+
+    async def sync_summaries(self):
+        """
+            Keeps the summary cache up to date with the readings committed by the PlantBot process
+        """
+        loop = asyncio.get_event_loop()
         while True:
-            command, channel = parse_bot_commands(slack_client.rtm_read())
-            if command:
-                handle_command(command, channel)
-            time.sleep(RTM_READ_DELAY)
-    else:
-        print("Connection failed. Exception traceback printed above.")
+            await asyncio.sleep(SUMMARY_SYNC)
+            try:
+                await loop.run_in_executor(self.executor, get_summary_cache().sync)
+            except Exception:
+                logging.exception("Summary sync failed")
+
+    async def run(self):
+        """
+            Connects to the RTM API and handles events as they arrive (until the connection drops)
+        """
+        # load the recent readings once (i.e. commands are answered from memory)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, get_summary_cache().warm)
+        sync = asyncio.ensure_future(self.sync_summaries()) if self.sync else None
+
+        try:
+            await self._listen()
+        finally:
+            if sync is not None:
+                sync.cancel()
+
+    async def _listen(self):
+        global plantbot_id
+
+        semaphore = asyncio.Semaphore(self.dispatcher.concurrency)
+        async with aiohttp.ClientSession() as session:
+            resp = await self.dispatcher.call(session, semaphore, "rtm.connect")
+            if resp is None:
+                logging.error("Connection failed.")
+                return
+
+            # Read bot's user ID from the connection response
+            plantbot_id = resp["self"]["id"]
+            logging.info("PlantBot is alive")
+
+            try:
+                async with session.ws_connect(resp["url"], heartbeat=30) as ws:
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            task = asyncio.ensure_future(self.handle_events(session, semaphore,
+                                                                            [json.loads(msg.data)]))
+                            self._tasks.add(task)
+                            task.add_done_callback(self._task_done)
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+            finally:
+                # no task may outlive the session
+                await self._drain()
+
+
+def listen_forever(sync=True):
+    """
+        Runs the listener on its own event loop, reconnecting whenever the connection drops or the listener fails
+        (e.g. an unexpected payload), i.e. the listener thread never dies
+    """
+    listener = Listener(SlackDispatcher(os.environ.get("SLACK_BOT_TOKEN"),
+                                        base_url=os.environ.get("SLACK_API_URL", SLACK_API_URL),
+                                        concurrency=SLACK_CONCURRENCY), sync=sync)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    while True:
+        try:
+            loop.run_until_complete(listener.run())
+        except aiohttp.ClientError as e:
+            logging.error("Connection lost: {}".format(repr(e)))
+        except Exception:
+            logging.exception("Listener failed")
+
+        # reconnect after a short break
+        loop.run_until_complete(asyncio.sleep(RECONNECT_DELAY))
+
+
+def register(scheduler, sync=True):
+    """
+        Runs the listener (in a background thread) alongside the jobs of a scheduler, starting with the scheduler
+    """
+    from apscheduler.events import EVENT_SCHEDULER_START
+
+    thread = threading.Thread(target=listen_forever, kwargs={'sync': sync}, name='slackbot_listen', daemon=True)
+    scheduler.add_listener(lambda event: thread.start(), EVENT_SCHEDULER_START)
+
+
+if __name__ == "__main__":
+    listen_forever()
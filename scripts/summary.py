@@ -0,0 +1,140 @@
+import bisect
+import threading
+import time
+from datetime import datetime as dt
+
+from constants import SUMMARY_WINDOW
+from db import FIELDS, changed_data, commit_seq, since_data
+
+
+class SummaryCache(object):
+    """
+    In-process cache of the recent measurements of every plant (the last `window` seconds), i.e. the read side of the
+    Slack commands never touches the DB. The ingestion path adds every new reading (see `ingest.Ingestor.add`); a
+    process without its own ingestion (e.g. the Slack listener) loads the window once (`warm`) and periodically picks
+    up newly committed readings (`sync`).
+
+    Args:
+        window (int): time span of cached measurements per plant [s]
+
+    """
+
+    def __init__(self, window=SUMMARY_WINDOW):
+        self.window = window
+        self.stats = {'queries': 0, 'readings': 0}
+        self._ts = {}
+        self._readings = {}
+        self._synced = None
+        self._lock = threading.Lock()
+
+    def _insert(self, plant_name, data):
+        """
+        Insert a measurement dictionary (ordered by ts, duplicates are replaced) and drop readings outside the window.
+
+        """
+        ts = self._ts.setdefault(plant_name, [])
+        readings = self._readings.setdefault(plant_name, [])
+        idx = bisect.bisect_left(ts, data['ts'])
+        if idx < len(ts) and ts[idx] == data['ts']:
+            readings[idx] = data
+        else:
+            ts.insert(idx, data['ts'])
+            readings.insert(idx, data)
+            self.stats['readings'] += 1
+
+        cut = bisect.bisect_left(ts, ts[-1] - self.window)
+        if cut:
+            del ts[:cut]
+            del readings[:cut]
+
+    def add(self, plant_name, ts, data):
+        """
+        Add a new reading (called by the ingestion path).
+
+        Args:
+            plant_name (str): name of plant
+            ts (int): epoch timestamp of the measurement
+            data (dict): measurements (see `polling.Reading.measurements`)
+
+        """
+        out = {'ts': int(ts), 'date': dt.fromtimestamp(int(ts)).strftime("%Y/%m/%d, %H:%M:%S")}
+        out.update((f, data[f]) for f in FIELDS)
+        with self._lock:
+            self._insert(plant_name, out)
+
+    def sync(self, now=None):
+        """
+        Load the committed readings which are not cached yet (everything within the window on the first call). New
+        readings are found in commit order (see `db.changed_data`), i.e. readings committed late (e.g. by a retried
+        flush or an edge node catching up) are picked up no matter how old their timestamps are.
+
+        """
+        now = int(time.time()) if now is None else int(now)
+        if self._synced is None:
+            # position first (a commit in between is loaded twice, not missed)
+            seq = commit_seq()
+            rows = since_data(now - self.window)
+        else:
+            seq, rows = changed_data(self._synced, now - self.window)
+        with self._lock:
+            self.stats['queries'] += 1
+            for name, readings in rows.items():
+                for data in readings:
+                    self._insert(name, data)
+            self._synced = seq
+
+    def warm(self, now=None):
+        """
+        Load the window from the DB (once, i.e. a no-op for an already synced cache).
+
+        """
+        if self._synced is None:
+            self.sync(now)
+
+    def latest(self, plant_names=None):
+        """
+        Latest measurement of every (cached) plant.
+
+        Args:
+            plant_names (list): names of plants to include (defaults to all cached plants)
+
+        Returns:
+            out (dict): plant name -> dictionary containing plant measurements
+
+        """
+        with self._lock:
+            names = self._readings.keys() if plant_names is None else plant_names
+            return {name: self._readings[name][-1] for name in names if self._readings.get(name)}
+
+    def history(self, plant_name, seconds):
+        """
+        Cached measurements of a plant within the last `seconds` (relative to its latest reading).
+
+        Returns:
+            out (list): list of dictionaries containing plant measurements (oldest first)
+
+        """
+        with self._lock:
+            ts = self._ts.get(plant_name)
+            if not ts:
+                return []
+            return self._readings[plant_name][bisect.bisect_left(ts, ts[-1] - seconds):]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_summary_cache():
+    """
+    Function for getting the shared summary cache of this process.
+
+    Returns:
+        cache (obj): shared `SummaryCache` instance
+
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SummaryCache()
+        return _cache
@@ -0,0 +1,34 @@
+"""
+PlantBot utilities, split into focused submodules which are only imported on first use (i.e. a script importing
+`giphy_grabber` does not pay for astral or the Bluetooth stack):
+
+- `utils.daylight`: precomputed sunrise/sunset times (`get_daylight`, `get_daylight_hours`, `get_sun_table`)
+- `utils.sweep`: sensor sweep + ingestion job (`get_plant_data`)
+- `utils.giphy`: gif urls for Slack messages (`giphy_grabber`)
+
+The names are also available from `utils` directly (resolved lazily), together with the DB functions re-exported for
+backwards compatibility.
+
+"""
+import importlib
+
+_EXPORTS = {
+    'get_daylight': 'utils.daylight',
+    'get_daylight_hours': 'utils.daylight',
+    'get_plant_data': 'utils.sweep',
+    'get_sun_table': 'utils.daylight',
+    'giphy_grabber': 'utils.giphy',
+    'insert_data': 'db',
+    'latest_data': 'db',
+    'latest_data_all': 'db',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module 'utils' has no attribute '{}'".format(name))
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date
+from datetime import datetime as dt
+from datetime import timedelta
+
+from dateutil import tz
+from dotenv import load_dotenv
+
+from constants import SUN_TABLE_DAYS, SUN_TABLE_PATH
+
+load_dotenv(dotenv_path='.envrc')
+
+# deal with timezones
+utc_zone = tz.tzutc()
+local_zone = tz.tzlocal()
+
+LAT = os.environ.get("LAT")
+LON = os.environ.get("LON")
+
+
+def _location(lat, lon):
+    """
+    Utility for the location key of a sun table (~10 m precision, i.e. formatting differences do not matter).
+
+    """
+    return [round(float(lat), 4), round(float(lon), 4)]
+
+
+class SunTable(object):
+    """
+    Precomputed sunrise/sunset times (epoch timestamps, minute resolution) of a location for `days` local dates, i.e. a
+    lookup is a list index instead of an astral computation. The table is persisted (astral is only imported for
+    building it) and rebuilt when the location or the local timezone changes or a date outside of the table is looked
+    up. Days without sunrise (polar night) or sunset are None, a polar day spans from midnight to midnight.
+
+    Args:
+        lat (float): latitude
+        lon (float): longitude
+        days (int): number of local dates covered
+        path (str): JSON file for persisting the table (None for memory only)
+
+    """
+
+    def __init__(self, lat, lon, days=SUN_TABLE_DAYS, path=SUN_TABLE_PATH):
+        self.location = _location(lat, lon)
+        self.days = days
+        self.path = path
+        self.start = None
+        self._sunrise = []
+        self._sunset = []
+        self._lock = threading.Lock()
+
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'r') as src:
+                    table = json.load(src)
+                if table['location'] == self.location and table['tz'] == list(time.tzname):
+                    self.start = table['start']
+                    self._sunrise, self._sunset = table['sunrise'], table['sunset']
+            except (ValueError, KeyError):
+                logging.error('[SunTable] -> Ignoring corrupt table {}'.format(path))
+
+    def _build(self, first):
+        """
+        Compute the table starting at a local date (ordinal). Events are computed per UTC date (with a margin) and
+        assigned to the local date they fall on.
+
+        """
+        from astral import Astral, AstralError
+
+        lat, lon = self.location
+        sunrise, sunset = [None] * self.days, [None] * self.days
+        astral = Astral()
+        for ordinal in range(first - 1, first + self.days + 1):
+            day = date.fromordinal(ordinal)
+            for events, func, pick in [(sunrise, astral.sunrise_utc, min), (sunset, astral.sunset_utc, max)]:
+                try:
+                    event = int(round(func(day, lat, lon).timestamp() / 60)) * 60
+                except AstralError:
+                    continue
+                idx = dt.fromtimestamp(event).date().toordinal() - first
+                if 0 <= idx < self.days:
+                    events[idx] = event if events[idx] is None else pick(events[idx], event)
+
+        # polar day = sunrise at midnight + sunset at the next midnight (polar night stays None)
+        for idx in range(self.days):
+            if sunrise[idx] is None and sunset[idx] is None:
+                midnight = dt.combine(date.fromordinal(first + idx), dt.min.time())
+                if astral.solar_elevation((midnight + timedelta(hours=12)).replace(tzinfo=local_zone), lat, lon) > 0:
+                    sunrise[idx] = int(midnight.timestamp())
+                    sunset[idx] = int((midnight + timedelta(days=1)).timestamp())
+
+        self.start, self._sunrise, self._sunset = first, sunrise, sunset
+        logging.info('[SunTable] -> Computed {} days from {} for {}'.format(self.days, date.fromordinal(first),
+                                                                           self.location))
+        if self.path is None:
+            return
+        try:
+            with open(self.path + '.tmp', 'w') as dst:
+                json.dump({'location': self.location, 'tz': list(time.tzname), 'start': first, 'sunrise': sunrise,
+                           'sunset': sunset}, dst)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError:
+            logging.exception('[SunTable] -> Unable to persist {}'.format(self.path))
+
+    def sun(self, day):
+        """
+        Sunrise and sunset of a local date.
+
+        Args:
+            day (obj): datetime date object
+
+        Returns:
+            sunrise (int): epoch timestamp (None if the sun does not rise)
+            sunset (int): epoch timestamp (None if the sun does not set)
+
+        """
+        ordinal = day.toordinal()
+        with self._lock:
+            if self.start is None or not 0 <= ordinal - self.start < self.days:
+                # keep a week before the requested date (e.g. replaying recent history)
+                self._build(ordinal - 7)
+            idx = ordinal - self.start
+            return self._sunrise[idx], self._sunset[idx]
+
+    def daylight(self, ts):
+        """
+        Whether the sun is up at an epoch timestamp.
+
+        """
+        sunrise, sunset = self.sun(dt.fromtimestamp(ts).date())
+        if sunrise is None and sunset is None:
+            return False
+        if sunrise is not None and sunset is not None and sunset < sunrise:
+            # the local timezone is far off the location (i.e. the sun sets before it rises within a local date)
+            return ts < sunset or ts >= sunrise
+        return (sunrise is None or sunrise <= ts) and (sunset is None or ts < sunset)
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_sun_table(lat=None, lon=None):
+    """
+    Function for getting the shared sun table of this process (replaced when the location changes).
+
+    Args:
+        lat (float): latitude (defaults to ENV LAT)
+        lon (float): longitude (defaults to ENV LON)
+
+    Returns:
+        table (obj): shared `SunTable` instance
+
+    """
+    global _table
+    lat = LAT if lat is None else lat
+    lon = LON if lon is None else lon
+    with _table_lock:
+        if _table is None or _table.location != _location(lat, lon):
+            _table = SunTable(lat, lon)
+        return _table
+
+
+def get_daylight(lat, lon, today):
+    """
+    Function for determining the sunrise and sunset times (minute resolution) based on a geolocation.
+
+    Args:
+        lat (float): latitude
+        lon (float): longitude
+        today (obj): datetime python object
+
+    Returns:
+        <sunrise>, <sunset> (local timezone aware datetime objects, None if the sun does not rise/set)
+
+    """
+    func_name = 'get_daylight'
+    logging.info("[{}] -> Starting Job".format(func_name))
+
+    logging.info('[{}] -> Location: ({}, {})'.format(func_name, lat, lon))
+
+    sunrise, sunset = get_sun_table(lat, lon).sun(today)
+    sunrise = None if sunrise is None else dt.fromtimestamp(sunrise, local_zone)
+    sunset = None if sunset is None else dt.fromtimestamp(sunset, local_zone)
+
+    logging.info('[{}] -> Sunrise: {}'.format(func_name, sunrise))
+    logging.info('[{}] -> Sunset: {}'.format(func_name, sunset))
+
+    return sunrise, sunset
+
+
+def get_daylight_hours(lat, lon, today):
+    """
+    Function for determining the sunrise and sunset hours (local time) based on a geolocation, see `get_daylight` for
+    minute resolution.
+
+    Args:
+        lat (float): latitude
+        lon (float): longitude
+        today (obj): datetime python object
+
+    Returns:
+        <sunrise>, <sunset>
+
+    """
+    sunrise, sunset = get_daylight(lat, lon, today)
+    return (0 if sunrise is None else sunrise.hour), (24 if sunset is None else sunset.hour)
@@ -0,0 +1,15 @@
+from giphy_cache import get_giphy_cache
+
+
+def giphy_grabber(search):
+    """
+    Utility for picking a random gif based on a search term (from the local giphy cache, see `giphy_cache.py`).
+
+    Args:
+        search (str): search term for querying API
+
+    Returns:
+        url (str): url of randomly selected gif (None if no gif is available, e.g. offline)
+
+    """
+    return get_giphy_cache().pick(search.replace('_', ' '))
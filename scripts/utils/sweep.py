@@ -0,0 +1,59 @@
+import logging
+
+from health import get_sensor_health
+from ingest import get_ingestor
+from metrics import timed
+from polling import poll_sensors, read_sensor
+from registry import get_registry
+
+
+@timed('plantbot_job_seconds', job='get_plant_data')
+def get_plant_data(plants=None, reader=read_sensor):
+    """
+    Main function for extracting current plant measurements (per plant). Sensors backing off after failed reads (see
+    `SensorHealth`) are skipped, a failing sensor or reading never aborts the sweep for the remaining plants.
+
+    Args:
+        plants (list): plant definitions to read (defaults to all registered plants)
+        reader (func): callable returning a `Reading` for a MAC address (see `polling.FakeReader`)
+
+    Returns:
+        readings (dict): `Reading` per plant name (successful reads only)
+
+    """
+    func_name = 'get_plant_data'
+    logging.info("[{}] -> Starting Job".format(func_name))
+
+    # registered plants (re-loaded only if the definition file changed)
+    if plants is None:
+        plants = get_registry().plants()
+
+    # skip sensors backing off (i.e. no read budget spent on unreachable hardware)
+    health = get_sensor_health()
+    skipped = [p.name for p in plants if not health.allow(p.name)]
+    if skipped:
+        logging.info("[{}] -> Skipping {} failing sensors: {}".format(func_name, len(skipped), ", ".join(skipped)))
+        plants = [p for p in plants if p.name not in skipped]
+
+    # read all sensors (concurrently)
+    logging.info("[{}] -> Getting data from {} Mi Flora sensors".format(func_name, len(plants)))
+    readings, timings, errors = poll_sensors(plants, reader=reader)
+    for name, elapsed in timings.items():
+        if elapsed is not None:
+            logging.info("[{}] -> Read {} in {:.1f}s".format(func_name, name, elapsed))
+    for p in plants:
+        if p.name in readings:
+            health.success(p.name)
+        else:
+            health.failure(p.name, errors.get(p.name, 'no reading'))
+
+    # write to DB (single commit per sweep, a failed commit is retried with the next flush)
+    ingestor = get_ingestor()
+    for name, reading in readings.items():
+        try:
+            ingestor.add(name, reading.measurements())
+        except Exception:
+            logging.exception("[{}] -> Unable to buffer reading of {}".format(func_name, name))
+    logging.info("[{}] -> Writing {} readings to DB".format(func_name, ingestor.pending))
+    ingestor.flush()
+    return readings
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+# scripts are flat modules imported by their bare name (like when running ./scripts/<name>.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Fresh working directory with an empty ./data (i.e. its own sqlite DB, journals and caches) and fresh shared
+    singletons of this process.
+
+    """
+    import db
+    import health
+    import ingest
+    import summary
+
+    db.close_db()
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.dirname(db.DB_PATH))
+    monkeypatch.setattr(health, '_health', None)
+    monkeypatch.setattr(ingest, '_ingestor', None)
+    monkeypatch.setattr(summary, '_cache', None)
+    yield tmp_path
+    if ingest._ingestor is not None:
+        ingest._ingestor.close()
+    db.close_db()
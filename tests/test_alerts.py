@@ -0,0 +1,110 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import registry
+import slackbot_alert
+from alerts import DRYING, HEALTHY, THIRSTY, WATERED, AlertStates, next_state
+from db import insert_many
+
+NOW = 1600000000
+HOUR = 60 * 60
+
+
+def test_thirsty_needs_the_hysteresis_to_count_as_watered():
+    assert next_state(HEALTHY, 29, 30) == THIRSTY
+    assert next_state(THIRSTY, 31, 30, hysteresis=5) == THIRSTY
+    assert next_state(THIRSTY, 34.9, 30, hysteresis=5) == THIRSTY
+    assert next_state(THIRSTY, 35, 30, hysteresis=5) == WATERED
+    assert next_state(WATERED, 40, 30) == HEALTHY
+    assert next_state(WATERED, 29, 30) == THIRSTY
+
+
+def test_drying_ahead_of_the_predicted_crossing():
+    assert next_state(HEALTHY, 35, 30, soon=True) == DRYING
+    assert next_state(DRYING, 35, 30, soon=False) == HEALTHY
+    assert next_state(DRYING, 29, 30, soon=True) == THIRSTY
+
+
+def test_thirsty_is_repeated_after_the_cooldown_only(workdir):
+    states = AlertStates(cooldown=6 * HOUR)
+    assert states.update('minty', 20, 30, now=NOW) == THIRSTY
+    states.notified('minty', now=NOW)
+    assert states.update('minty', 20, 30, now=NOW + 6 * HOUR - 1) is None
+    assert states.update('minty', 32, 30, now=NOW + 6 * HOUR - 1) is None
+    assert states.update('minty', 20, 30, now=NOW + 6 * HOUR) == THIRSTY
+
+
+def test_unnotified_alerts_are_repeated(workdir):
+    states = AlertStates(cooldown=6 * HOUR)
+    assert states.update('minty', 20, 30, now=NOW) == THIRSTY
+    # e.g. the Slack post failed
+    assert states.update('minty', 20, 30, now=NOW + 60) == THIRSTY
+
+
+def test_watered_and_drying_are_sent_once(workdir):
+    states = AlertStates(cooldown=6 * HOUR, lead=12 * HOUR)
+    assert states.update('minty', 20, 30, now=NOW) == THIRSTY
+    states.notified('minty', now=NOW)
+    assert states.update('minty', 40, 30, now=NOW + HOUR) == WATERED
+    assert states.update('minty', 40, 30, now=NOW + 2 * HOUR) is None
+    assert states.get('minty') == HEALTHY
+
+    assert states.update('minty', 35, 30, now=NOW + 7 * HOUR, due=NOW + 10 * HOUR) == DRYING
+    states.notified('minty', now=NOW + 7 * HOUR)
+    assert states.update('minty', 34, 30, now=NOW + 8 * HOUR, due=NOW + 10 * HOUR) is None
+    # prediction hovering around the lead time (no repeated heads-up within the cooldown)
+    assert states.update('minty', 34, 30, now=NOW + 9 * HOUR, due=NOW + 30 * HOUR) is None
+    assert states.update('minty', 33, 30, now=NOW + 10 * HOUR, due=NOW + 20 * HOUR) is None
+
+
+def test_state_is_persisted(workdir):
+    states = AlertStates(cooldown=6 * HOUR)
+    states.update('minty', 20, 30, now=NOW)
+    states.notified('minty', now=NOW)
+
+    states = AlertStates(cooldown=6 * HOUR)
+    assert states.get('minty') == THIRSTY
+    assert states.update('minty', 20, 30, now=NOW + HOUR) is None
+    assert states.update('minty', 40, 30, now=NOW + 2 * HOUR) == WATERED
+
+
+class FakeDispatcher(object):
+
+    def __init__(self):
+        self.ok = False
+        self.messages = []
+
+    def dispatch(self, messages):
+        self.messages.extend(messages)
+        return [{'ok': True} if self.ok else None for _ in messages]
+
+
+@pytest.fixture
+def alert(workdir, monkeypatch):
+    with open('./data/plant_def.json', 'w') as dst:
+        json.dump({'plants': [{'name': 'minty', 'mac_address': 'FA:CE:00:00:00:01', 'min_moisture': 30}]}, dst)
+    monkeypatch.setattr(registry, '_registry', None)
+    monkeypatch.setattr(slackbot_alert, 'alert_states', AlertStates())
+    monkeypatch.setattr(slackbot_alert, 'dispatcher', FakeDispatcher())
+    monkeypatch.setattr(slackbot_alert, 'giphy_grabber', lambda term: None)
+    monkeypatch.setattr(slackbot_alert, 'get_predictor', lambda: SimpleNamespace(predict=lambda plants, latest: {}))
+    return slackbot_alert.dispatcher
+
+
+def test_failed_dispatch_is_not_recorded(alert):
+    insert_many([('minty', int(time.time()), {'temperature': 21.5, 'moisture': 20, 'light': 1200,
+                                               'conductivity': 450, 'battery': 87})])
+    slackbot_alert.slackbot_alert()
+    assert len(alert.messages) == 1
+    assert slackbot_alert.alert_states._load()['minty']['notified'] is None
+
+    # retried on the next run, the cooldown only starts once the message went out
+    alert.ok = True
+    slackbot_alert.slackbot_alert()
+    assert len(alert.messages) == 2
+    assert slackbot_alert.alert_states._load()['minty']['notified'] is not None
+    slackbot_alert.slackbot_alert()
+    assert len(alert.messages) == 2
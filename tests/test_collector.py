@@ -0,0 +1,126 @@
+import http.client
+import json
+
+import pytest
+
+from collector import Collector, Forwarder, decode_batch, encode_batch
+from db import latest_data
+
+TOKEN = 's3cret'
+NOW = 1600000000
+
+
+def _data(moisture=40):
+    return {'temperature': 21.5, 'moisture': moisture, 'light': 1200, 'conductivity': 450, 'battery': 87}
+
+
+@pytest.fixture
+def collector(workdir):
+    collector = Collector(host='127.0.0.1', port=0, token=TOKEN)
+    collector.start()
+    yield collector
+    collector.stop()
+
+
+def _forwarder(port, **kwargs):
+    kwargs.setdefault('token', TOKEN)
+    return Forwarder('http://127.0.0.1:{}'.format(port), node='edge', backoff=0, **kwargs)
+
+
+def _request(port, headers, body=b''):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        conn.putrequest('POST', '/readings')
+        for key, value in headers.items():
+            conn.putheader(key, value)
+        conn.endheaders(body)
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read())
+    finally:
+        conn.close()
+
+
+def test_wire_format_round_trip():
+    rows = [('minty', NOW, _data()), ('oregano', NOW + 60, _data(12))]
+    payload = encode_batch('edge', rows)
+    assert len(payload) < len(json.dumps(rows))
+    assert decode_batch(payload) == ('edge', rows)
+
+
+def test_readings_are_forwarded_once(collector):
+    forwarder = _forwarder(collector.port, batch=2)
+    for ii in range(5):
+        forwarder.add('minty', _data(), ts=NOW + ii * 60)
+    assert forwarder.flush() == 5
+    assert forwarder.pending == 0
+    assert latest_data('minty', num=10)[0]['moisture'] == 40
+    assert len(latest_data('minty', num=10)) == 5
+
+    # a batch re-sent after a lost response is ignored by the collector
+    forwarder.add('minty', _data(), ts=NOW)
+    assert forwarder.flush() == 1
+    assert forwarder.stats['duplicates'] == 1
+    assert collector.stats == {'batches': 4, 'rows': 6, 'inserted': 5}
+    forwarder.close()
+
+
+def test_readings_are_kept_while_the_collector_is_down(workdir):
+    collector = Collector(host='127.0.0.1', port=0, token=TOKEN)
+    port = collector.port
+    collector.server.server_close()
+
+    forwarder = _forwarder(port)
+    forwarder.add('minty', _data(), ts=NOW)
+    assert forwarder.flush() == 0
+    assert forwarder.pending == 1
+    forwarder.close()
+
+    # restarted edge node recovers the journal, the collector is back
+    collector = Collector(host='127.0.0.1', port=port, token=TOKEN)
+    collector.start()
+    try:
+        forwarder = _forwarder(port)
+        assert forwarder.pending == 1
+        assert forwarder.flush() == 1
+        assert len(latest_data('minty', num=10)) == 1
+        forwarder.close()
+    finally:
+        collector.stop()
+
+
+def test_rejected_readings_are_not_retried(collector):
+    # moisture is out of the wire range, i.e. the batch can never be sent
+    forwarder = _forwarder(collector.port, batch=1)
+    forwarder.add('minty', _data(), ts=NOW)
+    forwarder.add('minty', _data(moisture=300), ts=NOW + 60)
+    assert forwarder.flush() == 2
+    assert forwarder.stats['rejected'] == 1
+    assert len(latest_data('minty', num=10)) == 1
+    forwarder.close()
+
+    # 4xx of the collector (wrong token)
+    forwarder = _forwarder(collector.port, token='wrong', rejected_path='./data/rejected')
+    forwarder.add('oregano', _data(), ts=NOW)
+    assert forwarder.flush() == 1
+    assert forwarder.pending == 0
+    assert forwarder.stats['rejected'] == 1
+    assert latest_data('oregano') == []
+    with open('./data/rejected') as src:
+        assert [json.loads(line) for line in src] == [['oregano', NOW, _data()]]
+    forwarder.close()
+
+
+def test_request_size_is_checked(collector):
+    headers = {'X-PlantBot-Token': TOKEN}
+    assert _request(collector.port, headers)[0] == 411
+    assert _request(collector.port, dict(headers, **{'Content-Length': 'many'}))[0] == 400
+    assert _request(collector.port, dict(headers, **{'Content-Length': str(collector.max_body + 1)}))[0] == 413
+    assert _request(collector.port, {'Content-Length': '0'})[0] == 401
+    assert collector.stats['batches'] == 0
+
+
+def test_public_collector_requires_a_token(workdir, monkeypatch):
+    monkeypatch.delenv('PLANTBOT_COLLECTOR_TOKEN', raising=False)
+    with pytest.raises(ValueError):
+        Collector(host='0.0.0.0', port=0)
+    Collector(host='127.0.0.1', port=0).server.server_close()
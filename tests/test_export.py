@@ -0,0 +1,67 @@
+import csv
+import time
+
+import pytest
+
+from constants import RAW_RETENTION
+from db import DAY, FIELDS, HOUR, insert_many, iter_data, prune_raw
+from export import COLUMNS, export, write_csv
+
+
+def test_pruned_range_is_exported_as_hourly_means(workdir):
+    now = int(time.time())
+    first = now - now % HOUR - 10 * DAY
+    # two readings per hour (moisture 30 + 50, i.e. a mean of 40)
+    insert_many([('minty', ts, {'temperature': 20.0, 'moisture': 30 + ts % HOUR // 90, 'light': 1000,
+                                'conductivity': 400, 'battery': 90}) for ts in range(first, now, 30 * 60)])
+    assert prune_raw(now=now + RAW_RETENTION - 5 * DAY) > 0
+
+    n = export('export.csv', plant_names=['minty'], start=first, chunk=50)
+    with open('export.csv') as src:
+        rows = list(csv.DictReader(src))
+    assert len(rows) == n
+    assert list(rows[0]) == COLUMNS
+
+    hourly = [r for r in rows if r['resolution'] == 'hourly']
+    raw = [r for r in rows if r['resolution'] == 'raw']
+    assert hourly and raw
+    assert rows == hourly + raw
+    assert max(int(r['ts']) for r in hourly) < min(int(r['ts']) for r in raw)
+    assert {float(r['moisture']) for r in hourly} == {40.0}
+    assert {float(r['moisture']) for r in raw} == {30.0, 50.0}
+    assert len(raw) + 2 * len(hourly) == len(range(first, now, 30 * 60))
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_arrow_formats_round_trip(workdir, fmt):
+    pa = pytest.importorskip('pyarrow')
+    now = int(time.time())
+    first = now - now % HOUR - 10 * DAY
+    insert_many([('minty', ts, {'temperature': 20.0, 'moisture': 40, 'light': 1000, 'conductivity': 400,
+                                'battery': 90}) for ts in range(first, now, HOUR)])
+    prune_raw(now=now + RAW_RETENTION - 5 * DAY)
+    with open('export.csv', 'w') as dst:
+        write_csv(iter_data(['minty'], first, chunk=50), dst)
+    with open('export.csv') as src:
+        expected = list(csv.DictReader(src))
+
+    path = 'export.{}'.format(fmt)
+    assert export(path, plant_names=['minty'], start=first, chunk=50) == len(expected)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        assert pq.ParquetFile(path).metadata.num_row_groups > 1
+    else:
+        with pa.memory_map(path) as src:
+            table = pa.ipc.open_file(src).read_all()
+
+    assert table.schema.names == COLUMNS
+    # Parquet has no second resolution (stored as milliseconds)
+    assert table.schema.field('ts').type == pa.timestamp('ms' if fmt == 'parquet' else 's', tz='UTC')
+    assert table.schema.field('resolution').type == pa.string()
+    assert all(table.schema.field(f).type == pa.float64() for f in FIELDS)
+    rows = table.to_pylist()
+    assert [r['resolution'] for r in rows] == [r['resolution'] for r in expected]
+    assert {r['resolution'] for r in rows} == {'hourly', 'raw'}
+    assert [int(r['ts'].timestamp()) for r in rows] == [int(r['ts']) for r in expected]
+    assert rows[0]['ts'].utcoffset().total_seconds() == 0
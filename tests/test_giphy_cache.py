@@ -0,0 +1,82 @@
+import os
+import time
+
+import pytest
+
+from giphy_cache import FixtureBackend, GiphyCache
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'giphy.json')
+
+
+class FlakyBackend(FixtureBackend):
+    """
+    Recorded backend raising while `fail` is set (e.g. no network).
+
+    """
+
+    fail = False
+
+    def __call__(self, term, limit):
+        if self.fail:
+            self.calls += 1
+            raise OSError('network is unreachable')
+        return super(FlakyBackend, self).__call__(term, limit)
+
+
+@pytest.fixture
+def backend():
+    return FlakyBackend(FIXTURE)
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_first_pick_fetches_and_later_picks_are_cached(backend):
+    cache = GiphyCache(backend, ttl=60, limit=2)
+    assert cache.pick('plant') in backend.fixture['plant'][:2]
+    assert backend.calls == 1
+
+    for _ in range(10):
+        assert cache.pick('plant') in backend.fixture['plant'][:2]
+    assert backend.calls == 1
+
+
+def test_stale_urls_are_refreshed_in_the_background(backend):
+    cache = GiphyCache(backend, ttl=60)
+    cache.pick('plant')
+    fetched = cache._entries['plant']['fetched']
+    cache._entries['plant']['fetched'] -= 60
+
+    # served from the stale entry right away
+    assert cache.pick('plant') in backend.fixture['plant']
+    assert _wait_for(lambda: cache._entries['plant']['fetched'] >= fetched)
+    assert backend.calls == 2
+
+
+def test_stale_urls_are_kept_if_the_backend_fails(backend):
+    cache = GiphyCache(backend, ttl=60)
+    cache.pick('thirsty')
+    cache._entries['thirsty']['fetched'] -= 60
+    backend.fail = True
+
+    assert cache.pick('thirsty') == backend.fixture['thirsty'][0]
+    assert _wait_for(lambda: backend.calls == 2 and not cache._refreshing)
+    assert cache.urls('thirsty') == backend.fixture['thirsty']
+
+
+def test_no_gif_without_cached_urls(backend):
+    cache = GiphyCache(backend)
+    assert cache.pick('cactus') is None
+    backend.fail = True
+    assert cache.pick('plant') is None
+
+
+def test_cache_is_persisted(workdir, backend):
+    path = str(workdir / 'giphy.json')
+    GiphyCache(backend, persist_path=path).pick('plant')
+    assert GiphyCache(backend, persist_path=path).urls('plant') == backend.fixture['plant']
+    assert backend.calls == 1
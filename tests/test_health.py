@@ -0,0 +1,90 @@
+from constants import HEALTH_BREAKER_COOLDOWN, HEALTH_BREAKER_FAILURES
+from db import latest_data
+from health import SensorHealth, get_sensor_health
+from polling import FakeReader
+from registry import Plant
+from utils.sweep import get_plant_data
+
+NOW = 1600000000
+
+
+def test_first_failure_is_retried_on_the_next_sweep(workdir):
+    health = SensorHealth()
+    assert health.allow('minty', now=NOW)
+    assert health.failure('minty', 'out of range', now=NOW) == NOW
+    assert health.allow('minty', now=NOW)
+    assert health.get('minty') == {'failures': 1, 'since': NOW, 'retry_at': NOW, 'error': 'out of range'}
+
+
+def test_backoff_doubles_up_to_the_maximum(workdir):
+    health = SensorHealth(backoff=60, max_backoff=200, failures=10)
+    delays = []
+    for _ in range(5):
+        delays.append(health.failure('minty', 'err', now=NOW) - NOW)
+    assert delays == [0, 60, 120, 200, 200]
+
+    health.failure('oregano', 'err', now=NOW)
+    retry_at = health.failure('oregano', 'err', now=NOW)
+    assert not health.allow('oregano', now=retry_at - 1)
+    assert health.allow('oregano', now=retry_at)
+
+
+def test_circuit_opens_and_is_probed_after_the_cooldown(workdir):
+    health = SensorHealth(backoff=60, max_backoff=600, failures=3, cooldown=3600)
+    for _ in range(2):
+        health.failure('minty', 'err', now=NOW)
+    assert not health.is_open('minty')
+
+    assert health.failure('minty', 'err', now=NOW) == NOW + 3600
+    assert health.is_open('minty')
+    assert not health.allow('minty', now=NOW + 3599)
+
+    # failed probe: open for another cooldown
+    assert health.allow('minty', now=NOW + 3600)
+    assert health.failure('minty', 'err', now=NOW + 3600) == NOW + 7200
+    assert health.is_open('minty')
+
+    # successful probe: closed, no record left
+    health.success('minty', now=NOW + 7200)
+    assert health.get('minty') is None
+    assert not health.is_open('minty')
+    assert health.allow('minty', now=NOW + 7200)
+
+
+def test_state_persists_across_instances(workdir):
+    health = SensorHealth()
+    for _ in range(HEALTH_BREAKER_FAILURES):
+        health.failure('minty', 'no answer', now=NOW)
+    health.failure('oregano', 'no answer', now=NOW)
+
+    restarted = SensorHealth()
+    assert restarted.is_open('minty')
+    assert restarted.get('minty')['retry_at'] == NOW + HEALTH_BREAKER_COOLDOWN
+    assert restarted.get('oregano')['failures'] == 1
+
+    restarted.success('minty')
+    assert SensorHealth().get('minty') is None
+    assert SensorHealth().get('oregano')['failures'] == 1
+
+
+def test_sweep_skips_failing_sensors(workdir):
+    plants = [Plant('plant_{}'.format(ii), 'FA:CE:00:00:00:{:02X}'.format(ii), 20) for ii in range(4)]
+    dead, malformed = plants[0], plants[1]
+    reader = FakeReader(latency=(0, 0), dead=[dead.mac_address], malformed=[malformed.mac_address], seed=1)
+    health = get_sensor_health()
+
+    readings = get_plant_data(plants, reader=reader)
+    assert sorted(readings) == ['plant_2', 'plant_3']
+    assert latest_data('plant_2')[0]['moisture'] == readings['plant_2'].moisture
+    assert latest_data(dead.name) == [] and latest_data(malformed.name) == []
+    assert 'Fake read failure' in health.get(dead.name)['error']
+    assert 'implausible' in health.get(malformed.name)['error']
+
+    # first failure: retried right away, second failure: backing off (i.e. skipped by the next sweep)
+    get_plant_data(plants, reader=reader)
+    assert health.get(dead.name)['failures'] == 2
+    readings = get_plant_data(plants, reader=reader)
+    assert sorted(readings) == ['plant_2', 'plant_3']
+    assert health.get(dead.name)['failures'] == 2
+    assert health.get(malformed.name)['failures'] == 2
+    assert health.get('plant_2') is None
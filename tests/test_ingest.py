@@ -0,0 +1,63 @@
+import pytest
+
+import metrics
+from db import latest_data_all
+from ingest import Ingestor
+
+
+class FailingIngestor(Ingestor):
+    """
+    Ingestor with a DB that is gone while `fail` is set.
+
+    """
+
+    fail = True
+
+    def _commit(self, rows):
+        if self.fail:
+            raise OSError('disk I/O error')
+        super(FailingIngestor, self)._commit(rows)
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    monkeypatch.setattr(metrics, '_metrics', metrics.Metrics(process='test'))
+    return metrics.get_metrics()
+
+
+def _data(moisture=40):
+    return {'temperature': 21.5, 'moisture': moisture, 'light': 1200, 'conductivity': 450, 'battery': 87}
+
+
+def test_flushes_are_exported(workdir, sink):
+    ingestor = Ingestor(journal_path='./data/journal.jsonl')
+    ingestor.add('minty', _data(), ts=1600000000)
+    ingestor.add('oregano', _data(), ts=1600000000)
+    assert ingestor.flush() == 2
+    ingestor.add('minty', _data(), ts=1600000060)
+    assert ingestor.flush() == 1
+    assert ingestor.flush() == 0
+
+    counters, histograms = sink.snapshot()
+    assert counters[('plantbot_ingest_rows_total', ())] == 3
+    assert histograms[('plantbot_ingest_flush_seconds', ())][0] == 2
+    assert ('plantbot_ingest_flush_failures_total', ()) not in counters
+    assert 'plantbot_ingest_flush_seconds_bucket' in sink.render()
+
+
+def test_failed_flushes_are_exported(workdir, sink):
+    ingestor = FailingIngestor(journal_path='./data/journal.jsonl')
+    ingestor.add('minty', _data(), ts=1600000000)
+    assert ingestor.flush() == 0
+    assert ingestor.flush() == 0
+
+    counters, histograms = sink.snapshot()
+    assert counters[('plantbot_ingest_flush_failures_total', ())] == 2
+    assert ('plantbot_ingest_flush_seconds', ()) not in histograms
+
+    # the buffered reading is committed once the DB is back
+    ingestor.fail = False
+    assert ingestor.flush() == 1
+    assert set(latest_data_all()) == {'minty'}
+    counters, _ = sink.snapshot()
+    assert counters[('plantbot_ingest_rows_total', ())] == 1
@@ -0,0 +1,86 @@
+import json
+import os
+import time
+from datetime import datetime as dt
+from datetime import timedelta
+
+import pytest
+
+import inky_alert
+import registry
+from constants import REFRESH_MAX_AGE, REFRESH_MOISTURE_DELTA, REFRESH_TEMPERATURE_DELTA
+from db import insert_many
+from inky_alert import _frame_state, _needs_refresh, inky_update
+from layout import get_layout
+from registry import Plant
+
+ASSETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+HEADER = dt(2020, 5, 1, 12, 0)
+
+
+def _state(minutes=0, **values):
+    plant = {'moisture': 40, 'thirsty': False, 'temperature': 21, 'sun': 20}
+    plant.update(values)
+    return {'header': HEADER + timedelta(minutes=minutes), 'plants': {'minty': plant}}
+
+
+def _data(moisture=40, temperature=21.5, light=1200):
+    return {'temperature': temperature, 'moisture': moisture, 'light': light, 'conductivity': 450, 'battery': 87}
+
+
+def test_first_frame_is_shown():
+    assert _needs_refresh(None, _state())
+    assert _needs_refresh({'header': HEADER, 'plants': {}}, _state())
+
+
+def test_small_changes_are_skipped():
+    assert not _needs_refresh(_state(), _state(minutes=REFRESH_MAX_AGE - 1))
+    assert not _needs_refresh(_state(), _state(moisture=40 + REFRESH_MOISTURE_DELTA - 1,
+                                               temperature=21 - REFRESH_TEMPERATURE_DELTA + 1))
+    assert _needs_refresh(_state(), _state(moisture=40 - REFRESH_MOISTURE_DELTA))
+    assert _needs_refresh(_state(), _state(temperature=21 + REFRESH_TEMPERATURE_DELTA))
+
+
+def test_icon_changes_are_shown():
+    assert _needs_refresh(_state(), _state(thirsty=True))
+    assert _needs_refresh(_state(), _state(sun=None))
+
+
+def test_old_frames_are_refreshed():
+    assert _needs_refresh(_state(), _state(minutes=REFRESH_MAX_AGE))
+
+
+def test_frame_state_of_the_displayed_values():
+    plants = [Plant('minty', 'FA:CE:00:00:00:01', 30), Plant('oregano', 'FA:CE:00:00:00:02', 20)]
+    layout = get_layout(400, 300, len(plants))
+    state = _frame_state(plants, {'minty': [_data(moisture=29.6, temperature=21.9, light=5)]}, layout)
+    assert state['plants'] == {'minty': {'moisture': 29, 'thirsty': True, 'temperature': 21, 'sun': None}}
+
+
+@pytest.fixture
+def display(workdir, monkeypatch):
+    os.symlink(ASSETS, 'assets')
+    with open('./data/plant_def.json', 'w') as dst:
+        json.dump({'plants': [{'name': 'minty', 'mac_address': 'FA:CE:00:00:00:01', 'min_moisture': 30}]}, dst)
+    monkeypatch.setattr(registry, '_registry', None)
+    monkeypatch.setattr(inky_alert, 'frame_path', str(workdir / 'frames'))
+    monkeypatch.setattr(inky_alert, 'last_frame', None)
+    return workdir / 'frames'
+
+
+def test_frames_are_only_written_on_a_refresh(display):
+    now = int(time.time())
+    insert_many([('minty', now - 60, _data())])
+    inky_update()
+    assert len(os.listdir(display)) == 1
+
+    # new reading, same displayed values
+    insert_many([('minty', now - 30, _data(moisture=40.4))])
+    inky_update()
+    assert len(os.listdir(display)) == 1
+
+    # frames are named by the second
+    time.sleep(1.1)
+    insert_many([('minty', now, _data(moisture=20))])
+    inky_update()
+    assert len(os.listdir(display)) == 2
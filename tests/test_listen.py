@@ -0,0 +1,28 @@
+import aiohttp
+import pytest
+
+import slackbot_listen
+
+
+class Stop(BaseException):
+    pass
+
+
+def test_listener_reconnects_after_any_failure(monkeypatch):
+    failures = [ValueError('malformed event'), KeyError('url'), aiohttp.ClientError('connection reset'), Stop()]
+
+    class FakeListener(object):
+        runs = 0
+
+        def __init__(self, dispatcher, sync=True):
+            pass
+
+        async def run(self):
+            FakeListener.runs += 1
+            raise failures.pop(0)
+
+    monkeypatch.setattr(slackbot_listen, 'Listener', FakeListener)
+    monkeypatch.setattr(slackbot_listen, 'RECONNECT_DELAY', 0)
+    with pytest.raises(Stop):
+        slackbot_listen.listen_forever()
+    assert FakeListener.runs == 4
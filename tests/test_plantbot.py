@@ -0,0 +1,25 @@
+import threading
+import time
+
+from constants import RAW_RETENTION
+from db import DAY, insert_many, latest_data
+from plantbot import build
+
+
+def test_collector_node_runs_the_retention(workdir, monkeypatch):
+    monkeypatch.setenv('PLANTBOT_COLLECTOR_PORT', '0')
+    insert_many([('minty', int(time.time()) - RAW_RETENTION - 2 * DAY, {
+        'temperature': 21.5, 'moisture': 40, 'light': 1200, 'conductivity': 450, 'battery': 87})])
+
+    scheduler = build(['collector'])
+    thread = threading.Thread(target=scheduler.start, daemon=True)
+    thread.start()
+    try:
+        deadline = time.monotonic() + 10
+        while latest_data('minty') and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert [job.id for job in scheduler.get_jobs() if job.id == 'retention'] == ['retention']
+        assert latest_data('minty') == []
+    finally:
+        scheduler.shutdown()
+        thread.join()
@@ -0,0 +1,107 @@
+import multiprocessing
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+import polling
+from polling import FakeBackend, FakeReader, MiFloraReader, SensorError, poll_sensors
+from registry import Plant
+
+TTL = 3600
+PLANTS = [Plant('plant_{}'.format(ii), 'FA:CE:00:00:00:{:02X}'.format(ii), 20) for ii in range(3)]
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """
+    Fake Mi Flora backend with fresh counters, fresh metrics and a settable wall clock of `MiFloraReader`.
+
+    """
+    clock = SimpleNamespace(now=1600000000)
+    monkeypatch.setattr(polling, 'time', SimpleNamespace(time=lambda: clock.now, monotonic=time.monotonic,
+                                                         sleep=time.sleep))
+    monkeypatch.setattr(FakeBackend, 'dead', set())
+    monkeypatch.setattr(metrics, '_metrics', metrics.Metrics(process='test'))
+    FakeBackend.reset()
+    yield clock
+    FakeBackend.reset()
+
+
+def _ble_connections():
+    counters, _ = metrics.get_metrics().snapshot()
+    return counters.get(('plantbot_ble_connections_total', ()), 0)
+
+
+def test_one_connection_per_read(backend):
+    reader = MiFloraReader(backend=FakeBackend, ttl=TTL)
+    for sweep in range(1, 4):
+        readings, _, errors = poll_sensors(PLANTS, reader=reader, processes=False)
+        assert not errors
+        assert [r.connections for r in readings.values()] == [1] * len(PLANTS)
+        assert FakeBackend.connections == sweep * len(PLANTS)
+        assert _ble_connections() == sweep * len(PLANTS)
+
+
+def test_device_info_is_read_after_the_ttl_only(backend):
+    reader = MiFloraReader(backend=FakeBackend, ttl=TTL)
+    poll_sensors(PLANTS, reader=reader, processes=False)
+    # battery/firmware + sensor data
+    assert FakeBackend.reads == 2 * len(PLANTS)
+
+    FakeBackend.reset()
+    backend.now += TTL - 1
+    readings, _, _ = poll_sensors(PLANTS, reader=reader, processes=False)
+    assert FakeBackend.reads == len(PLANTS)
+    assert {r.firmware for r in readings.values()} == {FakeBackend.firmware}
+
+    FakeBackend.reset()
+    backend.now += 1
+    poll_sensors(PLANTS, reader=reader, processes=False)
+    assert FakeBackend.reads == 2 * len(PLANTS)
+
+
+def test_failed_connections_are_counted(backend):
+    FakeBackend.dead.add(PLANTS[0].mac_address)
+    reader = MiFloraReader(backend=FakeBackend, ttl=TTL)
+    with pytest.raises(SensorError) as e:
+        reader(PLANTS[0].mac_address)
+    assert e.value.connections == 1
+
+    readings, _, errors = poll_sensors(PLANTS, reader=reader, processes=False)
+    assert list(errors) == [PLANTS[0].name]
+    assert len(readings) == len(PLANTS) - 1
+    assert FakeBackend.connections == 1 + len(PLANTS)
+    assert _ble_connections() == len(PLANTS)
+
+
+def test_hanging_worker_processes_are_terminated(monkeypatch):
+    monkeypatch.setattr(metrics, '_metrics', metrics.Metrics(process='test'))
+    hung, dead = PLANTS[0], PLANTS[1]
+    reader = FakeReader(latency=(0, 0), hang=[hung.mac_address], dead=[dead.mac_address])
+
+    start = time.monotonic()
+    readings, timings, errors = poll_sensors(PLANTS, reader=reader, workers=len(PLANTS), timeout=2)
+    assert time.monotonic() - start < 10
+    assert errors[hung.name] == 'timeout after 2s'
+    assert errors[dead.name].startswith('BlueToothBackendException')
+    assert list(readings) == [PLANTS[2].name]
+    assert timings[hung.name] is None and timings[PLANTS[2].name] is not None
+    assert not multiprocessing.active_children()
+
+    counters, _ = metrics.get_metrics().snapshot()
+    assert counters[('plantbot_sensor_reads_total', (('plant', hung.name), ('result', 'timeout')))] == 1
+
+
+def test_late_results_of_abandoned_reads_are_ignored():
+    slow = {PLANTS[0].mac_address: 1.5, PLANTS[1].mac_address: 1.0}
+
+    def reader(mac_address):
+        # the abandoned first read answers while the second one is running
+        time.sleep(slow.get(mac_address, 0))
+        return FakeReader(latency=(0, 0))(mac_address)
+
+    readings, _, errors = poll_sensors(PLANTS[:2], reader=reader, workers=1, timeout=1.2, processes=False)
+    assert list(errors) == [PLANTS[0].name]
+    assert list(readings) == [PLANTS[1].name]
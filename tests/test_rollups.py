@@ -0,0 +1,55 @@
+import os
+import time
+from datetime import datetime as dt
+
+import pytest
+
+from db import DAY, HOUR, _bucket, get_db, history_data, insert_many, rebuild_rollups
+
+
+@pytest.fixture
+def local_tz():
+    # restored by hand, `monkeypatch.undo()` would also undo the patches of `workdir`
+    old = os.environ.get('TZ')
+    os.environ['TZ'] = 'America/New_York'
+    time.tzset()
+    yield
+    if old is None:
+        os.environ.pop('TZ', None)
+    else:
+        os.environ['TZ'] = old
+    time.tzset()
+
+
+def _data():
+    return {'temperature': 21.5, 'moisture': 40, 'light': 1200, 'conductivity': 450, 'battery': 87}
+
+
+def test_daily_buckets_are_local_days(local_tz):
+    # DST change (23 hour day), hourly buckets stay aligned to UTC
+    start, end = _bucket(int(dt(2020, 3, 8, 12).timestamp()), DAY)
+    assert dt.fromtimestamp(start) == dt(2020, 3, 8)
+    assert end - start == 23 * HOUR
+    assert _bucket(3 * HOUR + 123, HOUR) == (3 * HOUR, 4 * HOUR)
+
+
+def test_daily_rollups_of_local_days(workdir, local_tz):
+    today = _bucket(int(time.time()), DAY)[0]
+    first = _bucket(today - 3 * HOUR - 2 * DAY, DAY)[0]
+    insert_many([('minty', ts, _data()) for ts in range(first, today, 30 * 60)])
+    # half-hourly readings (46 or 50 on a DST change)
+    expected = []
+    for day in range(3):
+        start, end = _bucket(first + day * DAY + 12 * HOUR, DAY)
+        expected.append((start, (end - start) // (30 * 60)))
+
+    def daily():
+        resolution, out = history_data('minty', first, today, points=5)
+        assert resolution == 'daily'
+        assert all(dt.fromtimestamp(r['ts']).hour == 0 for r in out)
+        return [(r['ts'], r['n']) for r in out]
+
+    assert daily() == expected
+    with get_db().transaction() as conn:
+        rebuild_rollups(conn)
+    assert daily() == expected
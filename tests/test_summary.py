@@ -0,0 +1,32 @@
+import time
+
+from constants import FLUSH_INTERVAL
+from db import HOUR, insert_many
+from summary import SummaryCache
+
+
+def _data(moisture=40):
+    return {'temperature': 21.5, 'moisture': moisture, 'light': 1200, 'conductivity': 450, 'battery': 87}
+
+
+def test_late_commits_are_synced(workdir):
+    now = int(time.time())
+    insert_many([('minty', ts, _data()) for ts in range(now - 3 * HOUR, now, 10 * 60)])
+    cache = SummaryCache()
+    cache.sync(now)
+    assert len(cache.history('minty', 3 * HOUR)) == 18
+
+    # committed after the sync, but measured long before it (e.g. an edge node catching up after an outage)
+    late = now - 2 * HOUR - 5 * 60
+    assert late < now - FLUSH_INTERVAL
+    insert_many([('minty', late, _data(12)), ('oregano', late, _data(30))])
+    cache.sync(now + 60)
+    assert [r['moisture'] for r in cache.history('minty', 3 * HOUR) if r['ts'] == late] == [12]
+    assert cache.latest(['oregano'])['oregano']['ts'] == late
+
+    # nothing new committed (duplicates are not logged)
+    insert_many([('minty', late, _data(12))])
+    readings = cache.stats['readings']
+    cache.sync(now + 120)
+    assert cache.stats['readings'] == readings
+    assert len(cache.history('minty', 3 * HOUR)) == 19